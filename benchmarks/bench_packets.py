@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the new BSD License.
+#
+# Copyright (c) 2013 Sebastian Staudt
+
+"""Microbenchmarks for parsing server replies
+
+Prints the number of packets per second SteamPacketFactory decodes for
+every reply type. Run with `PYTHONPATH=. python benchmarks/bench_packets.py`
+from the top-level directory.
+"""
+
+import sys
+import timeit
+
+from steamcondenser.packets import SplitPacketAssembler, SteamPacketFactory
+from steamcondenser.testing import FakeGameServer, split_packet
+
+
+def packets_per_second(function, number):
+    """Return how many times per second function can be called"""
+    best = min(timeit.repeat(function, repeat=3, number=number))
+    return number / best
+
+
+def main(number=20000):
+    server = FakeGameServer(
+        name='Benchmark Server', tags='alltalk,increased_maxplayers',
+        players=[('Player %d' % i, i, 60.0 * i) for i in range(32)],
+        rules=dict(('rule_%d' % i, str(i)) for i in range(60)))
+    try:
+        replies = [
+            ('S2C_CHALLENGE', server._challenge()[4:]),
+            ('S2A_INFO2', server.info_data()[4:]),
+            ('S2A_PLAYER (32 players)', server.player_data()[4:]),
+            ('S2A_RULES (60 rules)', server.rules_data()[4:]),
+        ]
+        rules = server.rules_data()
+    finally:
+        server._socket.close()
+
+    for name, data in replies:
+        rate = packets_per_second(
+            lambda: SteamPacketFactory.packet_from_data(data), number)
+        print '%-32s %12.0f packets/s' % (name, rate)
+
+    for compress in (False, True):
+        fragments = split_packet(rules, 1, 128, compress)
+        assembler = SplitPacketAssembler()
+
+        def reassemble():
+            for fragment in fragments:
+                assembler.add(fragment)
+
+        rate = packets_per_second(reassemble, number // 10) * len(fragments)
+        name = 'split %s(%d fragments)' % (compress and 'bzip2 ' or '',
+                                           len(fragments))
+        print '%-32s %12.0f packets/s' % (name, rate)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the new BSD License.
+#
+# Copyright (c) 2013 Sebastian Staudt
+
+
+from __future__ import absolute_import
+
+import threading
+import time
+
+
+class LRUCache(object):
+    """A thread-safe mapping with a bounded size
+
+    If the cache is full, the least recently used entry is evicted when a new
+    entry is added. Entries are kept in a circular doubly linked list, so
+    lookups, insertions and evictions all take constant time.
+
+    If a time-to-live is given, entries expire that many seconds after they
+    have been stored. Expired entries are treated as missing and removed
+    when they are looked up.
+
+    Attributes:
+        hits: The integer number of lookups that found a valid entry
+        max_size: The integer maximum number of entries in this cache
+        misses: The integer number of lookups that found no valid entry
+        ttl: The float number of seconds entries are valid or None
+    """
+
+    _PREV, _NEXT, _KEY, _VALUE, _EXPIRES = 0, 1, 2, 3, 4
+
+    def __init__(self, max_size, ttl=None):
+        """Create a new, empty LRUCache
+
+        Parameters:
+            max_size: The integer maximum number of entries
+            ttl: The float number of seconds entries are valid (optional)
+        """
+        if max_size < 1:
+            raise ValueError('max_size must be at least 1')
+        self.hits = 0
+        self.max_size = max_size
+        self.misses = 0
+        self.ttl = ttl
+        self._links = {}
+        self._lock = threading.RLock()
+        self._root = []
+        self._root[:] = [self._root, self._root, None, None, None]
+
+    def __contains__(self, key):
+        link = self._links.get(key)
+        return link is not None and not self._expired(link)
+
+    def __delitem__(self, key):
+        with self._lock:
+            link = self._links.pop(key)
+            self._unlink(link)
+
+    def __getitem__(self, key):
+        with self._lock:
+            link = self._links.get(key)
+            if link is None:
+                self.misses += 1
+                raise KeyError(key)
+            self._unlink(link)
+            if self._expired(link):
+                del self._links[key]
+                self.misses += 1
+                raise KeyError(key)
+            self._append(link)
+            self.hits += 1
+            return link[self._VALUE]
+
+    def __len__(self):
+        return len(self._links)
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            if self.ttl is None:
+                expires = None
+            else:
+                expires = time.time() + self.ttl
+            link = self._links.get(key)
+            if link is not None:
+                link[self._VALUE] = value
+                link[self._EXPIRES] = expires
+                self._unlink(link)
+                self._append(link)
+                return
+            while len(self._links) >= self.max_size:
+                self._evict()
+            link = [None, None, key, value, expires]
+            self._links[key] = link
+            self._append(link)
+
+    def _append(self, link):
+        """Insert a link as the most recently used entry"""
+        last = self._root[self._PREV]
+        link[self._PREV] = last
+        link[self._NEXT] = self._root
+        last[self._NEXT] = link
+        self._root[self._PREV] = link
+
+    def _evict(self):
+        """Remove the least recently used entry"""
+        oldest = self._root[self._NEXT]
+        self._unlink(oldest)
+        del self._links[oldest[self._KEY]]
+
+    def _expired(self, link):
+        """Return whether the entry of a link has expired"""
+        expires = link[self._EXPIRES]
+        return expires is not None and expires <= time.time()
+
+    def _unlink(self, link):
+        """Remove a link from the usage order"""
+        link[self._PREV][self._NEXT] = link[self._NEXT]
+        link[self._NEXT][self._PREV] = link[self._PREV]
+
+    def clear(self):
+        """Remove all entries from this cache"""
+        with self._lock:
+            self._links.clear()
+            self._root[:] = [self._root, self._root, None, None, None]
+
+    def get(self, key, default=None):
+        """Return the value for key if it is cached, otherwise default"""
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def hit_rate(self):
+        """Return the fraction of lookups that found a valid entry
+
+        Returns:
+            A float between 0 and 1 or None if there were no lookups yet
+        """
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return None
+        return self.hits / float(lookups)
+
+    def keys(self):
+        """Return a list of the cached keys, least recently used first"""
+        with self._lock:
+            keys = []
+            link = self._root[self._NEXT]
+            while link is not self._root:
+                keys.append(link[self._KEY])
+                link = link[self._NEXT]
+            return keys
+
+    def pop(self, key, default=None):
+        """Remove the entry for key and return its value or default"""
+        with self._lock:
+            link = self._links.pop(key, None)
+            if link is None:
+                return default
+            self._unlink(link)
+            if self._expired(link):
+                return default
+            return link[self._VALUE]
+
+    def resize(self, max_size):
+        """Change the maximum number of entries
+
+        If the cache holds more entries, the least recently used ones are
+        evicted.
+
+        Parameters:
+            max_size: The integer maximum number of entries
+        """
+        if max_size < 1:
+            raise ValueError('max_size must be at least 1')
+        with self._lock:
+            self.max_size = max_size
+            while len(self._links) > max_size:
+                self._evict()
+
+    def setdefault(self, key, value):
+        """Return the value for key, caching value first if key is missing"""
+        with self._lock:
+            try:
+                return self[key]
+            except KeyError:
+                self[key] = value
+                return value
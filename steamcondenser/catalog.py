@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the new BSD License.
+#
+# Copyright (c) 2013 Sebastian Staudt
+
+
+from __future__ import absolute_import
+
+import threading
+
+
+def _bucket(count):
+    """Return the index of the power-of-two bucket of a count
+
+    Bucket 0 contains only 0, bucket n contains 2^(n-1) to 2^n - 1.
+    """
+    if count <= 0:
+        return 0
+    return len(bin(count)) - 2
+
+
+class ServerCatalog(object):
+    """Class to keep the information of many game servers searchable
+
+    The catalog stores the server information of scan results by address and
+    maintains secondary indexes on the map, game directory, tags, secure
+    flag, player count, maximum number of players and whether the server is
+    full. The indexes are updated incrementally whenever the information of
+    a server changes.
+
+    Queries intersect the sets of matching addresses from the indexes,
+    smallest first, and only check the remaining conditions for the servers
+    left over, so a query only looks at the servers matching its most
+    selective criterion. Player counts are indexed in power-of-two buckets,
+    the exact bounds are checked for the candidates. Minimums of 0 or less
+    match every server and are ignored, a query without criteria returns
+    all servers.
+    """
+
+    _MAX_BUCKET = _bucket(255)
+
+    def __init__(self):
+        """Create a new, empty ServerCatalog"""
+        self._indexes = {}
+        self._lock = threading.RLock()
+        self._servers = {}
+
+    def __contains__(self, address):
+        return address in self._servers
+
+    def __getitem__(self, address):
+        return self._servers[address]
+
+    def __len__(self):
+        return len(self._servers)
+
+    def addresses(self):
+        """Return a list of the addresses of all servers in this catalog"""
+        return self._servers.keys()
+
+    def find(self, map_name=None, game_directory=None, tags=(), secure=None,
+             min_players=None, max_players=None, min_slots=None,
+             not_full=False):
+        """Find all servers matching the given criteria
+
+        Parameters:
+            map_name: The string name of the map
+            game_directory: The string game directory
+            tags: A sequence of string tags all servers must have
+            secure: Whether the servers must be VAC secured or not
+            min_players: The integer minimum number of players, 1 finds all
+                non-empty servers
+            max_players: The integer maximum number of players, 0 finds all
+                empty servers
+            min_slots: The integer minimum maximum number of players
+            not_full: Whether full servers should be excluded
+
+        Returns:
+            A list of the addresses of all matching servers
+        """
+        if min_players is not None and min_players <= 0:
+            min_players = None
+        if min_slots is not None and min_slots <= 0:
+            min_slots = None
+        with self._lock:
+            sets = []
+            if map_name is not None:
+                sets.append(self._lookup('map', map_name))
+            if game_directory is not None:
+                sets.append(self._lookup('gamedir', game_directory))
+            if secure is not None:
+                sets.append(self._lookup('secure', bool(secure)))
+            for tag in tags:
+                sets.append(self._lookup('tag', tag))
+
+            if sets:
+                sets.sort(key=len)
+                if not sets[0]:
+                    return []
+                candidates = sets[0].intersection(*sets[1:])
+            elif min_players is not None or max_players is not None:
+                candidates = self._range('players', min_players, max_players)
+            elif min_slots is not None:
+                candidates = self._range('slots', min_slots, None)
+            elif not_full:
+                candidates = self._lookup('full', False)
+            else:
+                candidates = self._servers
+
+            if min_players is None and max_players is None and \
+                    min_slots is None and not not_full:
+                return list(candidates)
+
+            if min_players is None:
+                min_players = 0
+            if max_players is None:
+                max_players = float('inf')
+            if min_slots is None:
+                min_slots = 0
+            servers = self._servers
+            matches = []
+            for address in candidates:
+                info = servers[address]
+                players = info.number_of_players
+                if min_players <= players <= max_players and \
+                        info.max_players >= min_slots and \
+                        not (not_full and players >= info.max_players):
+                    matches.append(address)
+            return matches
+
+    def ingest(self, results):
+        """Update this catalog from the results of a ServerScanner
+
+        Servers that could not be scanned are removed from the catalog,
+        results without server information are ignored.
+
+        Parameters:
+            results: An iterable of ScanResults
+        """
+        for result in results:
+            if result.error is not None:
+                self.remove(result.address)
+            elif result.info is not None:
+                self.update(result.address, result.info)
+
+    def remove(self, address):
+        """Remove a server from this catalog
+
+        Parameters:
+            address: The address of the server
+        """
+        with self._lock:
+            info = self._servers.pop(address, None)
+            if info is not None:
+                for key in self._keys(info):
+                    self._unindex(key, address)
+
+    def update(self, address, info):
+        """Add or update the information of a server
+
+        Only the index entries that have changed are touched.
+
+        Parameters:
+            address: The address of the server
+            info: The SourceServerInfo or GoldSrcServerInfo of the server
+        """
+        with self._lock:
+            old_info = self._servers.get(address)
+            self._servers[address] = info
+            new_keys = self._keys(info)
+            if old_info is None:
+                old_keys = set()
+            else:
+                old_keys = self._keys(old_info)
+            for key in old_keys - new_keys:
+                self._unindex(key, address)
+            for key in new_keys - old_keys:
+                self._indexes.setdefault(key, set()).add(address)
+
+    @staticmethod
+    def _keys(info):
+        """Return the set of index keys for the information of a server"""
+        keys = set([
+            ('full', info.number_of_players >= info.max_players),
+            ('map', info.map_name),
+            ('gamedir', info.game_directory),
+            ('players', _bucket(info.number_of_players)),
+            ('secure', bool(info.secure)),
+            ('slots', _bucket(info.max_players)),
+        ])
+        server_tags = getattr(info, 'server_tags', None)
+        if server_tags:
+            for tag in server_tags.split(','):
+                tag = tag.strip()
+                if tag:
+                    keys.add(('tag', tag))
+        return keys
+
+    def _lookup(self, index, value):
+        """Return the set of addresses for a single index key"""
+        return self._indexes.get((index, value), set())
+
+    def _range(self, index, minimum, maximum):
+        """Return the union of the buckets overlapping a range of counts"""
+        if minimum is None:
+            first = 0
+        else:
+            first = _bucket(minimum)
+        if maximum is None:
+            last = self._MAX_BUCKET
+        else:
+            last = min(_bucket(maximum), self._MAX_BUCKET)
+        candidates = set()
+        for bucket in xrange(first, last + 1):
+            candidates.update(self._lookup(index, bucket))
+        return candidates
+
+    def _unindex(self, key, address):
+        """Remove an address from the set of an index key"""
+        addresses = self._indexes[key]
+        addresses.discard(address)
+        if not addresses:
+            del self._indexes[key]
@@ -9,7 +9,10 @@
 from __future__ import absolute_import
 
 # Match namespacing from the other steam-condenser implementations
+from .cohort import *
 from .errors import *
 from .game import *
+from .polling import *
 from .steam import *
+from .updates import *
 from .webapi import *
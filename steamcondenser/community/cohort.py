@@ -0,0 +1,399 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the new BSD License.
+#
+# Copyright (c) 2013 Sebastian Staudt
+
+
+from __future__ import absolute_import, division
+
+import heapq
+import json
+from array import array
+from itertools import izip
+from multiprocessing.pool import ThreadPool
+
+from ..errors import SteamCondenserError
+from .webapi import WebApi
+
+
+class OwnedGamesCohort(object):
+    """Class to load the owned games and playtimes of many users at once
+
+    Instead of creating a dict of SteamGames for every user, the playtimes of
+    all users are stored in a columnar table made of parallel arrays. Every
+    row contains the index of a user, an application ID and the playtimes of
+    that user for the game. The rows of a single user are always stored
+    contiguously.
+
+    Attributes:
+        app_ids: An array of the integer application IDs of all rows
+        errors: A dict mapping the integer Steam ID64s of users whose games
+            could not be loaded to the corresponding SteamCondenserError
+        recent_playtimes: An array of the integer number of minutes played in
+            the last two weeks for all rows
+        steam_id64s: A list of the integer Steam ID64s of all loaded users,
+            the position of a Steam ID64 is its user index
+        total_playtimes: An array of the integer total number of minutes
+            played for all rows
+        user_indexes: An array of the integer user indexes of all rows
+    """
+
+    def __init__(self):
+        """Create a new, empty OwnedGamesCohort"""
+        self.app_ids = array('I')
+        self.errors = {}
+        self.recent_playtimes = array('I')
+        self.steam_id64s = []
+        self.total_playtimes = array('I')
+        self.user_indexes = array('I')
+        self._user_rows = {}
+
+    def __len__(self):
+        return len(self.app_ids)
+
+    def load(self, steam_id64s, threads=8):
+        """Load the owned games of the specified users
+
+        The `GetOwnedGames` requests are run concurrently and every response
+        is added to the table as soon as it arrives. Users that are already
+        part of this cohort are skipped.
+
+        Parameters:
+            steam_id64s: An iterable of integer Steam ID64s
+            threads: The integer number of concurrent Web API requests
+
+        Returns:
+            The integer number of users that have been loaded successfully
+        """
+        steam_id64s = set(steam_id64s).difference(self._user_rows)
+        pool = ThreadPool(threads)
+        try:
+            loaded = 0
+            for steam_id64, games in pool.imap_unordered(self._fetch,
+                                                         steam_id64s):
+                if isinstance(games, SteamCondenserError):
+                    self.errors[steam_id64] = games
+                else:
+                    self.errors.pop(steam_id64, None)
+                    self._add_user(steam_id64, games)
+                    loaded += 1
+            return loaded
+        finally:
+            pool.close()
+            pool.join()
+
+    @classmethod
+    def _fetch(cls, steam_id64):
+        """Fetch the owned games of a single user
+
+        Returns:
+            A 2-tuple containing the Steam ID64 and either a list of 3-tuples
+            of the form (int, int, int) containing the application ID, the
+            recent and the total playtime of each game or the
+            SteamCondenserError raised by the request
+        """
+        try:
+            data = WebApi.json('IPlayerService', 'GetOwnedGames', 1,
+                               include_played_free_games=1,
+                               steamid=steam_id64)
+            games = json.loads(data)['response'].get('games', [])
+        except SteamCondenserError, e:
+            return steam_id64, e
+        return steam_id64, [(game['appid'], game.get('playtime_2weeks', 0),
+                             game.get('playtime_forever', 0))
+                            for game in games]
+
+    def _add_user(self, steam_id64, games):
+        """Append the rows for a single user to the table"""
+        user_index = len(self.steam_id64s)
+        self.steam_id64s.append(steam_id64)
+        start = len(self.app_ids)
+        for app_id, recent_playtime, total_playtime in games:
+            self.user_indexes.append(user_index)
+            self.app_ids.append(app_id)
+            self.recent_playtimes.append(recent_playtime)
+            self.total_playtimes.append(total_playtime)
+        self._user_rows[steam_id64] = (start, len(self.app_ids))
+
+    def _playtimes(self, recent):
+        if recent:
+            return self.recent_playtimes
+        else:
+            return self.total_playtimes
+
+    def owners_per_app(self):
+        """Return the number of users in this cohort owning each game
+
+        Returns:
+            A dict mapping integer application IDs to the integer number of
+            owners
+        """
+        owners = {}
+        for app_id in self.app_ids:
+            owners[app_id] = owners.get(app_id, 0) + 1
+        return owners
+
+    def playtime_per_app(self, recent=False):
+        """Return the summed up playtime of all users for each game
+
+        Parameters:
+            recent: If True, only the playtime of the last two weeks is used
+
+        Returns:
+            A dict mapping integer application IDs to the integer number of
+            minutes all users of this cohort played the game
+        """
+        totals = {}
+        for app_id, playtime in izip(self.app_ids, self._playtimes(recent)):
+            if playtime:
+                totals[app_id] = totals.get(app_id, 0) + playtime
+        return totals
+
+    def hours_per_app(self, recent=False):
+        """Return the summed up playtime in hours of all users for each game
+
+        Parameters:
+            recent: If True, only the playtime of the last two weeks is used
+
+        Returns:
+            A dict mapping integer application IDs to the float number of
+            hours all users of this cohort played the game
+        """
+        totals = self.playtime_per_app(recent)
+        for app_id in totals:
+            totals[app_id] /= 60
+        return totals
+
+    def top_apps(self, steam_id64, count=5, recent=False):
+        """Return the most played games of a single user
+
+        Parameters:
+            steam_id64: The integer Steam ID64 of the user
+            count: The integer maximum number of games to return
+            recent: If True, only the playtime of the last two weeks is used
+
+        Returns:
+            A list of 2-tuples of the form (int, int) containing the
+            application ID and the number of minutes played, most played game
+            first
+
+        Raises:
+            SteamCondenserError: The user is not part of this cohort
+        """
+        try:
+            start, end = self._user_rows[steam_id64]
+        except KeyError:
+            raise SteamCondenserError('%d is not part of this cohort'
+                                      % steam_id64)
+        rows = izip(self.app_ids[start:end],
+                    self._playtimes(recent)[start:end])
+        return heapq.nlargest(count, rows, key=lambda row: row[1])
+
+    def top_apps_per_user(self, count=5, recent=False):
+        """Return the most played games of every user of this cohort
+
+        Parameters:
+            count: The integer maximum number of games to return per user
+            recent: If True, only the playtime of the last two weeks is used
+
+        Returns:
+            A dict mapping the integer Steam ID64s to lists as returned by
+            top_apps()
+        """
+        top_apps = {}
+        for steam_id64 in self.steam_id64s:
+            top_apps[steam_id64] = self.top_apps(steam_id64, count, recent)
+        return top_apps
+
+
+class AchievementCohort(object):
+    """Class to load the achievements of many users for many games at once
+
+    The achievements are loaded concurrently from the Web API's
+    `GetPlayerAchievements` method. Every achievement of a game is assigned a
+    fixed bit position, so the achievements of a user for a game are stored
+    as an integer bitset of unlocked achievements together with an array of
+    unlock timestamps in bit order.
+
+    Attributes:
+        errors: A dict mapping (steam_id64, app_id) pairs that could not be
+            loaded to the corresponding SteamCondenserError
+        stats: A dict mapping (steam_id64, app_id) pairs to dicts of the
+            user's statistics for the game, only filled if requested
+        unlock_times: A dict mapping (steam_id64, app_id) pairs to arrays
+            containing the integer UNIX timestamps of the unlocks in bit
+            order, 0 for locked achievements
+        unlocked: A dict mapping (steam_id64, app_id) pairs to the integer
+            bitsets of unlocked achievements
+    """
+
+    def __init__(self):
+        """Create a new, empty AchievementCohort"""
+        self.errors = {}
+        self.stats = {}
+        self.unlock_times = {}
+        self.unlocked = {}
+        self._achievement_names = {}
+        self._bits = {}
+
+    def __len__(self):
+        return len(self.unlocked)
+
+    def achievement_names(self, app_id):
+        """Return a list of the API names of a game's achievements in bit
+        order
+        """
+        return self._achievement_names.get(app_id, [])
+
+    def bit(self, app_id, api_name):
+        """Return the bit position of the specified achievement"""
+        return self._bits[app_id][api_name]
+
+    def load(self, pairs, threads=8, include_stats=False):
+        """Load the achievements for the specified users and games
+
+        Parameters:
+            pairs: An iterable of (steam_id64, app_id) pairs
+            threads: The integer number of concurrent Web API requests
+            include_stats: If True, the statistics of the users are loaded
+                from `GetUserStatsForGame` as well
+
+        Returns:
+            The integer number of pairs that have been loaded successfully
+        """
+        pairs = set(pairs).difference(self.unlocked)
+        if include_stats:
+            fetch = self._fetch_with_stats
+        else:
+            fetch = self._fetch
+        pool = ThreadPool(threads)
+        try:
+            loaded = 0
+            for pair, achievements, stats in pool.imap_unordered(fetch,
+                                                                 pairs):
+                if isinstance(achievements, SteamCondenserError):
+                    self.errors[pair] = achievements
+                    continue
+                self._add(pair, achievements)
+                if stats is not None:
+                    self.stats[pair] = stats
+                self.errors.pop(pair, None)
+                loaded += 1
+            return loaded
+        finally:
+            pool.close()
+            pool.join()
+
+    @classmethod
+    def _fetch(cls, pair):
+        """Fetch the achievements of a single user for a single game
+
+        Returns:
+            A 3-tuple containing the pair, either a list of the achievements
+            or the SteamCondenserError raised and None
+        """
+        steam_id64, app_id = pair
+        try:
+            data = WebApi.json('ISteamUserStats', 'GetPlayerAchievements', 1,
+                               appid=app_id, steamid=steam_id64)
+            player_stats = json.loads(data)['playerstats']
+            if not player_stats.get('success', True):
+                raise SteamCondenserError(player_stats['error'])
+        except SteamCondenserError, e:
+            return pair, e, None
+        return pair, player_stats.get('achievements', []), None
+
+    @classmethod
+    def _fetch_with_stats(cls, pair):
+        """Fetch the achievements and statistics of a single user for a
+        single game
+        """
+        pair, achievements, stats = cls._fetch(pair)
+        if isinstance(achievements, SteamCondenserError):
+            return pair, achievements, None
+        steam_id64, app_id = pair
+        try:
+            data = WebApi.json('ISteamUserStats', 'GetUserStatsForGame', 2,
+                               appid=app_id, steamid=steam_id64)
+            player_stats = json.loads(data)['playerstats']
+        except SteamCondenserError, e:
+            return pair, e, None
+        stats = {}
+        for stat in player_stats.get('stats', []):
+            stats[stat['name']] = stat['value']
+        return pair, achievements, stats
+
+    def _add(self, pair, achievements):
+        """Store the achievements of a single user for a single game"""
+        app_id = pair[1]
+        bits = self._bits.setdefault(app_id, {})
+        names = self._achievement_names.setdefault(app_id, [])
+        unlocked = 0
+        unlock_times = {}
+        for achievement in achievements:
+            api_name = achievement['apiname']
+            if api_name not in bits:
+                bits[api_name] = len(names)
+                names.append(api_name)
+            if achievement['achieved']:
+                bit = bits[api_name]
+                unlocked |= 1 << bit
+                unlock_times[bit] = achievement.get('unlocktime', 0)
+        times = array('I', [0]) * len(names)
+        for bit, unlock_time in unlock_times.iteritems():
+            times[bit] = unlock_time
+        self.unlocked[pair] = unlocked
+        self.unlock_times[pair] = times
+
+    def completion(self, steam_id64, app_id):
+        """Return the fraction of a game's achievements a user has unlocked
+
+        Returns:
+            A float between 0 and 1
+        """
+        achievements = len(self.achievement_names(app_id))
+        if not achievements:
+            return 0.0
+        return bin(self.unlocked[(steam_id64, app_id)]).count('1') / \
+            achievements
+
+    def completion_rates(self, app_id):
+        """Return the fraction of this cohort's users that have unlocked each
+        achievement of a game
+
+        Returns:
+            A dict mapping the API names of the achievements to floats
+            between 0 and 1
+        """
+        names = self.achievement_names(app_id)
+        counts = [0] * len(names)
+        users = 0
+        for (steam_id64, pair_app_id), unlocked in self.unlocked.iteritems():
+            if pair_app_id != app_id:
+                continue
+            users += 1
+            bit = 0
+            while unlocked:
+                if unlocked & 1:
+                    counts[bit] += 1
+                unlocked >>= 1
+                bit += 1
+        rates = {}
+        for api_name, count in izip(names, counts):
+            if users:
+                rates[api_name] = count / users
+            else:
+                rates[api_name] = 0.0
+        return rates
+
+    def unlock_time(self, steam_id64, app_id, api_name):
+        """Return the integer UNIX timestamp at which a user unlocked an
+        achievement or 0 if it is locked
+        """
+        times = self.unlock_times[(steam_id64, app_id)]
+        bit = self.bit(app_id, api_name)
+        if bit < len(times):
+            return times[bit]
+        return 0
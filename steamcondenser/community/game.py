@@ -11,9 +11,14 @@ from __future__ import absolute_import, division
 import datetime
 import json
 import re
+import time
 import urllib2
 import xml.etree.ElementTree as ET
+from array import array
+from bisect import bisect_left, bisect_right
+from multiprocessing.pool import ThreadPool
 
+from ..cache import LRUCache
 from .errors import SteamCondenserError
 from .steam import SteamId, SteamGame
 from .webapi import WebApi
@@ -47,17 +52,18 @@ class GameAchievement(object):
             achievement_data: The XML ElementTree element containing the
                 XML data from the Steam API
         """
-        self.api_name = achievement_data.apiname.text
-        self.description = achievement_data.description.text
+        self.api_name = achievement_data.findtext('apiname')
+        self.description = achievement_data.findtext('description')
         self.game = game
-        self.icon_closed_url = achievement_data.iconClosed.text
-        self.icon_open_url = achievement_data.iconOpen.text
-        self.name = achievement_data.name.text
-        self.unlocked = bool(achievement_data.closed.text)
+        self.icon_closed_url = achievement_data.findtext('iconClosed')
+        self.icon_open_url = achievement_data.findtext('iconOpen')
+        self.name = achievement_data.findtext('name')
+        self.unlocked = achievement_data.get('closed') == '1'
         self.user = user
-        if self.unlocked and achievement_data.unlockTimestamp:
-            self.timestamp = datetime.utcfromtimestamp(
-                achievement_data.unlockTimestamp.text)
+        unlock_timestamp = achievement_data.findtext('unlockTimestamp')
+        if self.unlocked and unlock_timestamp:
+            self.timestamp = datetime.datetime.utcfromtimestamp(
+                int(unlock_timestamp))
         else:
             self.timestamp = None
 
@@ -66,6 +72,8 @@ class GameAchievement(object):
         """Return the global unlock percentages of all achievements for the
         specified game
 
+        The percentages are cached, see GameAchievementPercentages.
+
         Parameters:
             app_id: The Steam application ID of the game (e.g. `440` for
                 Team Fortress 2)
@@ -73,7 +81,73 @@ class GameAchievement(object):
         Returns:
             A list of 2-tuples of the form (str, float) containing the string
             achievement names and their corresponding unlock percentages
-            respectively
+            respectively, most unlocked achievement first
+
+        Raises:
+            WebApiError: The request to the Steam Web API failed
+        """
+        return GameAchievementPercentages.for_app(app_id).items()
+
+    @property
+    def global_percent(self):
+        """Return the float global unlock percentage of this achievement or
+        None if it is unknown
+        """
+        percentages = GameAchievementPercentages.for_app(self.game.app_id)
+        return percentages.get(self.api_name)
+
+
+class GameAchievementPercentages(object):
+    """Class to represent the global unlock percentages of all achievements
+    of a single game
+
+    Percentages can be looked up by achievement API name. Additionally the
+    percentages are kept in a sorted array to answer rank and percentile
+    queries. Loaded tables are cached for `cache_ttl` seconds.
+
+    Attributes:
+        app_id: The integer application ID of the game
+        fetch_time: The float UNIX timestamp at which the percentages have
+            been loaded
+    """
+
+    cache_ttl = 3600
+
+    _cache = LRUCache(1024, cache_ttl)
+
+    def __init__(self, app_id, percentages):
+        """Create a new GameAchievementPercentages instance
+
+        Parameters:
+            app_id: The integer application ID of the game
+            percentages: An iterable of 2-tuples of the form (str, float)
+                containing the achievement API names and their unlock
+                percentages
+        """
+        self.app_id = app_id
+        self.fetch_time = time.time()
+        self._percentages = dict(percentages)
+        self._sorted = array('d', sorted(self._percentages.itervalues()))
+
+    def __contains__(self, api_name):
+        return api_name in self._percentages
+
+    def __getitem__(self, api_name):
+        return self._percentages[api_name]
+
+    def __len__(self):
+        return len(self._percentages)
+
+    @classmethod
+    def fetch(cls, app_id):
+        """Load the percentages of the specified game from the Web API and
+        cache them
+
+        Parameters:
+            app_id: The integer application ID of the game
+
+        Returns:
+            A new GameAchievementPercentages instance
 
         Raises:
             WebApiError: The request to the Steam Web API failed
@@ -82,11 +156,112 @@ class GameAchievement(object):
                            'GetGlobalAchievementPercentagesForApp', 2,
                            gameid=app_id)
         data = json.loads(data)
-        percentages = []
-        for achievement in data['achievementpercentages']['achievements']:
-            percentages.append((achievement['name'], achievement['percent']))
+        percentages = cls(app_id, [
+            (achievement['name'], float(achievement['percent']))
+            for achievement in data['achievementpercentages']['achievements']
+        ])
+        cls._cache.ttl = cls.cache_ttl
+        cls._cache[app_id] = percentages
+        return percentages
+
+    @classmethod
+    def for_app(cls, app_id):
+        """Return the percentages of the specified game, loading them only if
+        they are not cached
+
+        Parameters:
+            app_id: The integer application ID of the game
+
+        Returns:
+            The GameAchievementPercentages for the game
+
+        Raises:
+            WebApiError: The request to the Steam Web API failed
+        """
+        percentages = cls._cache.get(app_id)
+        if percentages is None:
+            percentages = cls.fetch(app_id)
         return percentages
 
+    @classmethod
+    def refresh(cls, app_ids, threads=8):
+        """Load the percentages of several games concurrently
+
+        Parameters:
+            app_ids: An iterable of integer application IDs
+            threads: The integer number of concurrent Web API requests
+
+        Returns:
+            A dict mapping the application IDs to either their
+            GameAchievementPercentages or the SteamCondenserError raised
+            while loading them
+        """
+        pool = ThreadPool(threads)
+        try:
+            return dict(pool.imap_unordered(cls._refresh, set(app_ids)))
+        finally:
+            pool.close()
+            pool.join()
+
+    @classmethod
+    def _refresh(cls, app_id):
+        try:
+            return app_id, cls.fetch(app_id)
+        except SteamCondenserError, e:
+            return app_id, e
+
+    def get(self, api_name, default=None):
+        """Return the float unlock percentage of the specified achievement or
+        default
+        """
+        return self._percentages.get(api_name, default)
+
+    def items(self):
+        """Return a list of 2-tuples of the form (str, float) containing the
+        achievement API names and their percentages, most unlocked first
+        """
+        return sorted(self._percentages.iteritems(),
+                      key=lambda item: item[1], reverse=True)
+
+    def percentile(self, api_name):
+        """Return the percentage of this game's achievements that are at
+        least as rare as the specified achievement
+
+        Parameters:
+            api_name: The string API name of the achievement
+
+        Returns:
+            A float between 0 and 100
+        """
+        percent = self._percentages[api_name]
+        return 100 * bisect_right(self._sorted, percent) / len(self._sorted)
+
+    def rank(self, api_name):
+        """Return the rarity rank of the specified achievement
+
+        The rarest achievement has rank 1, achievements with the same
+        percentage share the same rank.
+
+        Parameters:
+            api_name: The string API name of the achievement
+
+        Returns:
+            The integer rank of the achievement
+        """
+        return bisect_left(self._sorted, self._percentages[api_name]) + 1
+
+    def rarer_than(self, percent):
+        """Return the number of achievements with an unlock percentage below
+        the given one
+
+        Parameters:
+            percent: The float unlock percentage
+
+        Returns:
+            The integer number of achievements
+        """
+        return bisect_left(self._sorted, percent)
+
 
 class GameItem(object):
     """Class representing an item in a game
@@ -550,6 +725,10 @@ class GameStats(object):
     It is subclassed for individual games if the games provides statistics that
     are unique to that game.
 
+    The XML data is downloaded and parsed once per refresh(). Only the
+    subtrees containing the achievements and the statistics are kept, the
+    achievements and any game-specific statistics are built lazily from them.
+
     Attributes:
         game: The SteamGame object for this game
         hours_played: The string number of hours this game has been played
@@ -557,6 +736,9 @@ class GameStats(object):
         user: The SteamId for the user
     """
 
+    _GAME_LINK_REGEX = re.compile(
+        r'http://steamcommunity\.com/+app/+([1-9][0-9]*)')
+
     def __init__(self, user_id, game_id):
         """Creates a new GameStats instance and fetches data from the Steam
         Community for the specified user and game
@@ -567,57 +749,68 @@ class GameStats(object):
             game_id: The integer application ID or string friendly name of
                 the game
 
+        Raises:
+            SteamCondenserError: If an error occured fetching data from the
+                Steam Community API
+        """
+        self.user = SteamId(user_id)
+        self._url = self.base_url(user_id, game_id)
+        self.refresh()
+
+    def refresh(self):
+        """Fetch and parse the statistics from the Steam Community again
+
+        Achievements that have already been built are discarded.
+
         Raises:
             SteamCondenserError: If an error occured fetching data from the
                 Steam Community API
         """
         xml = ''
         try:
-            xml = urllib2.urlopen(
-                "%s?xml=all" % (self.base_url(user_id, game_id))).read()
+            xml = urllib2.urlopen("%s?xml=all" % self._url).read()
         except urllib2.HTTPError:
             raise SteamCondenserError('error fetching game stats')
         root = ET.fromstring(xml)
         error = root.find('error')
-        if error:
+        if error is not None:
             raise SteamCondenserError(error.text)
-        self.user = SteamId(user_id)
-        self.privacy_state = root.privacyState.text
+        self.privacy_state = root.findtext('privacyState')
+        self._achievements = None
+        self._achievements_data = None
+        self._stats_data = None
         if self.public:
-            match = re.match(
-                ur'http://steamcommunity\.com/+app/+([1-9][0-9]*)/',
-                root.game.gameLink.text)
-            app_id = int(match.groups[0])
-            self.game = SteamGame(app_id, root.game)
-            if root.stats.find('hoursPlayed'):
-                self.hours_played = root.stats.hoursPlayed.text
+            game_data = root.find('game')
+            match = self._GAME_LINK_REGEX.match(game_data.findtext('gameLink'))
+            app_id = int(match.group(1))
+            self.game = SteamGame(app_id, game_data)
+            self._achievements_data = root.find('achievements')
+            self._stats_data = root.find('stats')
+            if self._stats_data is not None:
+                self.hours_played = self._stats_data.findtext('hoursPlayed')
             else:
                 self.hours_played = None
-        self._achievements = None
 
     @property
     def achievements(self):
+        """Return a list of the GameAchievements of this user for this game
+
+        The achievements are built from the data of the last refresh when
+        they are accessed for the first time.
+        """
         if self._achievements is None:
             self._achievements = []
-            xml = ''
-            try:
-                xml = urllib2.urlopen(
-                    "%s?xml=all" % (self._base_url)).read()
-            except urllib2.HTTPError:
-                raise SteamCondenserError('error fetching game stats')
-            root = ET.fromstring(xml)
-            error = root.find('error')
-            if error:
-                raise SteamCondenserError(error.text)
-            for achievement in root.iter('achievements'):
-                self._achievements.append(GameAchievement(self.user,
-                                                          self.game,
-                                                          achievement))
+            if self._achievements_data is not None:
+                for achievement in self._achievements_data.iter(
+                        'achievement'):
+                    self._achievements.append(
+                        GameAchievement(self.user, self.game, achievement))
         return self._achievements
 
     @property
     def achievements_done(self):
-        return len(self.achievements)
+        return len([achievement for achievement in self.achievements
+                    if achievement.unlocked])
 
     @property
     def achievements_percentage(self):
@@ -625,7 +818,7 @@ class GameStats(object):
 
     @property
     def _base_url(self):
-        return self.base_url(self.user.id, self.game.id)
+        return self._url
 
     @property
     def public(self):
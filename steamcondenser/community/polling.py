@@ -0,0 +1,385 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the new BSD License.
+#
+# Copyright (c) 2013 Sebastian Staudt
+
+
+from __future__ import absolute_import, division
+
+import heapq
+import threading
+import time
+from array import array
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+
+from ..cache import LRUCache
+from ..errors import SteamCondenserError
+from .errors import WebApiError
+from .steam import SteamGame
+from .webapi import AppNews
+
+
+SweepStats = namedtuple('SweepStats', ['started', 'duration', 'samples',
+                                       'errors', 'min_latency',
+                                       'mean_latency', 'max_latency'])
+
+
+class TimeSeries(object):
+    """Class to represent a fixed-size series of timestamped integer samples
+
+    The samples are stored in a ring buffer, once it is full every new sample
+    replaces the oldest one.
+
+    Attributes:
+        size: The integer maximum number of samples kept
+    """
+
+    def __init__(self, size):
+        """Create a new, empty TimeSeries
+
+        Parameters:
+            size: The integer maximum number of samples kept
+        """
+        self.size = size
+        self._count = 0
+        self._next = 0
+        self._timestamps = array('d', [0.0]) * size
+        self._values = array('l', [0]) * size
+
+    def __len__(self):
+        return self._count
+
+    def append(self, timestamp, value):
+        """Add a sample, replacing the oldest one if the series is full
+
+        Parameters:
+            timestamp: The float UNIX timestamp of the sample
+            value: The integer value of the sample
+        """
+        self._timestamps[self._next] = timestamp
+        self._values[self._next] = value
+        self._next = (self._next + 1) % self.size
+        if self._count < self.size:
+            self._count += 1
+
+    def latest(self):
+        """Return the newest sample as a 2-tuple (float, int) or None"""
+        if not self._count:
+            return None
+        index = (self._next - 1) % self.size
+        return self._timestamps[index], self._values[index]
+
+    def samples(self):
+        """Return a list of 2-tuples of the form (float, int) containing the
+        timestamps and values of all samples, oldest first
+        """
+        start = (self._next - self._count) % self.size
+        samples = []
+        for i in xrange(self._count):
+            index = (start + i) % self.size
+            samples.append((self._timestamps[index], self._values[index]))
+        return samples
+
+
+class PlayerCountPoller(object):
+    """Class to periodically sample the current player counts of many games
+
+    Every game is polled at its own interval. The `GetNumberOfCurrentPlayers`
+    requests of a sweep are run concurrently by a bounded number of threads
+    and the results are stored in a TimeSeries per game.
+
+    Attributes:
+        errors: A dict mapping the integer application IDs of games whose last
+            sample failed to the corresponding SteamCondenserError
+        history: The integer number of samples kept per game
+        interval: The default float number of seconds between two samples of
+            a game
+        last_stats: The SweepStats of the last sweep or None
+        threads: The integer maximum number of concurrent requests
+    """
+
+    def __init__(self, interval=60, threads=16, history=1440):
+        """Create a new PlayerCountPoller
+
+        Parameters:
+            interval: The default float number of seconds between two samples
+                of a game
+            threads: The integer maximum number of concurrent requests
+            history: The integer number of samples kept per game
+        """
+        self.errors = {}
+        self.history = history
+        self.interval = interval
+        self.last_stats = None
+        self.threads = threads
+        self._intervals = {}
+        self._schedule = []
+        self._series = {}
+        self._stopped = threading.Event()
+
+    def __contains__(self, app_id):
+        return app_id in self._intervals
+
+    def add(self, app_id, interval=None):
+        """Start polling the specified game
+
+        The game is sampled in the next sweep. Adding a game again only
+        changes its interval.
+
+        Parameters:
+            app_id: The integer application ID of the game
+            interval: The float number of seconds between two samples of this
+                game (optional)
+        """
+        if interval is None:
+            interval = self.interval
+        if app_id not in self._intervals:
+            self._series[app_id] = TimeSeries(self.history)
+            heapq.heappush(self._schedule, (0, app_id))
+        self._intervals[app_id] = interval
+
+    def remove(self, app_id):
+        """Stop polling the specified game and discard its samples"""
+        del self._intervals[app_id]
+        del self._series[app_id]
+        self.errors.pop(app_id, None)
+
+    def series(self, app_id):
+        """Return the TimeSeries of player counts for the specified game"""
+        return self._series[app_id]
+
+    def next_sweep(self):
+        """Return the float UNIX timestamp at which the next game is due or
+        None if no games are polled
+        """
+        while self._schedule and self._schedule[0][1] not in self._intervals:
+            heapq.heappop(self._schedule)
+        if not self._schedule:
+            return None
+        return self._schedule[0][0]
+
+    def sweep(self, now=None):
+        """Sample the player counts of all games that are due
+
+        Parameters:
+            now: The float UNIX timestamp to use as the current time
+                (optional)
+
+        Returns:
+            The SweepStats for this sweep
+        """
+        if now is None:
+            now = time.time()
+        due = set()
+        while self._schedule and self._schedule[0][0] <= now:
+            app_id = heapq.heappop(self._schedule)[1]
+            if app_id in self._intervals:
+                due.add(app_id)
+        if not due:
+            self.last_stats = SweepStats(now, 0.0, 0, 0, None, None, None)
+            return self.last_stats
+
+        latencies = []
+        errors = 0
+        unscheduled = set(due)
+        pool = ThreadPool(min(self.threads, len(due)))
+        try:
+            for app_id, timestamp, latency, count in \
+                    pool.imap_unordered(self._sample, due):
+                unscheduled.discard(app_id)
+                if app_id not in self._intervals:
+                    continue
+                heapq.heappush(self._schedule,
+                               (now + self._intervals[app_id], app_id))
+                latencies.append(latency)
+                if isinstance(count, SteamCondenserError):
+                    self.errors[app_id] = count
+                    errors += 1
+                else:
+                    self.errors.pop(app_id, None)
+                    self._series[app_id].append(timestamp, count)
+        finally:
+            pool.close()
+            pool.join()
+            for app_id in unscheduled:
+                if app_id in self._intervals:
+                    heapq.heappush(self._schedule,
+                                   (now + self._intervals[app_id], app_id))
+
+        if latencies:
+            self.last_stats = SweepStats(now, time.time() - now,
+                                         len(latencies), errors,
+                                         min(latencies),
+                                         sum(latencies) / len(latencies),
+                                         max(latencies))
+        else:
+            self.last_stats = SweepStats(now, time.time() - now, 0, errors,
+                                         None, None, None)
+        return self.last_stats
+
+    @staticmethod
+    def _sample(app_id):
+        """Request the current player count of a single game
+
+        Returns:
+            A 4-tuple containing the application ID, the float UNIX timestamp
+            of the request, its float latency in seconds and either the
+            integer player count or the SteamCondenserError raised
+        """
+        timestamp = time.time()
+        try:
+            count = SteamGame.app_player_count(app_id)
+        except SteamCondenserError, e:
+            count = e
+        except (KeyError, TypeError, ValueError), e:
+            count = WebApiError('invalid player count of app %d: %r' %
+                                (app_id, e))
+        return app_id, timestamp, time.time() - timestamp, count
+
+    def run(self, callback=None):
+        """Sweep repeatedly until stop() is called
+
+        Parameters:
+            callback: A callable that gets passed the SweepStats of every
+                sweep (optional)
+        """
+        self._stopped.clear()
+        while not self._stopped.is_set():
+            next_sweep = self.next_sweep()
+            if next_sweep is None:
+                delay = self.interval
+            else:
+                delay = next_sweep - time.time()
+            if delay > 0:
+                self._stopped.wait(delay)
+                continue
+            stats = self.sweep()
+            if callback is not None:
+                callback(stats)
+
+    def stop(self):
+        """Stop a running poller after its current sweep"""
+        self._stopped.set()
+
+
+class AppNewsPoller(object):
+    """Class to follow the news of many games incrementally
+
+    The poller remembers the newest news item it has seen for every game.
+    Subsequent polls only page back through the news using `enddate` windows
+    until that item is reached, so only new items are transferred and
+    returned. Items published in several feeds or for several games are only
+    returned once.
+
+    Attributes:
+        count: The integer number of news items requested per page
+        errors: A dict mapping the integer application IDs of games whose last
+            poll failed to the corresponding SteamCondenserError
+        max_length: The integer maximum length of the news contents or None
+        max_pages: The integer maximum number of pages loaded per game and
+            poll
+        threads: The integer maximum number of concurrent requests
+    """
+
+    def __init__(self, count=10, max_length=None, max_pages=10, threads=8,
+                 history=100000):
+        """Create a new AppNewsPoller
+
+        Parameters:
+            count: The integer number of news items requested per page
+            max_length: The integer maximum length of the news contents
+                (optional)
+            max_pages: The integer maximum number of pages loaded per game
+                and poll
+            threads: The integer maximum number of concurrent requests
+            history: The integer number of news IDs remembered for
+                de-duplication
+        """
+        self.count = count
+        self.errors = {}
+        self.max_length = max_length
+        self.max_pages = max_pages
+        self.threads = threads
+        self._latest = {}
+        self._seen = LRUCache(history)
+
+    def __contains__(self, app_id):
+        return app_id in self._latest
+
+    def add(self, app_id):
+        """Start following the news of the specified game
+
+        The first poll of a game returns its latest page of news.
+        """
+        self._latest.setdefault(app_id, None)
+
+    def remove(self, app_id):
+        """Stop following the news of the specified game"""
+        del self._latest[app_id]
+        self.errors.pop(app_id, None)
+
+    def poll(self):
+        """Load the new news items of all followed games
+
+        Returns:
+            A list of the new AppNews items of all games, newest first and
+            items published at the same time ordered by app ID and gid
+        """
+        pool = ThreadPool(self.threads)
+        try:
+            news_items = []
+            for app_id, items in pool.imap_unordered(self._poll,
+                                                     self._latest.items()):
+                if isinstance(items, SteamCondenserError):
+                    self.errors[app_id] = items
+                    continue
+                self.errors.pop(app_id, None)
+                if items and app_id in self._latest:
+                    self._latest[app_id] = (items[0].timestamp, items[0].gid)
+                for item in items:
+                    if item.gid not in self._seen:
+                        self._seen[item.gid] = True
+                        news_items.append(item)
+            news_items.sort(key=lambda item: (-item.timestamp, item.app_id,
+                                              item.gid))
+            return news_items
+        finally:
+            pool.close()
+            pool.join()
+
+    def _poll(self, app_latest):
+        """Load the news items of a single game that are newer than the
+        latest one seen
+
+        Returns:
+            A 2-tuple containing the application ID and either the list of new
+            AppNews items, newest first, or the SteamCondenserError raised
+        """
+        app_id, latest = app_latest
+        news_items = []
+        gids = set()
+        end_date = None
+        try:
+            for page in xrange(self.max_pages):
+                items = AppNews.news_for_app(app_id, self.count,
+                                             self.max_length, end_date)
+                for item in items:
+                    if latest is not None and (item.gid == latest[1] or
+                                               item.timestamp < latest[0]):
+                        return app_id, news_items
+                    if item.gid not in gids:
+                        gids.add(item.gid)
+                        news_items.append(item)
+                if latest is None or len(items) < self.count or \
+                        items[-1].timestamp == end_date:
+                    break
+                end_date = items[-1].timestamp
+        except SteamCondenserError, e:
+            return app_id, e
+        except (KeyError, TypeError, ValueError), e:
+            return app_id, WebApiError('invalid news of app %d: %r' %
+                                       (app_id, e))
+        return app_id, news_items
@@ -14,7 +14,10 @@ import re
 import urllib2
 import xml.etree.ElementTree as ET
 import HTMLParser
+from array import array
+from bisect import bisect_left
 
+from ..cache import LRUCache
 from ..errors import SteamCondenserError
 from .webapi import WebApi
 
@@ -22,28 +25,34 @@ from .webapi import WebApi
 class SteamGame(object):
     """Class to represent a game available on Steam"""
 
+    _STEAM_INF_APP_ID = re.compile(r'^\s*appID=(\d+)\s*$', re.I | re.M)
+    _STEAM_INF_VERSION = re.compile(r'^\s*PatchVersion=([\d\.]+)\s*$',
+                                    re.I | re.M)
+
     def __init__(self, app_id, game_data):
         """Create a new SteamGame with the specified parameters
 
         Parameters:
             app_id: The integer application ID for this game
-            game_data: The XML ElementTree element containing the data for
-                this game
+            game_data: The XML ElementTree element or the dict from the Web
+                API containing the data for this game
         """
         self.app_id = app_id
         if 'name' in game_data:
-            self.icon_hash = game_data.img_icon_url.text
-            self.logo_hash = game_data.img_logo_url.text
-            self.name = game_data.name.text
+            self.icon_hash = game_data.get('img_icon_url')
+            self.logo_hash = game_data.get('img_logo_url')
+            self.name = game_data['name']
             self.short_name = None
         else:
-            url_regex = u'/%d/([0-9a-f])+.jpg' % app_id
-            self.icon_hash = re.match(url_regex, game_data.gameIcon.text
-                                      ).group(1)
-            self.logo_hash = re.match(url_regex, game_data.gameLogo.text
-                                      ).group(1)
-            self.name = game_data.gameName.text
-            self.short_name = game_data.gameFriendlyName.text.lower()
+            url_regex = u'/%d/([0-9a-f]+).jpg' % app_id
+            self.icon_hash = re.search(url_regex,
+                                       game_data.findtext('gameIcon')
+                                       ).group(1)
+            self.logo_hash = re.search(url_regex,
+                                       game_data.findtext('gameLogo')
+                                       ).group(1)
+            self.name = game_data.findtext('gameName')
+            self.short_name = game_data.findtext('gameFriendlyName').lower()
             if self.short_name == str(self.app_id):
                 self.short_name = None
 
@@ -59,20 +68,34 @@ class SteamGame(object):
         Returns:
             True if the game is up-to-date
         """
-        steam_inf = open(path).read()
+        return cls.app_uptodate(*cls.parse_steam_inf(path))
+
+    @classmethod
+    def parse_steam_inf(cls, path):
+        """Read the application ID and version of a game from a `steam.inf`
+        file
+
+        Parameters:
+            path: A string containing the file system path to the `steam.inf`
+                file
+
+        Returns:
+            A 2-tuple of the form (int, int) containing the application ID and
+            the version of the game
+
+        Raises:
+            SteamCondenserError: The file could not be read or is invalid
+        """
         try:
-            app_id = int(re.match(ur'^\s*appID=(\d+)\s*$',
-                                  steam_inf,
-                                  re.I | re.M).groups(1))
-            version = int(re.match(ur'^\s*PatchVersion=([\d\.]+)\s*$',
-                                   steam_inf,
-                                   re.I | re.M).groups(1).replace('.', ''))
-            return cls.uptodate(app_id, version)
-        except SteamCondenserError, e:
-            raise e
-        except Exception:
+            with open(path) as steam_inf_file:
+                steam_inf = steam_inf_file.read()
+            app_id = int(cls._STEAM_INF_APP_ID.search(steam_inf).group(1))
+            version = int(cls._STEAM_INF_VERSION.search(steam_inf).group(1)
+                          .replace('.', ''))
+        except (AttributeError, EnvironmentError, ValueError):
             raise SteamCondenserError('the steam.inf file "%s" is invalid'
                                       % path)
+        return app_id, version
 
     @classmethod
     def app_uptodate(cls, app_id, version):
@@ -94,13 +117,25 @@ class SteamGame(object):
         else:
             raise SteamCondenserError(result['error'])
 
-    def player_count(self):
-        """Return the number of players currently playing this game"""
+    @classmethod
+    def app_player_count(cls, app_id):
+        """Return the number of players currently playing the specified game
+
+        Parameters:
+            app_id: The integer application ID for the game
+
+        Returns:
+            The integer number of players
+        """
         result = WebApi.json('ISteamUserStats', 'GetNumberOfCurrentPlayers',
-                             1, appid=self.app_id)
+                             1, appid=app_id)
         result = json.loads(result)['response']
         return result['player_count']
 
+    def player_count(self):
+        """Return the number of players currently playing this game"""
+        return self.app_player_count(self.app_id)
+
     def has_stats(self):
         """Return whether this game has statistics available"""
         return self.short_name is not None
@@ -169,6 +204,114 @@ class SteamGame(object):
             return None
 
 
+class SteamGameCatalog(object):
+    """Class to provide a process-wide catalog of SteamGames
+
+    The catalog keeps a single SteamGame instance per application ID, so all
+    users owning a game share the same instance and its interned string
+    fields. The catalog is bounded in size, the least recently used games are
+    evicted first.
+    """
+
+    _games = LRUCache(50000)
+
+    @classmethod
+    def clear(cls):
+        """Remove all games from the catalog"""
+        cls._games.clear()
+
+    @classmethod
+    def game(cls, app_id, game_data=None):
+        """Return the shared SteamGame for the specified application ID
+
+        If the game is not cataloged yet, it is created from the given data.
+        Icon and logo hashes missing from a cataloged game, e.g. because it
+        has been loaded from the application list, are filled in from the
+        given data.
+
+        Parameters:
+            app_id: The integer application ID of the game
+            game_data: The XML ElementTree element or the dict from the Web
+                API containing the data for this game (optional)
+
+        Returns:
+            The SteamGame for the specified application ID or None if it is
+            not cataloged and no data has been given
+        """
+        game = cls._games.get(app_id)
+        if game_data is None:
+            return game
+        if game is None:
+            game = cls._intern(SteamGame(app_id, game_data))
+            return cls._games.setdefault(app_id, game)
+        if game.icon_hash is None and game.logo_hash is None:
+            update = cls._intern(SteamGame(app_id, game_data))
+            game.icon_hash = update.icon_hash
+            game.logo_hash = update.logo_hash
+            if game.short_name is None:
+                game.short_name = update.short_name
+        return game
+
+    @classmethod
+    def load_app_list(cls):
+        """Add all applications from a snapshot of Steam's application list
+        to the catalog
+
+        Games from the application list only have an ID and a name. If the
+        list is longer than the maximum size of the catalog, only the last
+        applications of the list are kept.
+
+        Returns:
+            The integer number of games added from the list that are still in
+            the catalog
+
+        Raises:
+            WebApiError: The request to the Steam Web API failed
+        """
+        data = WebApi.json('ISteamApps', 'GetAppList', 2)
+        added = []
+        for app in json.loads(data)['applist']['apps']:
+            if app['appid'] not in cls._games:
+                cls._games[app['appid']] = SteamGame(app['appid'],
+                                                     {'name': app['name']})
+                added.append(app['appid'])
+        return sum(1 for app_id in added if app_id in cls._games)
+
+    @classmethod
+    def resize(cls, max_size):
+        """Change the maximum number of games in the catalog
+
+        If the catalog holds more games, the least recently used ones are
+        evicted.
+
+        Parameters:
+            max_size: The integer maximum number of games
+
+        Raises:
+            ValueError: max_size is less than 1
+        """
+        cls._games.resize(max_size)
+
+    @classmethod
+    def size(cls):
+        """Return the number of games currently in the catalog"""
+        return len(cls._games)
+
+    @staticmethod
+    def _intern(game):
+        """Intern the short name and the image hashes of a game"""
+        for field in ('icon_hash', 'logo_hash', 'short_name'):
+            value = getattr(game, field)
+            if isinstance(value, unicode):
+                try:
+                    value = value.encode('ascii')
+                except UnicodeError:
+                    continue
+            if isinstance(value, str):
+                setattr(game, field, intern(value))
+        return game
+
+
 class SteamGroup(object):
     """Class to represent a group in the Steam Community
 
@@ -269,6 +412,9 @@ class SteamId(object):
 
     _friends = None
     _games = None
+    _game_names = None
+    _game_short_names = None
+    _app_ids = None
     _recent_playtimes = None
     _total_playtimes = None
 
@@ -491,6 +637,11 @@ class SteamId(object):
     def _fetch_games(self):
         """Fetch the list of games that this user owns
 
+        The games are shared through the SteamGameCatalog. Besides the dict of
+        games this builds case-insensitive indexes of the games' full and
+        short names and stores the playtimes in arrays that are sorted by
+        application ID.
+
         Returns:
             A dict of games that this user owns
         """
@@ -498,21 +649,25 @@ class SteamId(object):
                                  include_appinfo=1,
                                  include_played_free_games=1,
                                  steamid=self.steam_id64)
-        games_data = json.loads(games_data)
+        games_data = json.loads(games_data)['response'].get('games', [])
+        games_data.sort(key=lambda game: game['appid'])
         self._games = {}
-        self._recent_playtimes = {}
-        self._total_playtimes = {}
-        for game in games_data['response']['games']:
+        self._game_names = {}
+        self._game_short_names = {}
+        self._app_ids = array('I')
+        self._recent_playtimes = array('I')
+        self._total_playtimes = array('I')
+        for game in games_data:
             app_id = game['appid']
-            self._games[app_id] = SteamGame(app_id, game)
-            if 'playtime_2weeks' in game:
-                self._recent_playtimes[app_id] = game['playtime_2weeks']
-            else:
-                self._recent_playtimes[app_id] = 0
-            if 'playtime_forever' in game:
-                self._total_playtimes[app_id] = game['playtime_forever']
-            else:
-                self._total_playtimes[app_id] = 0
+            steam_game = SteamGameCatalog.game(app_id, game)
+            self._games[app_id] = steam_game
+            if steam_game.name:
+                self._game_names[steam_game.name.lower()] = app_id
+            if steam_game.short_name:
+                self._game_short_names[steam_game.short_name] = app_id
+            self._app_ids.append(app_id)
+            self._recent_playtimes.append(game.get('playtime_2weeks', 0))
+            self._total_playtimes.append(game.get('playtime_forever', 0))
         return self._games
 
     def game_stats(self, game_id):
@@ -590,6 +745,28 @@ class SteamId(object):
         """Return whether or not this Steam ID is publicly accessible"""
         return self.privacy_state == 'public'
 
+    def playtimes(self, app_ids):
+        """Return the playtimes of this user for several games at once
+
+        Parameters:
+            app_ids: An iterable of integer application IDs
+
+        Returns:
+            A list of 2-tuples of the form (int, int) containing the number of
+            minutes this user played each game over the last two weeks and in
+            total (respectively), in the order of app_ids
+
+        Raises:
+            SteamCondenserError: The user does not own one of the games
+        """
+        self.games
+        playtimes = []
+        for app_id in app_ids:
+            index = self._playtime_index(app_id)
+            playtimes.append((self._recent_playtimes[index],
+                              self._total_playtimes[index]))
+        return playtimes
+
     def recent_playtime(self, game_id):
         """Return the time in minutes that this user has played the specified
         game in the last two weeks
@@ -602,8 +779,8 @@ class SteamId(object):
             An integer containing the number of minutes this user played the
             specified game over the last two weeks
         """
-        game = self._find_game(game_id)
-        return self.recent_playtimes[game.app_id]
+        app_id = self._find_app_id(game_id)
+        return self._recent_playtimes[self._playtime_index(app_id)]
 
     def total_playtime(self, game_id):
         """Return the time in minutes that this user has played the specified
@@ -615,10 +792,40 @@ class SteamId(object):
 
         Returns:
             An integer containing the total number of minutes this user played
-            the specified game over the last two weeks
+            the specified game
         """
-        game = self._find_game(game_id)
-        return self.total_playtimes[game.app_id]
+        app_id = self._find_app_id(game_id)
+        return self._total_playtimes[self._playtime_index(app_id)]
+
+    def _find_app_id(self, game_id):
+        """Find the application ID of an owned game by its application ID,
+        full name or short name
+
+        Names are matched case-insensitively.
+
+        Parameters:
+            game_id: Either the string full or short name for a game or the
+                integer application ID
+
+        Returns:
+            The integer application ID of the specified game
+
+        Raises:
+            SteamCondenserError: The user does not own the game or the game
+                does not exist
+        """
+        games = self.games
+        if isinstance(game_id, (int, long)):
+            if game_id in games:
+                return game_id
+        else:
+            name = game_id.lower()
+            if name in self._game_short_names:
+                return self._game_short_names[name]
+            if name in self._game_names:
+                return self._game_names[name]
+        raise SteamCondenserError('This SteamID does not own the game '
+                                  '%s' % game_id)
 
     def _find_game(self, game_id):
         """Find a game instance with the specified application ID, full name
@@ -634,11 +841,16 @@ class SteamId(object):
             SteamCondenserError: The user does not own the game or the game
                 does not exist
         """
-        if isinstance(game_id, int):
-            return self.games[game_id]
-        else:
-            for game in self.games.values():
-                if game.short_name == game_id or game.name == id:
-                    return game
-        raise SteamCondenserError('This SteamID does not own the game '
-                                  '%s' % game_id)
+        return self.games[self._find_app_id(game_id)]
+
+    def _playtime_index(self, app_id):
+        """Return the position of a game in the playtime arrays
+
+        Raises:
+            SteamCondenserError: The user does not own the game
+        """
+        index = bisect_left(self._app_ids, app_id)
+        if index == len(self._app_ids) or self._app_ids[index] != app_id:
+            raise SteamCondenserError('This SteamID does not own the game '
+                                      '%s' % app_id)
+        return index
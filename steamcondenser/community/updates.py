@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the new BSD License.
+#
+# Copyright (c) 2013 Sebastian Staudt
+
+
+from __future__ import absolute_import
+
+import os
+from multiprocessing.pool import ThreadPool
+
+from ..cache import LRUCache
+from ..errors import SteamCondenserError
+from .steam import SteamGame
+
+
+class SteamInfScanner(object):
+    """Class to check whether many game server installations are up-to-date
+
+    The scanner searches directory trees for `steam.inf` files and parses
+    them concurrently. Installations sharing the same application ID and
+    version are grouped, so every distinct version is checked against the
+    Web API only once. The results of these checks are cached for a limited
+    time.
+
+    Attributes:
+        threads: The integer maximum number of concurrent file reads and
+            Web API requests
+    """
+
+    def __init__(self, ttl=300, threads=8, cache_size=1024):
+        """Create a new SteamInfScanner
+
+        Parameters:
+            ttl: The float number of seconds the result of an up-to-date
+                check is cached
+            threads: The integer maximum number of concurrent file reads and
+                Web API requests
+            cache_size: The integer maximum number of cached check results
+        """
+        self.threads = threads
+        self._uptodate = LRUCache(cache_size, ttl)
+
+    @classmethod
+    def find(cls, *roots):
+        """Yield the paths of all `steam.inf` files below the given
+        directories
+
+        Parameters:
+            *roots: The string paths of the directories to search
+        """
+        for root in roots:
+            for dirpath, dirnames, filenames in os.walk(root):
+                for filename in filenames:
+                    if filename.lower() == 'steam.inf':
+                        yield os.path.join(dirpath, filename)
+
+    def check(self, paths):
+        """Check whether the games described by the given `steam.inf` files
+        are up-to-date
+
+        Parameters:
+            paths: An iterable of string paths of `steam.inf` files
+
+        Returns:
+            A dict mapping every path to either True or False, depending on
+            whether the installation is up-to-date, or to the
+            SteamCondenserError raised while reading or checking it
+        """
+        pool = ThreadPool(self.threads)
+        try:
+            results = {}
+            versions = {}
+            for path, version in pool.imap_unordered(self._parse, paths):
+                if isinstance(version, SteamCondenserError):
+                    results[path] = version
+                else:
+                    versions.setdefault(version, []).append(path)
+
+            unchecked = []
+            for version, version_paths in versions.iteritems():
+                uptodate = self._uptodate.get(version)
+                if uptodate is None:
+                    unchecked.append(version)
+                else:
+                    for path in version_paths:
+                        results[path] = uptodate
+
+            for version, uptodate in pool.imap_unordered(self._check,
+                                                         unchecked):
+                if not isinstance(uptodate, SteamCondenserError):
+                    self._uptodate[version] = uptodate
+                for path in versions[version]:
+                    results[path] = uptodate
+            return results
+        finally:
+            pool.close()
+            pool.join()
+
+    def scan(self, *roots):
+        """Check all `steam.inf` files below the given directories
+
+        Parameters:
+            *roots: The string paths of the directories to search
+
+        Returns:
+            A dict as returned by check()
+        """
+        return self.check(self.find(*roots))
+
+    @staticmethod
+    def _check(version):
+        """Check a single (application ID, version) pair using the Web API"""
+        try:
+            return version, SteamGame.app_uptodate(*version)
+        except SteamCondenserError, e:
+            return version, e
+
+    @staticmethod
+    def _parse(path):
+        """Read the application ID and version from a single `steam.inf`"""
+        try:
+            return path, SteamGame.parse_steam_inf(path)
+        except SteamCondenserError, e:
+            return path, e
@@ -9,8 +9,10 @@
 from __future__ import absolute_import, division
 
 import datetime
+import httplib
 import json
 import re
+import socket
 import urllib
 import urllib2
 
@@ -36,6 +38,8 @@ class AppNews(object):
         feed_name: A string containing the symbolic name of the feed this news
             item belongs to
         gid: An integer containing a unique identifier for this news item
+        timestamp: An integer containing the UNIX timestamp this news item
+            has been published at
         title: A string containing the title of this news item
         url: A string containing the original URL for this news item
     """
@@ -50,7 +54,8 @@ class AppNews(object):
         self.app_id = app_id
         self.author = news_data['author']
         self.contents = news_data['contents'].strip()
-        self.date = datetime.utcfromtimestamp(news_data['date'])
+        self.date = datetime.datetime.utcfromtimestamp(news_data['date'])
+        self.timestamp = news_data['date']
         self.external = news_data['is_external_url']
         self.feed_label = news_data['feedlabel']
         self.feed_name = news_data['feedname']
@@ -59,21 +64,29 @@ class AppNews(object):
         self.url = news_data['url']
 
     @classmethod
-    def news_for_app(cls, app_id, count=5, max_length=None):
+    def news_for_app(cls, app_id, count=5, max_length=None, end_date=None):
         """Load the news for the specified game
 
         Args:
             app_id: The application ID of the game
+            count: The maximum number of news items to load
+            max_length: The maximum length of the news contents (optional)
+            end_date: An integer UNIX timestamp, only news published before
+                this date are loaded (optional)
 
         Returns:
-            A list of AppNews items for the specified game
+            A list of AppNews items for the specified game, newest first
         """
-        data = WebApi.json('ISteamNews', 'GetNewsForApp', 2, appid=app_id,
-                           count=count, maxlength=max_length)
+        params = {'appid': app_id, 'count': count}
+        if max_length is not None:
+            params['maxlength'] = max_length
+        if end_date is not None:
+            params['enddate'] = end_date
+        data = WebApi.json('ISteamNews', 'GetNewsForApp', 2, **params)
         news_data = json.loads(data)
         news_items = []
         for item in news_data['appnews']['newsitems']:
-            news_items.append(AppNews(app_id, news_data))
+            news_items.append(AppNews(app_id, item))
         return news_items
 
     def __unicode__(self):
@@ -167,7 +180,8 @@ class WebApi(object):
             A string containing the data returned by the Web API
 
         Raises:
-            WebApiError: A Web API error occured
+            WebApiError: A Web API error occured or the request failed, e.g.
+                because of a network error or timeout
         """
         url = 'http://api.steampowered.com/%s/%s/v%04d/' % (interface, method,
                                                             version)
@@ -185,3 +199,7 @@ class WebApi(object):
                 raise WebApiError(e.code)
             else:
                 raise WebApiError('urlopen failed')
+        except urllib2.URLError, e:
+            raise WebApiError(e.reason)
+        except (httplib.HTTPException, socket.error), e:
+            raise WebApiError('request to %s failed: %r' % (url, e))
@@ -14,3 +14,29 @@ class SteamCondenserError(Exception):
 class PacketFormatError(SteamCondenserError):
     """A packet error occured"""
     pass
+
+
+class TimeoutError(SteamCondenserError):
+    """A request timed out"""
+    pass
+
+
+class CancelledError(TimeoutError):
+    """A request was given up before it was sent"""
+    pass
+
+
+class RCONAbortedError(SteamCondenserError):
+    """An RCON command was given up as its connection has been closed after
+    another command timed out"""
+    pass
+
+
+class RCONBanError(SteamCondenserError):
+    """The IP address has been banned by the game server"""
+    pass
+
+
+class RCONNoAuthError(SteamCondenserError):
+    """The RCON password was rejected by the game server"""
+    pass
@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the new BSD License.
+#
+# Copyright (c) 2013 Sebastian Staudt
+
+
+from __future__ import absolute_import, division
+
+import select
+import socket
+import threading
+import time
+from array import array
+from collections import deque
+
+from .packets import A2SInfoPacket
+
+
+def _bit_length(value):
+    return len(bin(value)) - 2
+
+
+class LatencyHistogram(object):
+    """Class to record latencies in a histogram of bounded size
+
+    Like an HDR histogram, every power of two of microseconds is divided
+    into `2^SUB_BUCKET_BITS` buckets of equal width, so percentiles are
+    accurate to about 3% of their value over the whole range while the
+    memory used stays constant. Latencies above `highest` are counted as
+    `highest`.
+
+    Jitter is the smoothed mean difference between consecutive latencies as
+    defined by RFC 3550.
+
+    Attributes:
+        count: The integer number of latencies recorded
+        jitter: The float jitter in seconds
+        losses: The integer number of queries that were lost
+        max: The float maximum latency in seconds or None
+        min: The float minimum latency in seconds or None
+        total: The float sum of all latencies in seconds
+    """
+
+    SUB_BUCKET_BITS = 5
+
+    def __init__(self, highest=60.0):
+        """Create a new, empty LatencyHistogram
+
+        Parameters:
+            highest: The float highest latency in seconds to distinguish
+        """
+        self._highest = int(highest * 1000000)
+        self._counts = array('L', [0]) * (self._index(self._highest) + 1)
+        self._last = None
+        self.count = 0
+        self.jitter = 0.0
+        self.losses = 0
+        self.max = None
+        self.min = None
+        self.total = 0.0
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def loss_rate(self):
+        """The float fraction of queries that were lost or None"""
+        queries = self.count + self.losses
+        if queries == 0:
+            return None
+        return self.losses / queries
+
+    @property
+    def mean(self):
+        """The float mean latency in seconds or None"""
+        if self.count == 0:
+            return None
+        return self.total / self.count
+
+    def percentile(self, percentile):
+        """Return the latency below which the given percentage of latencies
+        fall
+
+        Parameters:
+            percentile: The float percentage, e.g. 99
+
+        Returns:
+            The float latency in seconds or None if nothing was recorded
+        """
+        if self.count == 0:
+            return None
+        target = max(1, int(round(percentile / 100 * self.count)))
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen >= target:
+                return min(max(self._value(index) / 1000000, self.min),
+                           self.max)
+        return self.max
+
+    def p50(self):
+        """Return the median latency in seconds"""
+        return self.percentile(50)
+
+    def p95(self):
+        """Return the 95th percentile latency in seconds"""
+        return self.percentile(95)
+
+    def p99(self):
+        """Return the 99th percentile latency in seconds"""
+        return self.percentile(99)
+
+    def record(self, latency):
+        """Record a latency
+
+        Parameters:
+            latency: The float latency in seconds
+        """
+        microseconds = min(max(int(latency * 1000000), 0), self._highest)
+        self._counts[self._index(microseconds)] += 1
+        self.count += 1
+        self.total += latency
+        if self.min is None or latency < self.min:
+            self.min = latency
+        if self.max is None or latency > self.max:
+            self.max = latency
+        if self._last is not None:
+            self.jitter += (abs(latency - self._last) - self.jitter) / 16
+        self._last = latency
+
+    def record_loss(self):
+        """Record a query that has not been answered"""
+        self.losses += 1
+
+    def _index(self, microseconds):
+        """Return the bucket index of a latency in microseconds"""
+        sub_buckets = 1 << self.SUB_BUCKET_BITS
+        if microseconds < sub_buckets:
+            return microseconds
+        shift = _bit_length(microseconds) - 1 - self.SUB_BUCKET_BITS
+        return (shift + 1) * sub_buckets + \
+            (microseconds >> shift) - sub_buckets
+
+    def _value(self, index):
+        """Return the latency in microseconds in the middle of a bucket"""
+        sub_buckets = 1 << self.SUB_BUCKET_BITS
+        if index < sub_buckets:
+            return index
+        shift = index // sub_buckets - 1
+        lower = (sub_buckets + index % sub_buckets) << shift
+        return lower + (1 << shift) / 2
+
+
+class LatencyTracker(object):
+    """Class to keep a LatencyHistogram for every game server
+
+    The tracker is thread-safe, so it may be shared between several
+    scanners and pingers.
+
+    Attributes:
+        highest: The float highest latency in seconds distinguished by the
+            histograms
+    """
+
+    def __init__(self, highest=60.0):
+        """Create a new, empty LatencyTracker
+
+        Parameters:
+            highest: The float highest latency in seconds distinguished by the
+                histograms
+        """
+        self.highest = highest
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, address):
+        return address in self._histograms
+
+    def __len__(self):
+        return len(self._histograms)
+
+    def histogram(self, address):
+        """Return the LatencyHistogram of a server
+
+        Parameters:
+            address: The 2-tuple (str, int) address of the server
+        """
+        histogram = self._histograms.get(address)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.get(address)
+                if histogram is None:
+                    histogram = LatencyHistogram(self.highest)
+                    self._histograms[address] = histogram
+        return histogram
+
+    def rank(self, addresses=None, percentile=50):
+        """Return the addresses of servers ordered by their latency
+
+        Servers without any recorded latency are left out.
+
+        Parameters:
+            addresses: An iterable of the addresses to rank (optional,
+                defaults to all servers)
+            percentile: The float percentile to compare
+
+        Returns:
+            A list of addresses, the fastest server first
+        """
+        if addresses is None:
+            addresses = self._histograms.keys()
+        ranked = []
+        for address in addresses:
+            histogram = self._histograms.get(address)
+            if histogram is not None and histogram.count:
+                ranked.append((histogram.percentile(percentile), address))
+        ranked.sort()
+        return [address for latency, address in ranked]
+
+    def record(self, address, latency):
+        """Record the latency of a query to a server"""
+        histogram = self.histogram(address)
+        with self._lock:
+            histogram.record(latency)
+
+    def record_loss(self, address):
+        """Record a query to a server that has not been answered"""
+        histogram = self.histogram(address)
+        with self._lock:
+            histogram.record_loss()
+
+    def remove(self, address):
+        """Discard the histogram of a server"""
+        with self._lock:
+            self._histograms.pop(address, None)
+
+
+class BulkPinger(object):
+    """Class to measure the round-trip times of many game servers at once
+
+    The A2S_INFO request is encoded once and sent in bursts to all servers
+    from a single socket. Any reply, including `S2C_CHALLENGE`, completes a
+    ping, so replies are only matched by their sender and never parsed.
+    Replies are matched to the oldest unanswered request of their server;
+    requests unanswered after `timeout` seconds count as lost.
+
+    Attributes:
+        count: The integer number of bursts sent
+        interval: The float number of seconds between two bursts
+        timeout: The float number of seconds to wait for a reply
+        tracker: The LatencyTracker the round-trip times are recorded in
+    """
+
+    def __init__(self, count=3, interval=0.1, timeout=1.0, tracker=None):
+        """Create a new BulkPinger
+
+        Parameters:
+            count: The integer number of bursts sent
+            interval: The float number of seconds between two bursts
+            timeout: The float number of seconds to wait for a reply
+            tracker: The LatencyTracker to record the round-trip times in
+                (optional)
+        """
+        if tracker is None:
+            tracker = LatencyTracker()
+        self.count = count
+        self.interval = interval
+        self.timeout = timeout
+        self.tracker = tracker
+
+    def ping(self, addresses):
+        """Ping the given servers
+
+        Parameters:
+            addresses: An iterable of 2-tuples of the form (str, int)
+                containing the IP addresses and ports of the servers
+
+        Returns:
+            A dict mapping the addresses to their LatencyHistograms
+        """
+        addresses = list(set(addresses))
+        data = str(A2SInfoPacket())
+        sent = dict((address, deque()) for address in addresses)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.settimeout(self.timeout)
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+            except socket.error:
+                pass
+            sendto = sock.sendto
+            now = time.time
+            self._outstanding = 0
+            for burst in xrange(self.count):
+                for address in addresses:
+                    try:
+                        sendto(data, address)
+                    except socket.error:
+                        continue
+                    sent[address].append(now())
+                    self._outstanding += 1
+                if burst + 1 < self.count:
+                    self._receive(sock, sent, now() + self.interval)
+            self._receive(sock, sent, now() + self.timeout)
+        finally:
+            sock.close()
+
+        for address, timestamps in sent.iteritems():
+            for timestamp in timestamps:
+                self.tracker.record_loss(address)
+        return dict((address, self.tracker.histogram(address))
+                    for address in addresses)
+
+    def _receive(self, sock, sent, until):
+        """Match replies to requests until the given time"""
+        while True:
+            timeout = until - time.time()
+            if timeout <= 0 or not self._outstanding:
+                return
+            if not select.select([sock], [], [], timeout)[0]:
+                return
+            received = time.time()
+            try:
+                address = sock.recvfrom(65535)[1]
+            except socket.error:
+                continue
+            timestamps = sent.get(address)
+            if not timestamps:
+                continue
+            while timestamps and received - timestamps[0] > self.timeout:
+                timestamps.popleft()
+                self._outstanding -= 1
+                self.tracker.record_loss(address)
+            if timestamps:
+                self._outstanding -= 1
+                self.tracker.record(address, received - timestamps.popleft())
@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the new BSD License.
+#
+# Copyright (c) 2013 Sebastian Staudt
+
+
+from __future__ import absolute_import, division
+
+import socket
+import struct
+import time
+from collections import namedtuple
+from itertools import izip
+from multiprocessing.pool import ThreadPool
+from socket import inet_ntoa
+
+from .errors import PacketFormatError, SteamCondenserError, TimeoutError
+from .packets import A2MGetServersBatch2Packet, M2AServerBatchPacket, \
+    PacketBuffer, SteamPacket, format_server_address, pack_server_address
+
+
+ShardStats = namedtuple('ShardStats', ['region_code', 'filter', 'duration',
+                                       'servers', 'new_servers', 'error'])
+
+
+class MasterServer(object):
+    """Class to query Steam master servers for lists of game servers
+
+    The server list is transferred in pages. Every page is requested starting
+    at the last address of the previous page until the master server sends
+    the terminating address `0.0.0.0:0`. The request for the next page is
+    sent before the servers of the current page are handed to the caller, so
+    the transfer of the next page overlaps with their processing.
+
+    Attributes:
+        requests_per_second: The float maximum number of requests sent per
+            second or None
+        retries: The integer number of times a request is repeated after a
+            timeout
+        timeout: The float number of seconds to wait for a page
+    """
+
+    GOLDSRC_MASTER_SERVER = ('hl1master.steampowered.com', 27011)
+    SOURCE_MASTER_SERVER = ('hl2master.steampowered.com', 27011)
+
+    REGION_US_EAST_COAST = 0x00
+    REGION_US_WEST_COAST = 0x01
+    REGION_SOUTH_AMERICA = 0x02
+    REGION_EUROPE = 0x03
+    REGION_ASIA = 0x04
+    REGION_AUSTRALIA = 0x05
+    REGION_MIDDLE_EAST = 0x06
+    REGION_AFRICA = 0x07
+    REGION_ALL = 0xFF
+
+    _HEADER = struct.Struct('<lB')
+
+    def __init__(self, address, port=27011, timeout=1.0, retries=3,
+                 requests_per_second=None):
+        """Create a new MasterServer client
+
+        Parameters:
+            address: The string host name or IP address of the master server,
+                optionally followed by `:port`
+            port: The integer port of the master server
+            timeout: The float number of seconds to wait for a page
+            retries: The integer number of times a request is repeated after
+                a timeout
+            requests_per_second: The float maximum number of requests sent
+                per second (optional)
+        """
+        if ':' in address:
+            address, port = address.split(':')
+        self.address = (address, int(port))
+        self.requests_per_second = requests_per_second
+        self.retries = retries
+        self.timeout = timeout
+        self._last_request = 0
+
+    def batches(self, region_code=REGION_ALL, filter=''):
+        """Yield the pages of the server list as they arrive
+
+        Parameters:
+            region_code: The integer region code of the servers
+            filter: The string filter for the servers, see
+                A2MGetServersBatch2Packet
+
+        Returns:
+            A generator of M2AServerBatchPackets, the last one ends with the
+            terminating address `0.0.0.0:0`
+
+        Raises:
+            SteamCondenserError: The master server could not be reached
+            TimeoutError: A page has not been received after all retries
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.settimeout(self.timeout)
+        packet_buffer = PacketBuffer()
+        try:
+            start = (0, 0)
+            requested = set([start])
+            self._request(sock, packet_buffer, region_code, start, filter)
+            failures = 0
+            while True:
+                try:
+                    data = sock.recv(65535)
+                except socket.timeout:
+                    failures += 1
+                    if failures > self.retries:
+                        raise TimeoutError('master server %s:%d did not '
+                                           'respond' % self.address)
+                    self._request(sock, packet_buffer, region_code, start,
+                                  filter)
+                    continue
+                batch = self._parse(data)
+                if batch is None:
+                    continue
+                if len(batch.ips) == 0:
+                    yield batch
+                    return
+                last = (batch.ips[-1], batch.ports[-1])
+                if last == (0, 0):
+                    yield batch
+                    return
+                if last in requested:
+                    continue
+                failures = 0
+                start = last
+                requested.add(start)
+                self._request(sock, packet_buffer, region_code, start, filter)
+                yield batch
+        except socket.error, e:
+            raise SteamCondenserError('master server %s:%d failed: %s' %
+                                      (self.address + (e,)))
+        finally:
+            sock.close()
+
+    def servers(self, region_code=REGION_ALL, filter=''):
+        """Yield the addresses of all servers matching the given criteria
+
+        Parameters:
+            region_code: The integer region code of the servers
+            filter: The string filter for the servers, see
+                A2MGetServersBatch2Packet
+
+        Returns:
+            A generator of 2-tuples of the form (str, int) containing the IP
+            address and port of each server
+
+        Raises:
+            TimeoutError: A page has not been received after all retries
+        """
+        for batch in self.batches(region_code, filter):
+            for ip, port in izip(batch.ips, batch.ports):
+                if ip == 0 and port == 0:
+                    return
+                yield inet_ntoa(struct.pack('!I', ip)), port
+
+    @classmethod
+    def _parse(cls, data):
+        """Parse a reply of the master server
+
+        Returns:
+            The M2AServerBatchPacket or None if the data is not a valid
+            M2A_SERVER_BATCH reply
+        """
+        if len(data) < cls._HEADER.size:
+            return None
+        split, header = cls._HEADER.unpack_from(data)
+        if split != -1 or header != SteamPacket.M2A_SERVER_BATCH_HEADER:
+            return None
+        try:
+            return M2AServerBatchPacket(data[cls._HEADER.size:])
+        except PacketFormatError:
+            return None
+
+    def _request(self, sock, packet_buffer, region_code, start, filter):
+        """Send the request for the page starting after the given address,
+        waiting if the request budget has been used up
+        """
+        if self.requests_per_second:
+            delay = self._last_request + 1 / self.requests_per_second - \
+                time.time()
+            if delay > 0:
+                time.sleep(delay)
+        packet = A2MGetServersBatch2Packet(region_code,
+                                           format_server_address(*start),
+                                           filter)
+        sock.sendto(packet_buffer.encode(packet), self.address)
+        self._last_request = time.time()
+
+
+class MasterServerHarvester(object):
+    """Class to collect the complete server list of a master server
+
+    The server list is split into shards, one per combination of region code
+    and filter, which are queried in parallel by separate MasterServer
+    clients. A single world-wide query is slow and may be cut off by the
+    master server, while the shards are smaller and run concurrently.
+
+    The addresses of all shards are merged into a single set of packed
+    48-bit integers, see pack_server_address(), so servers listed in several
+    shards are counted once.
+
+    Attributes:
+        filters: A sequence of string filters, one shard is queried per
+            filter and region code
+        last_stats: A list of ShardStats of the last harvest
+        regions: A sequence of integer region codes
+        threads: The integer maximum number of shards queried at once
+    """
+
+    REGIONS = (MasterServer.REGION_US_EAST_COAST,
+               MasterServer.REGION_US_WEST_COAST,
+               MasterServer.REGION_SOUTH_AMERICA,
+               MasterServer.REGION_EUROPE,
+               MasterServer.REGION_ASIA,
+               MasterServer.REGION_AUSTRALIA,
+               MasterServer.REGION_MIDDLE_EAST,
+               MasterServer.REGION_AFRICA)
+
+    def __init__(self, address, port=27011, regions=REGIONS, filters=('',),
+                 threads=8, **options):
+        """Create a new MasterServerHarvester
+
+        Parameters:
+            address: The string host name or IP address of the master server,
+                optionally followed by `:port`
+            port: The integer port of the master server
+            regions: A sequence of integer region codes
+            filters: A sequence of string filters, e.g. one `\\gamedir\\`
+                or `\\map\\` filter per shard
+            threads: The integer maximum number of shards queried at once
+            **options: Further options for every MasterServer client, like
+                `timeout`, `retries` or `requests_per_second` (the latter
+                applies to each shard separately)
+        """
+        self.address = address
+        self.filters = filters
+        self.last_stats = []
+        self.options = options
+        self.port = port
+        self.regions = regions
+        self.threads = threads
+
+    def harvest(self, base_filter=''):
+        """Query all shards and merge their server lists
+
+        Shards that fail still contribute the servers received before the
+        failure, the error is reported in their ShardStats.
+
+        Parameters:
+            base_filter: A string filter prepended to the filter of every
+                shard
+
+        Returns:
+            A set of the packed 48-bit integer addresses of all servers
+        """
+        shards = [(region_code, base_filter + filter)
+                  for region_code in self.regions
+                  for filter in self.filters]
+        addresses = set()
+        stats = []
+        pool = ThreadPool(max(1, min(self.threads, len(shards))))
+        try:
+            for region_code, filter, duration, servers, error in \
+                    pool.imap_unordered(self._query, shards):
+                count = len(addresses)
+                addresses |= servers
+                stats.append(ShardStats(region_code, filter, duration,
+                                        len(servers), len(addresses) - count,
+                                        error))
+        finally:
+            pool.close()
+            pool.join()
+        self.last_stats = stats
+        return addresses
+
+    def _query(self, shard):
+        """Query the server list of a single shard
+
+        Returns:
+            A 5-tuple containing the region code, the filter, the float
+            duration in seconds, the set of packed addresses and either None
+            or the SteamCondenserError raised
+        """
+        region_code, filter = shard
+        master = MasterServer(self.address, self.port, **self.options)
+        servers = set()
+        error = None
+        started = time.time()
+        try:
+            for batch in master.batches(region_code, filter):
+                servers.update(pack_server_address(ip, port)
+                               for ip, port in izip(batch.ips, batch.ports))
+        except SteamCondenserError, e:
+            error = e
+        servers.discard(0)
+        return region_code, filter, time.time() - started, servers, error
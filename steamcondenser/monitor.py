@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the new BSD License.
+#
+# Copyright (c) 2013 Sebastian Staudt
+
+
+from __future__ import absolute_import
+
+import heapq
+import threading
+import time
+from collections import namedtuple
+
+from .scanner import INFO, PLAYERS, ServerScanner
+
+
+SERVER_UP = 'up'
+SERVER_DOWN = 'down'
+MAP_CHANGE = 'map'
+PLAYER_JOIN = 'join'
+PLAYER_LEAVE = 'leave'
+
+ServerEvent = namedtuple('ServerEvent', ['timestamp', 'address', 'type',
+                                         'old', 'new'])
+
+
+class _ServerState(object):
+    """The monitoring state of a single game server"""
+
+    __slots__ = ('due', 'failures', 'info', 'interval', 'players', 'up')
+
+    def __init__(self, interval):
+        self.due = 0
+        self.failures = 0
+        self.info = None
+        self.interval = interval
+        self.players = {}
+        self.up = False
+
+
+class ServerMonitor(object):
+    """Class to continuously monitor many game servers
+
+    Every server is kept on a priority heap ordered by the time it is due
+    next. The servers due are queried together by a ServerScanner, the
+    players are only queried for servers that are or were populated.
+
+    The interval of a server adapts to its activity: it is halved whenever
+    players joined or left since the last sample and grows by half
+    otherwise, within `min_interval` and `max_interval`. Servers that do
+    not respond are retried with an exponentially growing interval and
+    reported down after `down_after` consecutive failures.
+
+    Instead of snapshots the monitor reports ServerEvents whenever a server
+    comes up or goes down, changes its map or a player joins or leaves.
+    `old` and `new` hold the previous and current server information, map
+    name or player name, depending on the event type.
+
+    Attributes:
+        down_after: The integer number of consecutive failures after which a
+            server is reported down
+        interval: The float number of seconds between the first samples of
+            a server
+        max_interval: The float maximum number of seconds between two
+            samples of a server
+        min_interval: The float minimum number of seconds between two
+            samples of a server
+        scanner: The ServerScanner used to query the servers
+    """
+
+    def __init__(self, interval=60, min_interval=10, max_interval=600,
+                 down_after=3, scanner=None):
+        """Create a new ServerMonitor
+
+        Parameters:
+            interval: The float number of seconds between the first samples
+                of a server
+            min_interval: The float minimum number of seconds between two
+                samples of a server
+            max_interval: The float maximum number of seconds between two
+                samples of a server
+            down_after: The integer number of consecutive failures after
+                which a server is reported down
+            scanner: The ServerScanner used to query the servers (optional)
+        """
+        if scanner is None:
+            scanner = ServerScanner()
+        self.down_after = down_after
+        self.interval = interval
+        self.max_interval = max_interval
+        self.min_interval = min_interval
+        self.scanner = scanner
+        self._schedule = []
+        self._servers = {}
+        self._stopped = threading.Event()
+
+    def __contains__(self, address):
+        return address in self._servers
+
+    def __len__(self):
+        return len(self._servers)
+
+    def add(self, address):
+        """Start monitoring the specified server
+
+        The server is sampled in the next sweep.
+
+        Parameters:
+            address: The 2-tuple (str, int) address of the server
+        """
+        if address not in self._servers:
+            self._servers[address] = _ServerState(self.interval)
+            heapq.heappush(self._schedule, (0, address))
+
+    def info(self, address):
+        """Return the last known information of the specified server or None
+        """
+        return self._servers[address].info
+
+    def interval_of(self, address):
+        """Return the current float interval of the specified server"""
+        return self._servers[address].interval
+
+    def next_sweep(self):
+        """Return the float UNIX timestamp at which the next server is due or
+        None if no servers are monitored
+        """
+        while self._schedule and not self._scheduled(*self._schedule[0]):
+            heapq.heappop(self._schedule)
+        if not self._schedule:
+            return None
+        return self._schedule[0][0]
+
+    def remove(self, address):
+        """Stop monitoring the specified server"""
+        del self._servers[address]
+
+    def run(self, callback):
+        """Sweep repeatedly until stop() is called
+
+        Parameters:
+            callback: A callable that gets passed every ServerEvent
+        """
+        self._stopped.clear()
+        while not self._stopped.is_set():
+            next_sweep = self.next_sweep()
+            if next_sweep is None:
+                delay = self.min_interval
+            else:
+                delay = next_sweep - time.time()
+            if delay > 0:
+                self._stopped.wait(delay)
+                continue
+            for event in self.sweep():
+                callback(event)
+
+    def stop(self):
+        """Stop a running monitor after its current sweep"""
+        self._stopped.set()
+
+    def sweep(self, now=None):
+        """Sample all servers that are due
+
+        Parameters:
+            now: The float UNIX timestamp to use as the current time
+                (optional)
+
+        Returns:
+            A list of the ServerEvents caused by the samples
+        """
+        if now is None:
+            now = time.time()
+        due = []
+        while self._schedule and self._schedule[0][0] <= now:
+            entry = heapq.heappop(self._schedule)
+            if self._scheduled(*entry):
+                self._servers[entry[1]].due = None
+                due.append(entry[1])
+        if not due:
+            return []
+
+        events = []
+        populated = []
+        infos = {}
+        try:
+            for result in self.scanner.scan(due, (INFO,)):
+                state = self._servers.get(result.address)
+                if state is None:
+                    continue
+                if result.error is not None:
+                    self._failed(result.address, state, now, events)
+                    continue
+                infos[result.address] = result.info
+                if result.info.number_of_players or state.players:
+                    populated.append(result.address)
+
+            players = {}
+            if populated:
+                for result in self.scanner.scan(populated, (PLAYERS,)):
+                    if result.error is None:
+                        players[result.address] = result.players
+
+            for address, info in infos.iteritems():
+                state = self._servers.get(address)
+                if state is not None:
+                    self._sampled(address, state, info,
+                                  players.get(address), now, events)
+        finally:
+            for address in due:
+                state = self._servers.get(address)
+                if state is not None and state.due is None:
+                    self._reschedule(address, state, now + state.interval)
+        return events
+
+    def _failed(self, address, state, now, events):
+        """Back off a server that did not respond"""
+        state.failures += 1
+        if state.up and state.failures >= self.down_after:
+            state.up = False
+            state.players = {}
+            events.append(ServerEvent(now, address, SERVER_DOWN, state.info,
+                                      None))
+        interval = min(self.max_interval,
+                       state.interval * 2 ** state.failures)
+        self._reschedule(address, state, now + interval)
+
+    def _sampled(self, address, state, info, players, now, events):
+        """Compare a sample with the previous one and reschedule the server
+        """
+        if not state.up:
+            events.append(ServerEvent(now, address, SERVER_UP, state.info,
+                                      info))
+            state.up = True
+        elif info.map_name != state.info.map_name:
+            events.append(ServerEvent(now, address, MAP_CHANGE,
+                                      state.info.map_name, info.map_name))
+        state.failures = 0
+        state.info = info
+
+        churn = 0
+        if players is not None or not info.number_of_players:
+            counts = {}
+            for player in players or ():
+                counts[player.name] = counts.get(player.name, 0) + 1
+            for name, count in state.players.iteritems():
+                for i in xrange(count - counts.get(name, 0)):
+                    events.append(ServerEvent(now, address, PLAYER_LEAVE,
+                                              name, None))
+                    churn += 1
+            for name, count in counts.iteritems():
+                for i in xrange(count - state.players.get(name, 0)):
+                    events.append(ServerEvent(now, address, PLAYER_JOIN,
+                                              None, name))
+                    churn += 1
+            state.players = counts
+
+        if churn:
+            state.interval = max(self.min_interval, state.interval / 2.0)
+        else:
+            state.interval = min(self.max_interval, state.interval * 1.5)
+        self._reschedule(address, state, now + state.interval)
+
+    def _reschedule(self, address, state, due):
+        state.due = due
+        heapq.heappush(self._schedule, (due, address))
+
+    def _scheduled(self, due, address):
+        """Return whether a heap entry is the current one of its server"""
+        state = self._servers.get(address)
+        return state is not None and state.due == due
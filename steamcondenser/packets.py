@@ -8,17 +8,151 @@
 
 from __future__ import absolute_import, division
 
+import bz2
 import struct
+import sys
+import time
+import zlib
+from array import array
+from collections import deque, namedtuple
+from itertools import izip
 from socket import inet_ntoa
 
 from .errors import PacketFormatError
 
 
+if array('I').itemsize == 4:
+    _UINT32 = 'I'
+else:
+    _UINT32 = 'L'
+
+try:
+    _memoryview = memoryview
+except NameError:
+    _memoryview = None
+
+_SERVER_ADDRESS_SIZE = 6
+
+
+def decode_server_addresses(data, offset=0):
+    """Decode a block of packed server addresses as sent by master servers
+
+    Every address consists of a big-endian IPv4 address and a big-endian
+    port. Instead of decoding the addresses one by one, the bytes of all
+    addresses and all ports are gathered using extended slices, so the whole
+    block is decoded by a few operations regardless of its size.
+
+    Parameters:
+        data: A string or buffer containing the packed addresses
+        offset: The integer position of the first address in data
+
+    Returns:
+        A 2-tuple containing an array of the unsigned 32-bit IP addresses and
+        an array of the unsigned 16-bit ports, both in host byte order
+
+    Raises:
+        PacketFormatError: The data contains a truncated address
+    """
+    if _memoryview is not None and isinstance(data, _memoryview):
+        data = data.tobytes()
+    if (len(data) - offset) % _SERVER_ADDRESS_SIZE:
+        raise PacketFormatError('Master query response has a truncated'
+                                ' server address')
+    count = (len(data) - offset) // _SERVER_ADDRESS_SIZE
+    ip_data = bytearray(4 * count)
+    port_data = bytearray(2 * count)
+    for i in xrange(4):
+        ip_data[i::4] = data[offset + i::_SERVER_ADDRESS_SIZE]
+    for i in xrange(2):
+        port_data[i::2] = data[offset + 4 + i::_SERVER_ADDRESS_SIZE]
+    ips = array(_UINT32, str(ip_data))
+    ports = array('H', str(port_data))
+    if sys.byteorder == 'little':
+        ips.byteswap()
+        ports.byteswap()
+    return ips, ports
+
+
+def format_server_address(ip, port):
+    """Return the string representation `ip:port` of a server address
+
+    Parameters:
+        ip: The unsigned 32-bit integer IP address
+        port: The integer port
+    """
+    return '%s:%d' % (inet_ntoa(struct.pack('!I', ip)), port)
+
+
+def pack_server_address(ip, port):
+    """Pack a server address into a single 48-bit integer
+
+    Parameters:
+        ip: The unsigned 32-bit integer IP address
+        port: The integer port
+    """
+    return (ip << 16) | port
+
+
+def unpack_server_address(packed):
+    """Return the 2-tuple (str, int) address of a packed server address
+
+    Parameters:
+        packed: The 48-bit integer created by pack_server_address()
+    """
+    return inet_ntoa(struct.pack('!I', packed >> 16)), int(packed & 0xFFFF)
+
+
+class PacketBuffer(object):
+    """Class to encode packets into a single reusable buffer
+
+    Encoding a packet writes it into the buffer and returns a memoryview of
+    the written bytes, so sending many packets does not allocate a new
+    string per packet. The buffer grows if a packet does not fit. On Python
+    2.6, which lacks memoryview, a copy of the bytes is returned instead.
+    """
+
+    def __init__(self, size=1400):
+        """Create a new PacketBuffer
+
+        Parameters:
+            size: The initial integer size of the buffer in bytes
+        """
+        self.buffer = bytearray(size)
+        self._view = self._new_view()
+
+    def encode(self, packet):
+        """Encode a packet into the buffer
+
+        Parameters:
+            packet: The SteamPacket to encode
+
+        Returns:
+            A memoryview of the encoded packet. It is only valid until the
+            next packet is encoded.
+        """
+        if len(packet) > len(self.buffer):
+            self.buffer = bytearray(len(packet))
+            self._view = self._new_view()
+        size = packet.pack_into(self.buffer)
+        if self._view is None:
+            return str(self.buffer[:size])
+        return self._view[:size]
+
+    def _new_view(self):
+        """Return a memoryview of the buffer or None on Python 2.6"""
+        if _memoryview is None:
+            return None
+        return _memoryview(self.buffer)
+
+
 class SteamPacket(object):
     """Base Steam packet class
 
     Implements the basic functionality for most of the packets used in
     communication with master, Source or GoldSrc severs.
+
+    Packets are binary data, `str(packet)` returns the encoded bytes.
+    pack_into() writes a packet into an existing buffer instead.
     """
 
     A2M_GET_SERVERS_BATCH2_HEADER = 0x31
@@ -38,6 +172,8 @@ class SteamPacket(object):
     S2C_CONNREJECT_HEADER = 0x39
     S2C_CHALLENGE_HEADER = 0x41
 
+    _HEADER = struct.Struct('<lB')
+
     def __init__(self, header_data, content_data=''):
         """Create a new SteamPacket based on the given parameters
 
@@ -45,15 +181,32 @@ class SteamPacket(object):
             header_data: The packet header
             content_data: The raw packet data
         """
-        self.content_data = unicode(content_data)
+        self.content_data = content_data
         self.header_data = header_data
 
+    def __len__(self):
+        return self._HEADER.size + len(self.content_data)
+
     def __str__(self):
-        return unicode(self).encode('utf-8')
+        data = bytearray(len(self))
+        self.pack_into(data)
+        return str(data)
+
+    def pack_into(self, buffer, offset=0):
+        """Encode this packet into a writable buffer
 
-    def __unicode__(self):
-        return struct.pack('!IBs', 0xFFFFFFFF, self.header_data,
-                           self.content_data)
+        Parameters:
+            buffer: The writable buffer, e.g. a bytearray
+            offset: The integer position in the buffer to start writing at
+
+        Returns:
+            The integer number of bytes written
+        """
+        self._HEADER.pack_into(buffer, offset, -1, self.header_data)
+        start = offset + self._HEADER.size
+        end = start + len(self.content_data)
+        buffer[start:end] = self.content_data
+        return end - offset
 
 
 class A2MGetServersBatch2Packet(SteamPacket):
@@ -80,16 +233,26 @@ class A2MGetServersBatch2Packet(SteamPacket):
         `\\proxy\\1`: Request only spectator proxy servers
     """
 
+    _REQUEST = struct.Struct('<BB')
+
     def __init__(self, region_code=0xFF, start_ip='0.0.0.0:0', filter=''):
         super(A2MGetServersBatch2Packet, self).\
-            __init__(SteamPacket.A2M_GET_SERVERS_BATCH2_HEADER)
+            __init__(SteamPacket.A2M_GET_SERVERS_BATCH2_HEADER,
+                     '%s\0%s\0' % (start_ip, filter))
         self.filter = filter
         self.region_code = region_code
         self.start_ip = start_ip
 
-    def __unicode__(self):
-        return struct.pack('!BBss', self.header_data, self.region_code,
-                           self.start_ip, self.filter)
+    def __len__(self):
+        return self._REQUEST.size + len(self.content_data)
+
+    def pack_into(self, buffer, offset=0):
+        self._REQUEST.pack_into(buffer, offset, self.header_data,
+                                self.region_code)
+        start = offset + self._REQUEST.size
+        end = start + len(self.content_data)
+        buffer[start:end] = self.content_data
+        return end - offset
 
 
 class RequestWithChallengePacket(SteamPacket):
@@ -97,9 +260,12 @@ class RequestWithChallengePacket(SteamPacket):
     number to a server
     """
 
-    def __unicode__(self):
-        return struct.pack('!IBb', 0xFFFFFFFF, self.header_data,
-                           int(self.content_data))
+    _CHALLENGE = struct.Struct('<l')
+
+    def __init__(self, header_data, challenge_number=-1):
+        super(RequestWithChallengePacket, self).__init__(
+            header_data, self._CHALLENGE.pack(challenge_number))
+        self.challenge_number = challenge_number
 
 
 class A2SInfoPacket(SteamPacket):
@@ -109,9 +275,21 @@ class A2SInfoPacket(SteamPacket):
     running game, map and number of players.
     """
 
-    def __init__(self):
+    _CHALLENGE = struct.Struct('<l')
+
+    def __init__(self, challenge_number=None):
+        """Create a new A2S_INFO request object
+
+        Parameters:
+            challenge_number: The integer challenge number received from the
+                server if it requires one for info requests (optional)
+        """
+        content_data = 'Source Engine Query\0'
+        if challenge_number is not None:
+            content_data += self._CHALLENGE.pack(challenge_number)
         super(A2SInfoPacket, self).__init__(SteamPacket.A2S_INFO_HEADER,
-                                            u'Source Engine Query\0')
+                                            content_data)
+        self.challenge_number = challenge_number
 
 
 class A2SPlayerPacket(RequestWithChallengePacket):
@@ -153,6 +331,35 @@ class A2SRulesPacket(RequestWithChallengePacket):
                                              challenge_number)
 
 
+class RCONGoldSrcRequest(SteamPacket):
+    """Class to represent a RCON request sent to a GoldSrc server
+
+    GoldSrc RCON requests consist of the connectionless header followed by
+    the plain text of the request, without a header byte.
+    """
+
+    _SPLIT = struct.Struct('<l')
+
+    def __init__(self, request):
+        """Create a new RCON request
+
+        Parameters:
+            request: The string request, e.g. `challenge rcon` or
+                `rcon <challenge> "<password>" <command>`
+        """
+        super(RCONGoldSrcRequest, self).__init__(None, request)
+
+    def __len__(self):
+        return self._SPLIT.size + len(self.content_data)
+
+    def pack_into(self, buffer, offset=0):
+        self._SPLIT.pack_into(buffer, offset, -1)
+        start = offset + self._SPLIT.size
+        end = start + len(self.content_data)
+        buffer[start:end] = self.content_data
+        return end - offset
+
+
 class A2SServerqueryGetchallengePacket(SteamPacket):
     """Class to represent an A2S_SERVERQUERY_GETCHALLENGE request
 
@@ -170,26 +377,720 @@ class M2AServerBatchPacket(SteamPacket):
 
     Contains a list of IP addresses and ports of game servers matching the
     requested criteria
+
+    The addresses are decoded in a single pass into compact arrays, string
+    representations are only created if they are requested.
+
+    Attributes:
+        ips: An array of the unsigned 32-bit integer IP addresses
+        ports: An array of the integer ports
     """
 
+    _MARKER = struct.Struct('<B')
+
     def __init__(self, data):
         """Create a new M2A_SERVER_BATCH response object
 
         Parameters:
-            data: The raw packet data replied from the server
+            data: The raw packet data replied from the server, without the
+                packet header
 
         Raises:
             PacketFormatError: The packet data was not well formatted
         """
         super(M2AServerBatchPacket, self).\
             __init__(SteamPacket.M2A_SERVER_BATCH_HEADER, data)
-        if ord(self.content_data.pop()) != 0x0A:
+        if not data or self._MARKER.unpack_from(data)[0] != 0x0A:
             raise PacketFormatError('Master query response is missing'
                                     ' additional 0x0A byte')
-        self.servers = []
-        data = self.content_data
-        while len(data) > 0:
-            ip = inet_ntoa(data[:4])
-            port = struct.unpack('!H', data[4:2])
-            self.ervers.append(u'%s:%d' % ip, port)
-            data = data[6:]
+        self.ips, self.ports = decode_server_addresses(data, 1)
+
+    def address(self, index):
+        """Return the string representation of the address at index"""
+        return format_server_address(self.ips[index], self.ports[index])
+
+    @property
+    def servers(self):
+        """Return a list of the string representations `ip:port` of all
+        addresses in this batch
+        """
+        return [format_server_address(ip, port)
+                for ip, port in izip(self.ips, self.ports)]
+
+
+class PacketReader(object):
+    """Class to decode the fields of a packet one after another
+
+    The reader keeps a single offset that moves forward with every field
+    read, so fields are decoded in place without slicing the data first.
+
+    Attributes:
+        data: The string data of the packet
+        offset: The integer position of the next field
+    """
+
+    __slots__ = ('data', 'offset')
+
+    _BYTE = struct.Struct('<B')
+    _FLOAT = struct.Struct('<f')
+    _LONG = struct.Struct('<l')
+    _LONGLONG = struct.Struct('<Q')
+    _SHORT = struct.Struct('<h')
+
+    def __init__(self, data, offset=0):
+        """Create a new PacketReader
+
+        Parameters:
+            data: A string, bytearray or memoryview containing the packet
+            offset: The integer position of the first field
+        """
+        if _memoryview is not None and isinstance(data, _memoryview):
+            data = data.tobytes()
+        elif isinstance(data, bytearray):
+            data = str(data)
+        self.data = data
+        self.offset = offset
+
+    def __len__(self):
+        return len(self.data) - self.offset
+
+    def byte(self):
+        """Read an unsigned 8-bit integer"""
+        return self.unpack(self._BYTE)[0]
+
+    def float(self):
+        """Read a 32-bit float"""
+        return self.unpack(self._FLOAT)[0]
+
+    def long(self):
+        """Read a signed 32-bit integer"""
+        return self.unpack(self._LONG)[0]
+
+    def longlong(self):
+        """Read an unsigned 64-bit integer"""
+        return self.unpack(self._LONGLONG)[0]
+
+    def short(self):
+        """Read a signed 16-bit integer"""
+        return self.unpack(self._SHORT)[0]
+
+    def string(self):
+        """Read a null-terminated string"""
+        end = self.data.index('\0', self.offset)
+        value = self.data[self.offset:end]
+        self.offset = end + 1
+        return value
+
+    def unpack(self, fmt):
+        """Read several fields at once
+
+        Parameters:
+            fmt: A precompiled struct.Struct describing the fields
+
+        Returns:
+            A tuple of the decoded fields
+        """
+        values = fmt.unpack_from(self.data, self.offset)
+        self.offset += fmt.size
+        return values
+
+
+GoldSrcServerInfo = namedtuple('GoldSrcServerInfo', [
+    'game_ip', 'server_name', 'map_name', 'game_directory',
+    'game_description', 'number_of_players', 'max_players',
+    'network_version', 'dedicated', 'operating_system', 'password_needed',
+    'secure', 'number_of_bots'])
+
+SourceServerInfo = namedtuple('SourceServerInfo', [
+    'protocol_version', 'server_name', 'map_name', 'game_directory',
+    'game_description', 'app_id', 'number_of_players', 'max_players',
+    'number_of_bots', 'dedicated', 'operating_system', 'password_needed',
+    'secure', 'game_version', 'server_port', 'server_id', 'tv_port',
+    'tv_name', 'server_tags', 'game_id'])
+
+SteamPlayer = namedtuple('SteamPlayer', ['name', 'score', 'connect_time'])
+
+
+class S2CChallengePacket(SteamPacket):
+    """Class to represent an S2C_CHALLENGE response
+
+    Contains the challenge number a server requires for further requests
+
+    Attributes:
+        challenge_number: The integer challenge number
+    """
+
+    def __init__(self, data):
+        """Create a new S2C_CHALLENGE response object
+
+        Parameters:
+            data: The raw packet data replied from the server, without the
+                packet header
+        """
+        super(S2CChallengePacket, self).\
+            __init__(SteamPacket.S2C_CHALLENGE_HEADER, data)
+        self.challenge_number = PacketReader(data).long()
+
+
+class S2AInfo2Packet(SteamPacket):
+    """Class to represent an S2A_INFO2 response of a Source server
+
+    The extra data fields following the game version are decoded if the
+    server sends them, missing fields are None.
+
+    Attributes:
+        info: A SourceServerInfo containing the information about the
+            server
+    """
+
+    EDF_GAME_ID = 0x01
+    EDF_SERVER_ID = 0x10
+    EDF_SERVER_TAGS = 0x20
+    EDF_SOURCE_TV = 0x40
+    EDF_SERVER_PORT = 0x80
+
+    _COUNTS = struct.Struct('<HBBBccBB')
+
+    def __init__(self, data):
+        """Create a new S2A_INFO2 response object
+
+        Parameters:
+            data: The raw packet data replied from the server, without the
+                packet header
+        """
+        super(S2AInfo2Packet, self).\
+            __init__(SteamPacket.S2A_INFO2_HEADER, data)
+        reader = PacketReader(data)
+        protocol_version = reader.byte()
+        server_name = reader.string()
+        map_name = reader.string()
+        game_directory = reader.string()
+        game_description = reader.string()
+        (app_id, number_of_players, max_players, number_of_bots, dedicated,
+         operating_system, password_needed, secure) = \
+            reader.unpack(self._COUNTS)
+        game_version = reader.string()
+        server_port = server_id = tv_port = tv_name = server_tags = \
+            game_id = None
+        if len(reader):
+            edf = reader.byte()
+            if edf & self.EDF_SERVER_PORT:
+                server_port = reader.short() & 0xFFFF
+            if edf & self.EDF_SERVER_ID:
+                server_id = reader.longlong()
+            if edf & self.EDF_SOURCE_TV:
+                tv_port = reader.short() & 0xFFFF
+                tv_name = reader.string()
+            if edf & self.EDF_SERVER_TAGS:
+                server_tags = reader.string()
+            if edf & self.EDF_GAME_ID:
+                game_id = reader.longlong()
+        self.info = SourceServerInfo(
+            protocol_version, server_name, map_name, game_directory,
+            game_description, app_id, number_of_players, max_players,
+            number_of_bots, dedicated, operating_system,
+            bool(password_needed), bool(secure), game_version, server_port,
+            server_id, tv_port, tv_name, server_tags, game_id)
+
+
+class S2AInfoDetailedPacket(SteamPacket):
+    """Class to represent an S2A_INFO_DETAILED response of a GoldSrc server
+
+    Attributes:
+        info: A GoldSrcServerInfo containing the information about the
+            server
+    """
+
+    _COUNTS = struct.Struct('<BBBccBB')
+    _MOD = struct.Struct('<xllBB')
+    _SECURITY = struct.Struct('<BB')
+
+    def __init__(self, data):
+        """Create a new S2A_INFO_DETAILED response object
+
+        Parameters:
+            data: The raw packet data replied from the server, without the
+                packet header
+        """
+        super(S2AInfoDetailedPacket, self).\
+            __init__(SteamPacket.S2A_INFO_DETAILED_HEADER, data)
+        reader = PacketReader(data)
+        game_ip = reader.string()
+        server_name = reader.string()
+        map_name = reader.string()
+        game_directory = reader.string()
+        game_description = reader.string()
+        (number_of_players, max_players, network_version, dedicated,
+         operating_system, password_needed, is_mod) = \
+            reader.unpack(self._COUNTS)
+        secure = number_of_bots = None
+        if is_mod:
+            reader.string()
+            reader.string()
+            reader.unpack(self._MOD)
+        if len(reader) >= self._SECURITY.size:
+            secure, number_of_bots = reader.unpack(self._SECURITY)
+            secure = bool(secure)
+        self.info = GoldSrcServerInfo(
+            game_ip, server_name, map_name, game_directory,
+            game_description, number_of_players, max_players,
+            network_version, dedicated, operating_system,
+            bool(password_needed), secure, number_of_bots)
+
+
+class S2APlayerPacket(SteamPacket):
+    """Class to represent an S2A_PLAYER response
+
+    Attributes:
+        players: A list of SteamPlayers containing the name, score and
+            connection time in seconds of each player
+    """
+
+    _PLAYER = struct.Struct('<lf')
+
+    def __init__(self, data):
+        """Create a new S2A_PLAYER response object
+
+        Parameters:
+            data: The raw packet data replied from the server, without the
+                packet header
+        """
+        super(S2APlayerPacket, self).\
+            __init__(SteamPacket.S2A_PLAYER_HEADER, data)
+        reader = PacketReader(data)
+        string = reader.string
+        unpack = reader.unpack
+        player = self._PLAYER
+        players = []
+        for i in xrange(reader.byte()):
+            reader.offset += 1
+            name = string()
+            score, connect_time = unpack(player)
+            players.append(SteamPlayer(name, score, connect_time))
+        self.players = players
+
+
+class S2ARulesPacket(SteamPacket):
+    """Class to represent an S2A_RULES response
+
+    Attributes:
+        rules: A dict mapping the string names of the server's rules to their
+            string values
+    """
+
+    def __init__(self, data):
+        """Create a new S2A_RULES response object
+
+        Parameters:
+            data: The raw packet data replied from the server, without the
+                packet header
+        """
+        super(S2ARulesPacket, self).\
+            __init__(SteamPacket.S2A_RULES_HEADER, data)
+        reader = PacketReader(data)
+        string = reader.string
+        rules = {}
+        for i in xrange(reader.short() & 0xFFFF):
+            name = string()
+            rules[name] = string()
+        self.rules = rules
+
+
+class RCONGoldSrcResponse(SteamPacket):
+    """Class to represent a RCON reply of a GoldSrc server
+
+    Attributes:
+        response: The string text of the reply
+    """
+
+    def __init__(self, data):
+        """Create a new RCON reply object
+
+        Parameters:
+            data: The raw packet data replied from the server, without the
+                packet header
+        """
+        super(RCONGoldSrcResponse, self).\
+            __init__(SteamPacket.RCON_GOLDSRC_RESPONSE_HEADER, data)
+        self.response = data.rstrip('\0')
+
+
+class SteamPacketFactory(object):
+    """Class to create response packet objects from raw packet data
+
+    The packet classes are looked up in a table indexed by the header byte.
+    """
+
+    _HEADER = struct.Struct('<B')
+    _PACKETS = [None] * 256
+    for _header, _packet_class in (
+            (SteamPacket.S2A_INFO_DETAILED_HEADER, S2AInfoDetailedPacket),
+            (SteamPacket.S2A_INFO2_HEADER, S2AInfo2Packet),
+            (SteamPacket.S2A_PLAYER_HEADER, S2APlayerPacket),
+            (SteamPacket.S2A_RULES_HEADER, S2ARulesPacket),
+            (SteamPacket.S2C_CHALLENGE_HEADER, S2CChallengePacket),
+            (SteamPacket.M2A_SERVER_BATCH_HEADER, M2AServerBatchPacket),
+            (SteamPacket.RCON_GOLDSRC_CHALLENGE_HEADER, RCONGoldSrcResponse),
+            (SteamPacket.RCON_GOLDSRC_NO_CHALLENGE_HEADER,
+             RCONGoldSrcResponse),
+            (SteamPacket.RCON_GOLDSRC_RESPONSE_HEADER, RCONGoldSrcResponse)):
+        _PACKETS[_header] = _packet_class
+    del _header, _packet_class
+
+    @classmethod
+    def packet_from_data(cls, data):
+        """Create a response packet object from the given data
+
+        Parameters:
+            data: The raw string or bytearray data of a single packet,
+                starting with the header byte
+
+        Returns:
+            A SteamPacket subclass instance for the packet type
+
+        Raises:
+            PacketFormatError: The packet type is unknown or its data is
+                malformed
+        """
+        if not data:
+            raise PacketFormatError('empty packet')
+        header, = cls._HEADER.unpack_from(data)
+        packet_class = cls._PACKETS[header]
+        if packet_class is None:
+            raise PacketFormatError('unknown packet with header 0x%02X'
+                                    % header)
+        try:
+            return packet_class(data[1:])
+        except (IndexError, ValueError, struct.error):
+            raise PacketFormatError('malformed packet with header 0x%02X'
+                                    % header)
+
+
+class RCONPacket(object):
+    """Class to represent a packet of the Source RCON protocol
+
+    Source RCON packets are sent over TCP and consist of their size, a
+    request ID, a type and a null-terminated body followed by an empty
+    string.
+
+    Attributes:
+        body: The string body of the packet
+        request_id: The integer ID of the request the packet belongs to
+        type: The integer type of the packet
+    """
+
+    SERVERDATA_AUTH = 3
+    SERVERDATA_AUTH_RESPONSE = 2
+    SERVERDATA_EXECCOMMAND = 2
+    SERVERDATA_RESPONSE_VALUE = 0
+
+    HEADER = struct.Struct('<lll')
+    MIN_SIZE = 10
+
+    def __init__(self, request_id, type, body=''):
+        """Create a new RCON packet
+
+        Parameters:
+            request_id: The integer ID of the request
+            type: The integer type of the packet
+            body: The string body of the packet
+        """
+        self.body = body
+        self.request_id = request_id
+        self.type = type
+
+    def __len__(self):
+        return self.HEADER.size + len(self.body) + 2
+
+    def __str__(self):
+        data = bytearray(len(self))
+        self.pack_into(data)
+        return str(data)
+
+    @classmethod
+    def decode(cls, data, offset=0):
+        """Decode a single packet from a buffer of received data
+
+        Parameters:
+            data: A string or bytearray of the received data
+            offset: The integer position of the packet in data
+
+        Returns:
+            A 2-tuple containing the RCONPacket and the offset following it
+            or None if the packet has not been received completely
+
+        Raises:
+            PacketFormatError: The packet size is invalid
+        """
+        if len(data) - offset < cls.HEADER.size:
+            return None
+        size, request_id, type = cls.HEADER.unpack_from(data, offset)
+        if size < cls.MIN_SIZE:
+            raise PacketFormatError('invalid RCON packet size %d' % size)
+        end = offset + 4 + size
+        if len(data) < end:
+            return None
+        body = str(data[offset + cls.HEADER.size:end - 2])
+        return cls(request_id, type, body), end
+
+    def pack_into(self, buffer, offset=0):
+        """Encode this packet into a writable buffer
+
+        Parameters:
+            buffer: The writable buffer, e.g. a bytearray
+            offset: The integer position in the buffer to start writing at
+
+        Returns:
+            The integer number of bytes written
+        """
+        length = len(self)
+        self.HEADER.pack_into(buffer, offset, length - 4, self.request_id,
+                              self.type)
+        start = offset + self.HEADER.size
+        end = start + len(self.body)
+        buffer[start:end] = self.body
+        buffer[end:end + 2] = '\0\0'
+        return length
+
+
+class RCONAuthRequest(RCONPacket):
+    """Class to represent a Source RCON authentication request"""
+
+    def __init__(self, request_id, password):
+        super(RCONAuthRequest, self).__init__(
+            request_id, RCONPacket.SERVERDATA_AUTH, password)
+
+
+class RCONExecRequest(RCONPacket):
+    """Class to represent a Source RCON command request"""
+
+    def __init__(self, request_id, command):
+        super(RCONExecRequest, self).__init__(
+            request_id, RCONPacket.SERVERDATA_EXECCOMMAND, command)
+
+
+class RCONTerminator(RCONPacket):
+    """Class to represent an empty Source RCON packet
+
+    Servers mirror this packet after the reply to all previous requests,
+    which marks the end of replies split into several packets.
+    """
+
+    def __init__(self, request_id):
+        super(RCONTerminator, self).__init__(
+            request_id, RCONPacket.SERVERDATA_RESPONSE_VALUE)
+
+
+class _SplitSet(object):
+    """The fragments of a single split reply received so far"""
+
+    __slots__ = ('bytes', 'crc', 'deadline', 'fragments', 'received', 'size',
+                 'split_size')
+
+    def __init__(self, total, split_size, deadline):
+        self.bytes = 0
+        self.crc = None
+        self.deadline = deadline
+        self.fragments = [None] * total
+        self.received = 0
+        self.size = None
+        self.split_size = split_size
+
+
+class SplitPacketAssembler(object):
+    """Class to reassemble replies that have been split into several packets
+
+    Replies too large for a single datagram are sent as fragments starting
+    with the header `0xFFFFFFFE`. The fragments are collected per sender and
+    request ID, so they may arrive in any order and duplicates are ignored.
+    Compressed replies of older Source servers are decompressed and verified
+    using their CRC32 checksum.
+
+    As the fragment headers cannot be trusted, only the fragments actually
+    received are stored, fragment sizes above `MAX_SPLIT_SIZE` and replies
+    of more than `MAX_FRAGMENTS` fragments are rejected. Incomplete replies
+    are dropped after `timeout` seconds or, oldest first, when more than
+    `max_sets` replies are incomplete or more than `max_bytes` bytes are
+    stored at the same time.
+
+    Attributes:
+        expired: The integer number of incomplete replies dropped so far
+        goldsrc: Whether the fragments use the GoldSrc format
+        max_bytes: The integer maximum number of bytes of all stored
+            fragments
+        max_sets: The integer maximum number of incomplete replies
+        timeout: The float number of seconds to wait for missing fragments
+    """
+
+    MAX_FRAGMENTS = 128
+    MAX_SPLIT_SIZE = 1400
+    SPLIT_HEADER = -2
+
+    _COMPRESSION = struct.Struct('<LL')
+    _GOLDSRC_HEADER = struct.Struct('<lLB')
+    _GOLDSRC_SPLIT_SIZE = 1400
+    _SOURCE_HEADER = struct.Struct('<lLBBH')
+
+    def __init__(self, goldsrc=False, timeout=5.0, max_sets=1024,
+                 max_bytes=16 << 20):
+        """Create a new SplitPacketAssembler
+
+        Parameters:
+            goldsrc: Whether the fragments use the GoldSrc format
+            timeout: The float number of seconds to wait for missing
+                fragments
+            max_sets: The integer maximum number of incomplete replies
+            max_bytes: The integer maximum number of bytes of all stored
+                fragments
+        """
+        self.expired = 0
+        self.goldsrc = goldsrc
+        self.max_bytes = max_bytes
+        self.max_sets = max_sets
+        self.timeout = timeout
+        self._bytes = 0
+        self._deadlines = deque()
+        self._sets = {}
+
+    def __len__(self):
+        return len(self._sets)
+
+    def add(self, data, key=None):
+        """Add a fragment of a split reply
+
+        Parameters:
+            data: The string data of the datagram, starting with the split
+                header `0xFFFFFFFE`
+            key: A hashable identifying the sender of the fragment, usually
+                its address
+
+        Returns:
+            The string data of the complete reply, starting with the header
+            `0xFFFFFFFF`, or None if fragments are still missing
+
+        Raises:
+            PacketFormatError: The fragment or the reassembled reply is
+                malformed
+        """
+        try:
+            if self.goldsrc:
+                header, request_id, number = \
+                    self._GOLDSRC_HEADER.unpack_from(data)
+                total = number & 0x0F
+                number >>= 4
+                split_size = self._GOLDSRC_SPLIT_SIZE
+                offset = self._GOLDSRC_HEADER.size
+            else:
+                header, request_id, total, number, split_size = \
+                    self._SOURCE_HEADER.unpack_from(data)
+                offset = self._SOURCE_HEADER.size
+        except struct.error:
+            raise PacketFormatError('truncated split packet header')
+        if header != self.SPLIT_HEADER:
+            raise PacketFormatError('not a split packet')
+        if number >= total or split_size == 0 or \
+                split_size > self.MAX_SPLIT_SIZE or \
+                total > self.MAX_FRAGMENTS:
+            raise PacketFormatError('invalid split packet %d/%d' %
+                                    (number + 1, total))
+        compressed = not self.goldsrc and request_id & 0x80000000
+
+        now = time.time()
+        self.expire(now)
+        key = (key, request_id)
+        split_set = self._sets.get(key)
+        if split_set is None:
+            while len(self._sets) >= self.max_sets:
+                self._drop_oldest()
+            split_set = _SplitSet(total, split_size, now + self.timeout)
+            self._sets[key] = split_set
+            self._deadlines.append((split_set.deadline, key, split_set))
+        elif len(split_set.fragments) != total or \
+                split_set.split_size != split_size:
+            self._discard(key)
+            raise PacketFormatError('inconsistent split packet %d/%d' %
+                                    (number + 1, total))
+
+        if split_set.fragments[number] is not None:
+            return None
+        if compressed and number == 0:
+            try:
+                split_set.size, split_set.crc = \
+                    self._COMPRESSION.unpack_from(data, offset)
+            except struct.error:
+                self._discard(key)
+                raise PacketFormatError('truncated split packet header')
+            offset += self._COMPRESSION.size
+        length = len(data) - offset
+        if length > split_size:
+            self._discard(key)
+            raise PacketFormatError('split packet exceeds its size')
+        split_set.fragments[number] = data[offset:]
+        split_set.bytes += length
+        split_set.received += 1
+        self._bytes += length
+        if split_set.received == total:
+            self._discard(key)
+            return self._assemble(split_set, compressed)
+
+        while self._bytes > self.max_bytes and self._sets:
+            self._drop_oldest()
+        return None
+
+    def expire(self, now=None):
+        """Drop all incomplete replies that have timed out
+
+        Parameters:
+            now: The float current time (optional)
+        """
+        if now is None:
+            now = time.time()
+        while self._deadlines and self._deadlines[0][0] <= now:
+            deadline, key, split_set = self._deadlines.popleft()
+            if self._sets.get(key) is split_set:
+                self._discard(key)
+                self.expired += 1
+
+    def _assemble(self, split_set, compressed):
+        """Join the fragments of a complete reply and decompress it
+
+        Compressed replies are decompressed fragment by fragment and given
+        up as soon as they exceed their declared size, which itself may not
+        exceed `max_bytes`.
+        """
+        if not compressed:
+            return ''.join(split_set.fragments)
+        if split_set.size > self.max_bytes:
+            raise PacketFormatError('compressed split packet exceeds %d '
+                                    'bytes' % self.max_bytes)
+        decompressor = bz2.BZ2Decompressor()
+        chunks = []
+        size = 0
+        try:
+            for fragment in split_set.fragments:
+                chunk = decompressor.decompress(fragment)
+                size += len(chunk)
+                if size > split_set.size:
+                    raise PacketFormatError('compressed split packet exceeds '
+                                            'its size')
+                chunks.append(chunk)
+        except (IOError, EOFError, ValueError):
+            raise PacketFormatError('corrupt compressed split packet')
+        data = ''.join(chunks)
+        if size != split_set.size or \
+                zlib.crc32(data) & 0xFFFFFFFF != split_set.crc:
+            raise PacketFormatError('CRC mismatch of compressed split packet')
+        return data
+
+    def _drop_oldest(self):
+        """Drop the oldest incomplete reply"""
+        while self._deadlines:
+            deadline, key, split_set = self._deadlines.popleft()
+            if self._sets.get(key) is split_set:
+                self._discard(key)
+                self.expired += 1
+                return
+
+    def _discard(self, key):
+        """Forget an incomplete reply and release its stored bytes"""
+        self._bytes -= self._sets.pop(key).bytes
@@ -0,0 +1,436 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the new BSD License.
+#
+# Copyright (c) 2013 Sebastian Staudt
+
+
+from __future__ import absolute_import, division
+
+import errno
+import heapq
+import os
+import select
+import socket
+import struct
+import threading
+import time
+
+from .cache import LRUCache
+from .errors import PacketFormatError, SteamCondenserError, TimeoutError
+from .packets import A2SInfoPacket, A2SPlayerPacket, A2SRulesPacket, \
+    PacketBuffer, SplitPacketAssembler, SteamPacket, SteamPacketFactory
+
+
+class _Upstream(object):
+    """The state of a query sent to a game server on behalf of clients"""
+
+    __slots__ = ('address', 'attempt', 'challenged', 'header', 'started',
+                 'token', 'waiters')
+
+    def __init__(self, address, header, started):
+        self.address = address
+        self.attempt = 0
+        self.challenged = 0
+        self.header = header
+        self.started = started
+        self.token = None
+        self.waiters = []
+
+
+class A2SProxy(object):
+    """Class to answer A2S queries of local clients from a shared cache
+
+    Clients send their queries over UDP or a Unix datagram socket, prefixed
+    with the address of the game server and a null byte, e.g.
+    `10.0.0.1:27015\\0\\xFF\\xFF\\xFF\\xFFTSource Engine Query\\0`. The proxy
+    replies with the complete reply of the game server, split replies are
+    reassembled and challenges are handled by the proxy, so clients never
+    see `S2C_CHALLENGE` replies. A2SProxyClient implements this protocol.
+    Game servers must be given by their numeric IPv4 address, as replies are
+    matched by the address they arrive from and the proxy never blocks on
+    name lookups; other queries are ignored.
+
+    Replies are cached for `ttl` seconds. While a query to a game server is
+    in flight, further client queries for the same server and query type
+    wait for its reply instead of causing another query. Clients receive no
+    reply if the game server does not respond.
+
+    Attributes:
+        cache: The LRUCache of replies, its hits and misses count the client
+            queries answered from the cache or not
+        coalesced: The integer number of client queries that waited for a
+            query already in flight
+        latency_max: The maximum float latency of game server queries
+        latency_total: The sum of the float latencies of game server queries
+        requests: The integer number of client queries received
+        retries: The integer number of times a query is repeated after a
+            timeout
+        timeout: The float number of seconds to wait for a game server
+        upstream_errors: The integer number of game server queries that
+            failed
+        upstream_queries: The integer number of game server queries that
+            succeeded
+    """
+
+    _HEADER = struct.Struct('<l')
+
+    _QUERIES = (SteamPacket.A2S_INFO_HEADER, SteamPacket.A2S_PLAYER_HEADER,
+                SteamPacket.A2S_RULES_HEADER)
+
+    _QUERY_HEADERS = {
+        SteamPacket.S2A_INFO2_HEADER: SteamPacket.A2S_INFO_HEADER,
+        SteamPacket.S2A_INFO_DETAILED_HEADER: SteamPacket.A2S_INFO_HEADER,
+        SteamPacket.S2A_PLAYER_HEADER: SteamPacket.A2S_PLAYER_HEADER,
+        SteamPacket.S2A_RULES_HEADER: SteamPacket.A2S_RULES_HEADER,
+    }
+
+    def __init__(self, address=('127.0.0.1', 27099), unix_path=None, ttl=5,
+                 timeout=1.0, retries=1, cache_size=65536):
+        """Create a new A2SProxy
+
+        Parameters:
+            address: The 2-tuple (str, int) address to accept UDP queries on
+                or None
+            unix_path: The string path of a Unix datagram socket to accept
+                queries on (optional)
+            ttl: The float number of seconds replies are cached
+            timeout: The float number of seconds to wait for a game server
+            retries: The integer number of times a query is repeated after a
+                timeout
+            cache_size: The integer maximum number of cached replies
+        """
+        self.cache = LRUCache(cache_size, ttl)
+        self.coalesced = 0
+        self.latency_max = 0.0
+        self.latency_total = 0.0
+        self.requests = 0
+        self.retries = retries
+        self.timeout = timeout
+        self.upstream_errors = 0
+        self.upstream_queries = 0
+        self._assembler = SplitPacketAssembler(timeout=timeout)
+        self._buffer = PacketBuffer()
+        self._challenges = LRUCache(cache_size, 300)
+        self._deadlines = []
+        self._inflight = {}
+        self._stopped = threading.Event()
+        self._tokens = 0
+        self._unix_path = unix_path
+
+        self._clients = []
+        if address is not None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind(address)
+            self._clients.append(sock)
+            self.address = sock.getsockname()
+        else:
+            self.address = None
+        if unix_path is not None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.bind(unix_path)
+            self._clients.append(sock)
+        self._upstream = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for sock in self._clients + [self._upstream]:
+            sock.setblocking(0)
+
+    def close(self):
+        """Close all sockets of this proxy"""
+        for sock in self._clients + [self._upstream]:
+            sock.close()
+        if self._unix_path is not None and os.path.exists(self._unix_path):
+            os.unlink(self._unix_path)
+
+    def counters(self):
+        """Return a dict of the counters of this proxy
+
+        Returns:
+            A dict containing the number of client `requests`, cache `hits`
+            and `misses`, the `hit_rate`, the number of `coalesced` client
+            queries, of `upstream_queries` and `upstream_errors` and the
+            `mean_latency` and `max_latency` of game server queries
+        """
+        if self.upstream_queries:
+            mean_latency = self.latency_total / self.upstream_queries
+        else:
+            mean_latency = None
+        return {
+            'requests': self.requests,
+            'hits': self.cache.hits,
+            'misses': self.cache.misses,
+            'hit_rate': self.cache.hit_rate(),
+            'coalesced': self.coalesced,
+            'upstream_queries': self.upstream_queries,
+            'upstream_errors': self.upstream_errors,
+            'mean_latency': mean_latency,
+            'max_latency': self.latency_max,
+        }
+
+    def serve_forever(self):
+        """Answer queries until stop() is called
+
+        Returns immediately if stop() has already been called.
+        """
+        while not self._stopped.is_set():
+            self.serve_once(0.1)
+
+    def serve_once(self, timeout=None):
+        """Wait for and handle the next queries and replies
+
+        Parameters:
+            timeout: The float maximum number of seconds to wait (optional)
+        """
+        if self._deadlines:
+            wait = max(0, self._deadlines[0][0] - time.time())
+            if timeout is not None:
+                wait = min(wait, timeout)
+        else:
+            wait = timeout
+        try:
+            readable = select.select(self._clients + [self._upstream], [],
+                                     [], wait)[0]
+        except select.error, e:
+            if e.args[0] == errno.EINTR:
+                return
+            raise
+        for sock in readable:
+            while True:
+                try:
+                    data, address = sock.recvfrom(65535)
+                except socket.error:
+                    break
+                if sock is self._upstream:
+                    self._handle_reply(data, address)
+                else:
+                    self._handle_query(sock, data, address)
+        self._expire()
+
+    def stop(self):
+        """Stop serve_forever() after its current iteration"""
+        self._stopped.set()
+
+    def _expire(self):
+        """Retry or fail all game server queries whose reply is overdue"""
+        now = time.time()
+        self._assembler.expire(now)
+        while self._deadlines and self._deadlines[0][0] <= now:
+            deadline, token, key = heapq.heappop(self._deadlines)
+            upstream = self._inflight.get(key)
+            if upstream is None or upstream.token != token:
+                continue
+            if upstream.attempt > self.retries:
+                del self._inflight[key]
+                self.upstream_errors += 1
+            else:
+                self._send(upstream)
+
+    def _handle_query(self, sock, data, client):
+        """Answer a query of a client from the cache or forward it"""
+        target, separator, request = data.partition('\0')
+        if not separator or len(request) < 5 or \
+                self._HEADER.unpack_from(request)[0] != -1:
+            return
+        header = ord(request[4])
+        if header not in self._QUERIES:
+            return
+        try:
+            host, port = target.rsplit(':', 1)
+            address = (host, int(port))
+            if socket.inet_ntoa(socket.inet_aton(host)) != host or \
+                    not 0 < address[1] < 65536:
+                return
+        except (socket.error, ValueError):
+            return
+        self.requests += 1
+        key = (address, header)
+        reply = self.cache.get(key)
+        if reply is not None:
+            self._reply(sock, client, reply)
+            return
+        upstream = self._inflight.get(key)
+        if upstream is not None:
+            self.coalesced += 1
+            upstream.waiters.append((sock, client))
+            return
+        upstream = _Upstream(address, header, time.time())
+        upstream.waiters.append((sock, client))
+        self._inflight[key] = upstream
+        self._send(upstream)
+
+    def _handle_reply(self, data, address):
+        """Handle a reply of a game server
+
+        Datagrams from servers without a query in flight are dropped before
+        they reach the split packet assembler.
+        """
+        if len(data) < 5:
+            return
+        inflight = self._inflight
+        if not any((address, query_header) in inflight
+                   for query_header in self._QUERIES):
+            return
+        if self._HEADER.unpack_from(data)[0] == \
+                SplitPacketAssembler.SPLIT_HEADER:
+            try:
+                data = self._assembler.add(data, address)
+            except PacketFormatError:
+                return
+            if data is None or len(data) < 5:
+                return
+        if self._HEADER.unpack_from(data)[0] != -1:
+            return
+        header = ord(data[4])
+        if header == SteamPacket.S2C_CHALLENGE_HEADER:
+            try:
+                packet = SteamPacketFactory.packet_from_data(data[4:])
+            except PacketFormatError:
+                return
+            self._challenges[address] = packet.challenge_number
+            for query_header in self._QUERIES:
+                upstream = inflight.get((address, query_header))
+                if upstream is not None and upstream.challenged < 2:
+                    upstream.challenged += 1
+                    upstream.attempt = 0
+                    self._send(upstream)
+            return
+        key = (address, self._QUERY_HEADERS.get(header))
+        upstream = self._inflight.pop(key, None)
+        if upstream is None:
+            return
+        latency = time.time() - upstream.started
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+        self.upstream_queries += 1
+        self.cache[key] = data
+        for sock, client in upstream.waiters:
+            self._reply(sock, client, data)
+
+    @staticmethod
+    def _reply(sock, client, data):
+        try:
+            sock.sendto(data, client)
+        except socket.error:
+            pass
+
+    def _send(self, upstream):
+        """Send a query to a game server and schedule its timeout"""
+        challenge = self._challenges.get(upstream.address)
+        if upstream.header == SteamPacket.A2S_INFO_HEADER:
+            packet = A2SInfoPacket(challenge)
+        elif upstream.header == SteamPacket.A2S_PLAYER_HEADER:
+            packet = A2SPlayerPacket(-1 if challenge is None else challenge)
+        else:
+            packet = A2SRulesPacket(-1 if challenge is None else challenge)
+        try:
+            self._upstream.sendto(self._buffer.encode(packet),
+                                  upstream.address)
+        except socket.error:
+            pass
+        upstream.attempt += 1
+        self._tokens += 1
+        upstream.token = self._tokens
+        heapq.heappush(self._deadlines,
+                       (time.time() + self.timeout, upstream.token,
+                        (upstream.address, upstream.header)))
+
+
+class A2SProxyClient(object):
+    """Class to query game servers through an A2SProxy
+
+    Attributes:
+        timeout: The float number of seconds to wait for a reply
+    """
+
+    def __init__(self, proxy_address, timeout=2.0):
+        """Create a new A2SProxyClient
+
+        Parameters:
+            proxy_address: The 2-tuple (str, int) UDP address or the string
+                path of the Unix socket of the proxy
+            timeout: The float number of seconds to wait for a reply
+        """
+        self.timeout = timeout
+        if isinstance(proxy_address, tuple):
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._path = None
+        else:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._path = '%s.%d.%d' % (proxy_address, os.getpid(), id(self))
+            self._socket.bind(self._path)
+        self._socket.settimeout(timeout)
+        self._proxy_address = proxy_address
+
+    def close(self):
+        """Close the socket of this client"""
+        self._socket.close()
+        if self._path is not None and os.path.exists(self._path):
+            os.unlink(self._path)
+
+    def query(self, address, packet):
+        """Send a query through the proxy and return the parsed reply
+
+        Host names are resolved by the client, as the proxy only accepts IP
+        addresses.
+
+        Parameters:
+            address: The 2-tuple (str, int) address of the game server
+            packet: The request packet, e.g. an A2SInfoPacket
+
+        Returns:
+            The reply packet, e.g. an S2AInfo2Packet
+
+        Raises:
+            SteamCondenserError: The host name could not be resolved
+            TimeoutError: The proxy did not reply in time
+        """
+        host, port = address
+        try:
+            host = socket.gethostbyname(host)
+        except socket.error, e:
+            raise SteamCondenserError('could not resolve %s: %s' % (host, e))
+        self._socket.sendto('%s:%d\0%s' % (host, port, packet),
+                            self._proxy_address)
+        try:
+            data = self._socket.recv(65535)
+        except socket.timeout:
+            raise TimeoutError('no reply for %s:%d' % address)
+        return SteamPacketFactory.packet_from_data(data[4:])
+
+
+def main(argv=None):
+    """Run an A2SProxy until it is interrupted
+
+    Usage: `python -m steamcondenser.proxy [--host HOST] [--port PORT]
+    [--unix PATH] [--ttl SECONDS]`
+    """
+    from optparse import OptionParser
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--host', default='127.0.0.1',
+                      help='address to accept UDP queries on')
+    parser.add_option('--port', default=27099, type='int',
+                      help='port to accept UDP queries on, 0 disables UDP')
+    parser.add_option('--unix', metavar='PATH',
+                      help='path of a Unix datagram socket to accept '
+                           'queries on')
+    parser.add_option('--ttl', default=5, type='float',
+                      help='number of seconds replies are cached')
+    parser.add_option('--timeout', default=1.0, type='float',
+                      help='number of seconds to wait for game servers')
+    options = parser.parse_args(argv)[0]
+    address = None
+    if options.port:
+        address = (options.host, options.port)
+    proxy = A2SProxy(address, options.unix, options.ttl, options.timeout)
+    try:
+        proxy.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        proxy.close()
+    for name, value in sorted(proxy.counters().items()):
+        print '%s: %s' % (name, value)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,675 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the new BSD License.
+#
+# Copyright (c) 2013 Sebastian Staudt
+
+
+from __future__ import absolute_import
+
+import errno
+import multiprocessing
+import socket
+import struct
+import threading
+import time
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+
+from .errors import CancelledError, PacketFormatError, RCONAbortedError, \
+    RCONBanError, RCONNoAuthError, SteamCondenserError, TimeoutError
+from .packets import PacketBuffer, RCONAuthRequest, RCONExecRequest, \
+    RCONGoldSrcRequest, RCONGoldSrcResponse, RCONPacket, RCONTerminator, \
+    SplitPacketAssembler, SteamPacketFactory
+
+
+_PEER_CLOSED = (errno.ECONNRESET, errno.EPIPE)
+
+
+RCONResult = namedtuple('RCONResult', ['address', 'output', 'error',
+                                       'duration'])
+
+
+class GoldSrcRCON(object):
+    """Class to run RCON commands on a GoldSrc server
+
+    The RCON challenge of the server is requested once and reused for all
+    commands until the server rejects it, then it is requested again and the
+    commands are repeated once.
+
+    GoldSrc replies carry no request ID and long outputs are sent as several
+    datagrams. So every command is followed by an `echo` of a unique marker,
+    and everything received before the marker is the output of the command.
+    This also allows sending many commands at once in execute_many() and
+    assigning the replies afterwards, assuming they arrive in order.
+
+    Attributes:
+        challenge: The string RCON challenge of the server or None
+        timeout: The float number of seconds to wait for a reply
+    """
+
+    BAD_CHALLENGE = 'Bad challenge.'
+    BAD_PASSWORD = 'Bad rcon_password.'
+    BANNED = 'You have been banned from this server.'
+
+    _HEADER = struct.Struct('<l')
+    _MARKER_PREFIX = '--steamcondenser-'
+    _MARKER = _MARKER_PREFIX + '%d--'
+
+    def __init__(self, address, port=27015, password='', timeout=1.0):
+        """Create a new GoldSrcRCON client
+
+        Parameters:
+            address: The string host name or IP address of the server,
+                optionally followed by `:port`
+            port: The integer port of the server
+            password: The string RCON password of the server
+            timeout: The float number of seconds to wait for a reply
+        """
+        if ':' in address:
+            address, port = address.split(':')
+        self.address = (address, int(port))
+        self.challenge = None
+        self.password = password
+        self.timeout = timeout
+        self._assembler = SplitPacketAssembler(goldsrc=True, timeout=timeout)
+        self._buffer = PacketBuffer()
+        self._markers = 0
+        self._socket = None
+
+    def close(self):
+        """Close the socket of this client"""
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def execute(self, command):
+        """Run a single command and return its output
+
+        Parameters:
+            command: The string command
+
+        Returns:
+            The string output of the command
+
+        Raises:
+            RCONBanError: The client has been banned by the server
+            RCONNoAuthError: The password has been rejected
+            TimeoutError: The server did not reply in time
+        """
+        return self.execute_many([command])[0]
+
+    def execute_many(self, commands):
+        """Run several commands without waiting for each reply
+
+        Parameters:
+            commands: A sequence of string commands
+
+        Returns:
+            A list of the string outputs of the commands
+
+        Raises:
+            RCONBanError: The client has been banned by the server
+            RCONNoAuthError: The password has been rejected
+            TimeoutError: The server did not reply in time
+        """
+        commands = list(commands)
+        outputs = []
+        retried = False
+        while len(outputs) < len(commands):
+            if self.challenge is None:
+                self._request_challenge()
+            try:
+                self._run(commands[len(outputs):], outputs)
+            except _ChallengeRejected:
+                self.challenge = None
+                if retried:
+                    raise RCONNoAuthError('the RCON challenge has been '
+                                          'rejected')
+                retried = True
+        return outputs
+
+    def _receive(self):
+        """Receive the next RCON reply, reassembling split replies
+
+        Returns:
+            The RCONGoldSrcResponse
+        """
+        while True:
+            try:
+                data = self._socket.recv(65535)
+            except socket.timeout:
+                raise TimeoutError('%s:%d did not respond' % self.address)
+            if len(data) < 5:
+                continue
+            if self._HEADER.unpack_from(data)[0] == \
+                    SplitPacketAssembler.SPLIT_HEADER:
+                data = self._assembler.add(data)
+                if data is None or len(data) < 5:
+                    continue
+            try:
+                packet = SteamPacketFactory.packet_from_data(data[4:])
+            except PacketFormatError:
+                continue
+            if isinstance(packet, RCONGoldSrcResponse):
+                return packet
+
+    def _request_challenge(self):
+        """Request a new RCON challenge from the server"""
+        self._send('challenge rcon\n')
+        while True:
+            packet = self._receive()
+            response = packet.response.strip()
+            if response == self.BANNED:
+                raise RCONBanError('banned by %s:%d' % self.address)
+            if response.startswith('hallenge rcon '):
+                self.challenge = response.split()[-1]
+                return
+
+    def _run(self, commands, outputs):
+        """Send commands with their markers and collect their outputs"""
+        markers = []
+        for command in commands:
+            self._markers += 1
+            marker = self._MARKER % self._markers
+            markers.append(marker)
+            self._send('rcon %s "%s" %s' % (self.challenge, self.password,
+                                            command))
+            self._send('rcon %s "%s" echo %s' % (self.challenge,
+                                                 self.password, marker))
+        parts = []
+        while markers:
+            response = self._receive().response
+            message = response.strip()
+            if message == self.BAD_PASSWORD:
+                raise RCONNoAuthError('%s:%d rejected the RCON password' %
+                                      self.address)
+            if message == self.BANNED:
+                raise RCONBanError('banned by %s:%d' % self.address)
+            if message == self.BAD_CHALLENGE or \
+                    message.startswith('No challenge'):
+                raise _ChallengeRejected()
+            if message in markers:
+                for i in xrange(markers.index(message) + 1):
+                    markers.pop(0)
+                    outputs.append(''.join(parts))
+                    parts = []
+            elif not message.startswith(self._MARKER_PREFIX):
+                parts.append(response)
+
+    def _send(self, request):
+        """Send a single request to the server"""
+        if self._socket is None:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._socket.settimeout(self.timeout)
+            self._socket.connect(self.address)
+        packet = RCONGoldSrcRequest(request)
+        self._socket.send(self._buffer.encode(packet))
+
+
+class SourceRCONConnection(object):
+    """Class to represent an authenticated RCON connection to a Source server
+
+    Every command is sent with its own request ID and followed by an empty
+    terminator packet. The server mirrors the terminator after the last
+    packet of the reply, so replies split into several packets are joined
+    until the terminator arrives.
+
+    Many commands may be outstanding at the same time, also from several
+    threads: submit() only sends a command, and whichever thread waits for
+    a result reads the replies and hands them to the requests they belong
+    to. If a reply times out the connection is closed, as its state is
+    unknown afterwards, and all other outstanding commands fail with an
+    RCONAbortedError.
+
+    Attributes:
+        address: The 2-tuple (str, int) address of the server
+        timeout: The float number of seconds to wait for a reply
+    """
+
+    def __init__(self, address, password, timeout=1.0):
+        """Connect to a Source server and authenticate
+
+        Parameters:
+            address: The 2-tuple (str, int) address of the server
+            password: The string RCON password of the server
+            timeout: The float number of seconds to wait for a reply
+
+        Raises:
+            RCONNoAuthError: The password has been rejected
+            TimeoutError: The server did not reply in time
+        """
+        self.address = address
+        self.timeout = timeout
+        self._aborted = False
+        self._closed_by_peer = False
+        self._data = bytearray()
+        self._done = {}
+        self._next_id = 0
+        self._pending = {}
+        self._recv_lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._terminators = {}
+        try:
+            self._socket = socket.create_connection(address, timeout)
+        except socket.timeout:
+            raise TimeoutError('%s:%d did not respond' % address)
+        except socket.error, e:
+            raise SteamCondenserError('could not connect to %s:%d: %s' %
+                                      (address + (e,)))
+        self._authenticate(password)
+
+    @property
+    def closed(self):
+        """Whether this connection has been closed"""
+        return self._socket is None
+
+    @property
+    def closed_by_peer(self):
+        """Whether this connection has been closed by the server"""
+        return self._closed_by_peer
+
+    def close(self):
+        """Close this connection"""
+        sock = self._socket
+        self._socket = None
+        if sock is not None:
+            sock.close()
+
+    def execute(self, command):
+        """Run a single command and return its output
+
+        Parameters:
+            command: The string command
+
+        Returns:
+            The string output of the command
+        """
+        return self.result(self.submit(command))
+
+    def execute_many(self, commands):
+        """Send several commands at once and return their outputs
+
+        Parameters:
+            commands: A sequence of string commands
+
+        Returns:
+            A list of the string outputs of the commands
+        """
+        return [self.result(request_id)
+                for request_id in [self.submit(command)
+                                   for command in commands]]
+
+    def replied(self, request_id):
+        """Return whether any part of the reply to a command has been
+        received
+
+        Data of incomplete packets counts as well, as it may belong to the
+        reply.
+
+        Parameters:
+            request_id: The integer request ID returned by submit()
+        """
+        return bool(self._pending.get(request_id)) or \
+            request_id in self._done or bool(self._data)
+
+    def result(self, request_id):
+        """Wait for the output of a command sent by submit()
+
+        Parameters:
+            request_id: The integer request ID returned by submit()
+
+        Returns:
+            The string output of the command
+
+        Raises:
+            RCONAbortedError: The connection has been closed after another
+                command timed out
+            TimeoutError: The server did not reply in time
+        """
+        while True:
+            with self._recv_lock:
+                if request_id in self._done:
+                    return self._done.pop(request_id)
+                for packet in self._read():
+                    self._dispatch(packet)
+
+    def submit(self, command):
+        """Send a command without waiting for its output
+
+        Parameters:
+            command: The string command
+
+        Returns:
+            The integer request ID to pass to result()
+        """
+        with self._send_lock:
+            request_id = self._new_id()
+            terminator_id = self._new_id()
+            self._pending[request_id] = []
+            self._terminators[terminator_id] = request_id
+            self._send(str(RCONExecRequest(request_id, command)) +
+                       str(RCONTerminator(terminator_id)))
+        return request_id
+
+    def _authenticate(self, password):
+        """Authenticate this connection with the RCON password"""
+        request_id = self._new_id()
+        self._send(str(RCONAuthRequest(request_id, password)))
+        while True:
+            for packet in self._read():
+                if packet.type == RCONPacket.SERVERDATA_AUTH_RESPONSE:
+                    if packet.request_id == -1:
+                        self.close()
+                        raise RCONNoAuthError('%s:%d rejected the RCON '
+                                              'password' % self.address)
+                    return
+
+    def _dispatch(self, packet):
+        """Hand a received packet to the request it belongs to"""
+        parts = self._pending.get(packet.request_id)
+        if parts is not None:
+            parts.append(packet.body)
+            return
+        request_id = self._terminators.pop(packet.request_id, None)
+        if request_id is not None:
+            self._done[request_id] = ''.join(self._pending.pop(request_id))
+
+    def _new_id(self):
+        self._next_id = self._next_id % 0x7FFFFFFF + 1
+        return self._next_id
+
+    def _failed(self, error):
+        """Close this connection after a socket error"""
+        if error.errno in _PEER_CLOSED:
+            self._closed_by_peer = True
+        else:
+            self._aborted = True
+        self.close()
+
+    def _read(self):
+        """Receive data and return the list of complete packets"""
+        if self._socket is None:
+            if self._aborted:
+                raise RCONAbortedError('the connection to %s:%d has been '
+                                       'aborted' % self.address)
+            raise SteamCondenserError('the connection to %s:%d has been '
+                                      'closed' % self.address)
+        try:
+            data = self._socket.recv(65536)
+        except socket.timeout:
+            self._aborted = True
+            self.close()
+            raise TimeoutError('%s:%d did not respond' % self.address)
+        except socket.error, e:
+            self._failed(e)
+            raise SteamCondenserError('connection to %s:%d failed: %s' %
+                                      (self.address + (e,)))
+        if not data:
+            self._closed_by_peer = True
+            self.close()
+            raise SteamCondenserError('%s:%d closed the connection' %
+                                      self.address)
+        self._data.extend(data)
+        packets = []
+        offset = 0
+        while True:
+            try:
+                decoded = RCONPacket.decode(self._data, offset)
+            except PacketFormatError:
+                self._aborted = True
+                self.close()
+                raise
+            if decoded is None:
+                break
+            packet, offset = decoded
+            packets.append(packet)
+        del self._data[:offset]
+        return packets
+
+    def _send(self, data):
+        if self._socket is None:
+            raise _NotSent('the connection to %s:%d has been closed' %
+                           self.address)
+        try:
+            self._socket.sendall(data)
+        except socket.error, e:
+            self._failed(e)
+            raise SteamCondenserError('connection to %s:%d failed: %s' %
+                                      (self.address + (e,)))
+
+
+class SourceRCONPool(object):
+    """Class to keep authenticated RCON connections to many Source servers
+
+    One persistent connection is kept per server and password. As commands
+    are multiplexed over it, it is shared by all threads. Connections that
+    fail are discarded and reopened on the next command.
+
+    Attributes:
+        timeout: The float number of seconds to wait for a reply
+    """
+
+    def __init__(self, timeout=1.0):
+        """Create a new, empty SourceRCONPool
+
+        Parameters:
+            timeout: The float number of seconds to wait for a reply
+        """
+        self.timeout = timeout
+        self._connections = {}
+        self._lock = threading.Lock()
+        self._connecting = {}
+
+    def __len__(self):
+        return len(self._connections)
+
+    def close(self):
+        """Close all connections of this pool"""
+        with self._lock:
+            connections = self._connections.values()
+            self._connections.clear()
+        for connection in connections:
+            connection.close()
+
+    def connection(self, address, password):
+        """Return an authenticated connection to the specified server
+
+        Parameters:
+            address: The 2-tuple (str, int) address of the server
+            password: The string RCON password of the server
+
+        Returns:
+            The SourceRCONConnection
+        """
+        key = (address, password)
+        with self._lock:
+            connection = self._connections.get(key)
+            if connection is not None and not connection.closed:
+                return connection
+            lock = self._connecting.setdefault(key, threading.Lock())
+        with lock:
+            with self._lock:
+                connection = self._connections.get(key)
+                if connection is not None and not connection.closed:
+                    return connection
+            connection = SourceRCONConnection(address, password,
+                                              self.timeout)
+            with self._lock:
+                self._connections[key] = connection
+            return connection
+
+    def execute(self, address, password, command):
+        """Run a command on the specified server
+
+        A connection that has been closed since its last use is reopened
+        once before the command is sent again. As the server may close the
+        connection only after the command has been sent, this is also done
+        if the server closes the connection while the command is sent or
+        its reply is awaited, as long as no part of the reply has been
+        received. Commands on connections closed for any other reason, e.g.
+        because they or another command timed out, are never sent again,
+        as they may have been run.
+
+        Parameters:
+            address: The 2-tuple (str, int) address of the server
+            password: The string RCON password of the server
+            command: The string command
+
+        Returns:
+            The string output of the command
+
+        Raises:
+            RCONAbortedError: The connection has been closed after another
+                command timed out
+            TimeoutError: The server did not reply in time
+        """
+        connection = self.connection(address, password)
+        try:
+            request_id = connection.submit(command)
+        except _NotSent:
+            return self.connection(address, password).execute(command)
+        except SteamCondenserError:
+            if not connection.closed_by_peer:
+                raise
+            return self.connection(address, password).execute(command)
+        try:
+            return connection.result(request_id)
+        except SteamCondenserError:
+            if not connection.closed_by_peer or \
+                    connection.replied(request_id):
+                raise
+        return self.connection(address, password).execute(command)
+
+
+class RCONFleet(object):
+    """Class to run RCON commands on many Source servers at once
+
+    The command is run by a bounded number of threads using the persistent
+    connections of a SourceRCONPool. The results are yielded as soon as they
+    are available. If a deadline is given, the servers that have not
+    finished when it passes are reported right away instead of waiting for
+    their connections to time out: servers the command is still running on
+    with a TimeoutError, servers it has not been started on yet with a
+    CancelledError. The command is never started on a server after its
+    result has been reported.
+
+    Attributes:
+        pool: The SourceRCONPool used to connect to the servers
+        threads: The integer maximum number of concurrent RCON sessions
+    """
+
+    def __init__(self, pool=None, threads=32):
+        """Create a new RCONFleet
+
+        Parameters:
+            pool: The SourceRCONPool used to connect to the servers
+                (optional)
+            threads: The integer maximum number of concurrent RCON sessions
+        """
+        if pool is None:
+            pool = SourceRCONPool()
+        self.pool = pool
+        self.threads = threads
+
+    def execute(self, command, servers, deadline=None):
+        """Run a command on all given servers
+
+        Parameters:
+            command: The string command
+            servers: A dict mapping the 2-tuple (str, int) addresses of the
+                servers to their string RCON passwords
+            deadline: The float number of seconds after which all servers
+                that have not finished are given up (optional)
+
+        Returns:
+            A generator of RCONResults in the order the servers finish. The
+            error of a result is the SteamCondenserError that occured or
+            None, its duration the float number of seconds the command took
+        """
+        if not servers:
+            return
+        started = time.time()
+        unfinished = set(servers)
+        run = _FleetRun()
+        threads = ThreadPool(min(self.threads, len(servers)))
+        try:
+            results = threads.imap_unordered(
+                self._execute, [(run, address, password, command)
+                                for address, password in servers.iteritems()])
+            while unfinished:
+                if deadline is None:
+                    result = results.next()
+                else:
+                    timeout = started + deadline - time.time()
+                    try:
+                        result = results.next(max(0, timeout))
+                    except multiprocessing.TimeoutError:
+                        break
+                unfinished.discard(result.address)
+                yield result
+            run.cancel()
+            duration = time.time() - started
+            for address in unfinished:
+                if address in run.started:
+                    error = TimeoutError('%s:%d did not finish before the '
+                                         'deadline' % address)
+                else:
+                    error = CancelledError('%s:%d was not started before the '
+                                           'deadline' % address)
+                yield RCONResult(address, None, error, duration)
+        finally:
+            run.cancel()
+            threads.close()
+
+    def _execute(self, server):
+        """Run the command on a single server
+
+        Returns:
+            The RCONResult of the server or None if the run has been
+            cancelled before
+        """
+        run, address, password, command = server
+        if not run.start(address):
+            return None
+        started = time.time()
+        try:
+            output = self.pool.execute(address, password, command)
+        except SteamCondenserError, e:
+            return RCONResult(address, None, e, time.time() - started)
+        return RCONResult(address, output, None, time.time() - started)
+
+
+class _FleetRun(object):
+    """The servers a single RCONFleet command has been started on"""
+
+    __slots__ = ('cancelled', 'lock', 'started')
+
+    def __init__(self):
+        self.cancelled = False
+        self.lock = threading.Lock()
+        self.started = set()
+
+    def cancel(self):
+        """Prevent the command from being started on any more servers"""
+        with self.lock:
+            self.cancelled = True
+
+    def start(self, address):
+        """Mark a server as started unless the run has been cancelled"""
+        with self.lock:
+            if self.cancelled:
+                return False
+            self.started.add(address)
+            return True
+
+
+class _ChallengeRejected(Exception):
+    """The server rejected the cached RCON challenge"""
+    pass
+
+
+class _NotSent(SteamCondenserError):
+    """A command was not sent as its connection had been closed before"""
+    pass
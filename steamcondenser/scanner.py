@@ -0,0 +1,377 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the new BSD License.
+#
+# Copyright (c) 2013 Sebastian Staudt
+
+
+from __future__ import absolute_import
+
+import errno
+import heapq
+import select
+import socket
+import struct
+import time
+
+from .cache import LRUCache
+from .errors import PacketFormatError, TimeoutError
+from .packets import A2SInfoPacket, A2SPlayerPacket, A2SRulesPacket, \
+    PacketBuffer, S2AInfo2Packet, S2AInfoDetailedPacket, S2APlayerPacket, \
+    S2ARulesPacket, S2CChallengePacket, SplitPacketAssembler, SteamPacket, \
+    SteamPacketFactory
+
+
+INFO = 'info'
+PLAYERS = 'players'
+RULES = 'rules'
+
+
+class ScanResult(object):
+    """Class to represent the results of scanning a single game server
+
+    Attributes:
+        address: The 2-tuple (str, int) address of the server
+        error: The SteamCondenserError that ended the scan of this server or
+            None
+        latencies: A dict mapping the queries answered to their float
+            round-trip times in seconds
+        info: The SourceServerInfo or GoldSrcServerInfo of the server or None
+            if it was not requested
+        players: The list of SteamPlayers or None if it was not requested
+        rules: The dict of rules or None if it was not requested
+    """
+
+    __slots__ = ('address', 'error', 'info', 'latencies', 'players',
+                 'rules')
+
+    def __init__(self, address):
+        self.address = address
+        self.error = None
+        self.info = None
+        self.latencies = {}
+        self.players = None
+        self.rules = None
+
+    def __repr__(self):
+        return '<ScanResult %s:%d>' % self.address
+
+
+class _Job(object):
+    """The state of the queries for a single game server"""
+
+    __slots__ = ('address', 'attempt', 'challenge', 'queries', 'rejected',
+                 'result', 'sent', 'socket', 'token')
+
+    def __init__(self, address, queries, sock):
+        self.address = address
+        self.attempt = 0
+        self.challenge = None
+        self.rejected = False
+        self.sent = None
+        self.token = None
+        self.queries = list(queries)
+        self.result = ScanResult(address)
+        self.socket = sock
+
+
+class ServerScanner(object):
+    """Class to query many game servers concurrently
+
+    Queries are multiplexed over a small number of non-blocking UDP sockets.
+    Replies are matched to requests by the address they arrive from, so
+    every server has at most one query in flight per scanner. The queries
+    for a server are run one after another, `S2C_CHALLENGE` replies are
+    answered automatically by repeating the request with the challenge
+    number.
+
+    Challenge numbers are cached per server for `challenge_ttl` seconds, so
+    repeated player and rules queries of the same servers skip the challenge
+    round-trip. If a server rejects a cached challenge number it is replaced
+    by the new one and the query is repeated once.
+
+    Replies split into several packets are reassembled, fragments missing
+    for longer than the timeout of a query are dropped.
+
+    Every call of scan() keeps its own state and sockets, so several scans
+    may run at the same time. Only the challenge cache is shared.
+
+    Players can be collected into a PlayerSnapshot instead of the results,
+    in which case player replies are decoded straight into its columns.
+
+    The round-trip time of every answered query is measured from sending
+    its last attempt to receiving the reply. If a LatencyTracker is given,
+    round-trip times and unanswered attempts are recorded in it as well.
+
+    Attributes:
+        backoff: The float factor the timeout is multiplied with for every
+            retry
+        challenges: The LRUCache of challenge numbers per server address,
+            its hit rate shows how many round-trips have been saved
+        concurrency: The integer maximum number of servers queried at once
+        latencies: The LatencyTracker round-trip times are recorded in or
+            None
+        retries: The integer number of times a query is repeated after a
+            timeout
+        sockets: The integer number of UDP sockets used
+        timeout: The float number of seconds to wait for a reply
+    """
+
+    def __init__(self, concurrency=1000, timeout=1.0, retries=2, backoff=1.0,
+                 sockets=4, challenge_ttl=300, challenge_cache_size=65536,
+                 goldsrc=False, latencies=None):
+        """Create a new ServerScanner
+
+        Parameters:
+            concurrency: The integer maximum number of servers queried at once
+            timeout: The float number of seconds to wait for a reply
+            retries: The integer number of times a query is repeated after a
+                timeout
+            backoff: The float factor the timeout is multiplied with for
+                every retry
+            sockets: The integer number of UDP sockets used
+            challenge_ttl: The float number of seconds challenge numbers are
+                cached
+            challenge_cache_size: The integer maximum number of cached
+                challenge numbers
+            goldsrc: Whether split replies use the GoldSrc format
+            latencies: The LatencyTracker to record round-trip times in
+                (optional)
+        """
+        self.backoff = backoff
+        self.challenges = LRUCache(challenge_cache_size, challenge_ttl)
+        self.concurrency = concurrency
+        self.goldsrc = goldsrc
+        self.latencies = latencies
+        self.retries = retries
+        self.sockets = sockets
+        self.timeout = timeout
+
+    def scan(self, addresses, queries=(INFO,), snapshot=None):
+        """Query the specified game servers
+
+        Parameters:
+            addresses: An iterable of 2-tuples of the form (str, int)
+                containing the IP addresses and ports of the servers,
+                duplicates are scanned only once
+            queries: A sequence of the queries to run for every server, any
+                of `INFO`, `PLAYERS` and `RULES`
+            snapshot: A PlayerSnapshot to add the players to instead of
+                setting `players` of the results (optional). Servers are
+                added with their map if `INFO` is queried before `PLAYERS`.
+
+        Returns:
+            A generator of ScanResults in the order the scans finish
+        """
+        socks = []
+        for i in xrange(self.sockets):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setblocking(0)
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+            except socket.error:
+                pass
+            socks.append(sock)
+        run = _Scan(self, snapshot)
+        try:
+            addresses = iter(addresses)
+            exhausted = False
+            next_socket = 0
+            seen = set()
+            while True:
+                while not exhausted and len(run.jobs) < self.concurrency:
+                    try:
+                        address = next(addresses)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    if address in seen:
+                        continue
+                    seen.add(address)
+                    job = _Job(address, queries, socks[next_socket])
+                    next_socket = (next_socket + 1) % len(socks)
+                    if PLAYERS in queries or RULES in queries:
+                        job.challenge = self.challenges.get(address)
+                    run.jobs[(job.socket, address)] = job
+                    run.next_query(job)
+                if not run.jobs and exhausted:
+                    break
+                run.wait(socks)
+                run.expire()
+                while run.finished:
+                    yield run.finished.pop()
+        finally:
+            for sock in socks:
+                sock.close()
+
+
+class _Scan(object):
+    """The state of a single call of ServerScanner.scan()"""
+
+    _HEADER = struct.Struct('<l')
+
+    def __init__(self, scanner, snapshot):
+        self.assembler = SplitPacketAssembler(
+            scanner.goldsrc, scanner.timeout * scanner.backoff **
+            scanner.retries, max(scanner.concurrency, 1))
+        self.buffer = PacketBuffer()
+        self.deadlines = []
+        self.finished = []
+        self.jobs = {}
+        self.scanner = scanner
+        self.snapshot = snapshot
+        self.tokens = 0
+
+    def wait(self, socks):
+        """Wait for replies and handle them"""
+        if self.deadlines:
+            timeout = max(0, self.deadlines[0][0] - time.time())
+        else:
+            timeout = self.scanner.timeout
+        try:
+            readable = select.select(socks, [], [], timeout)[0]
+        except select.error, e:
+            if e.args[0] == errno.EINTR:
+                return
+            raise
+        for sock in readable:
+            while True:
+                try:
+                    data, address = sock.recvfrom(65535)
+                except socket.error:
+                    break
+                job = self.jobs.get((sock, address))
+                if job is not None:
+                    self.handle(job, data)
+
+    def expire(self):
+        """Retry or fail all queries whose reply is overdue"""
+        now = time.time()
+        self.assembler.expire(now)
+        latencies = self.scanner.latencies
+        while self.deadlines and self.deadlines[0][0] <= now:
+            deadline, token, key = heapq.heappop(self.deadlines)
+            job = self.jobs.get(key)
+            if job is None or job.token != token:
+                continue
+            if latencies is not None:
+                latencies.record_loss(job.address)
+            if job.attempt > self.scanner.retries:
+                self.finish(job, TimeoutError(
+                    '%s:%d did not respond' % job.address))
+            else:
+                self.send(job)
+
+    def finish(self, job, error=None):
+        """Finish the scan of a server"""
+        del self.jobs[(job.socket, job.address)]
+        job.result.error = error
+        job.token = None
+        self.finished.append(job.result)
+
+    def handle(self, job, data):
+        """Handle a reply of a server"""
+        if len(data) < 5:
+            return
+        header = self._HEADER.unpack_from(data)[0]
+        if header == SplitPacketAssembler.SPLIT_HEADER:
+            try:
+                data = self.assembler.add(data, job.address)
+            except PacketFormatError, e:
+                self.finish(job, e)
+                return
+            if data is None or len(data) < 5:
+                return
+            header = self._HEADER.unpack_from(data)[0]
+        if header != -1:
+            return
+        query = job.queries[0]
+        if query == PLAYERS and self.snapshot is not None and \
+                ord(data[4]) == SteamPacket.S2A_PLAYER_HEADER:
+            if job.result.info is None:
+                map_name = ''
+            else:
+                map_name = job.result.info.map_name
+            try:
+                self.snapshot.add_player_data(job.address, data, 5, map_name)
+            except PacketFormatError, e:
+                self.finish(job, e)
+                return
+            self.answered(job, query)
+            return
+        try:
+            packet = SteamPacketFactory.packet_from_data(data[4:])
+        except PacketFormatError, e:
+            self.finish(job, e)
+            return
+        if isinstance(packet, S2CChallengePacket):
+            challenges = self.scanner.challenges
+            if job.challenge is not None:
+                if job.rejected:
+                    challenges.pop(job.address)
+                    self.finish(job, PacketFormatError(
+                        '%s:%d rejected the challenge number' % job.address))
+                    return
+                job.rejected = True
+            job.challenge = packet.challenge_number
+            challenges[job.address] = job.challenge
+            job.attempt = 0
+            self.send(job)
+            return
+        if query == INFO and isinstance(packet, (S2AInfo2Packet,
+                                                 S2AInfoDetailedPacket)):
+            job.result.info = packet.info
+        elif query == PLAYERS and isinstance(packet, S2APlayerPacket):
+            job.result.players = packet.players
+        elif query == RULES and isinstance(packet, S2ARulesPacket):
+            job.result.rules = packet.rules
+        else:
+            return
+        self.answered(job, query)
+
+    def answered(self, job, query):
+        """Record the round-trip time of a query and run the next one"""
+        latency = time.time() - job.sent
+        job.result.latencies[query] = latency
+        if self.scanner.latencies is not None:
+            self.scanner.latencies.record(job.address, latency)
+        job.queries.pop(0)
+        self.next_query(job)
+
+    def next_query(self, job):
+        """Start the next query for a server or finish its scan"""
+        if not job.queries:
+            self.finish(job)
+            return
+        job.attempt = 0
+        job.rejected = False
+        self.send(job)
+
+    def send(self, job):
+        """Send the current query of a server and schedule its timeout"""
+        query = job.queries[0]
+        if query == INFO:
+            packet = A2SInfoPacket(job.challenge)
+        elif query == PLAYERS:
+            packet = A2SPlayerPacket(self._challenge(job))
+        else:
+            packet = A2SRulesPacket(self._challenge(job))
+        try:
+            job.socket.sendto(self.buffer.encode(packet), job.address)
+        except socket.error:
+            pass
+        job.sent = time.time()
+        job.attempt += 1
+        self.tokens += 1
+        job.token = self.tokens
+        timeout = self.scanner.timeout * \
+            self.scanner.backoff ** (job.attempt - 1)
+        heapq.heappush(self.deadlines, (time.time() + timeout, job.token,
+                                        (job.socket, job.address)))
+
+    @staticmethod
+    def _challenge(job):
+        if job.challenge is None:
+            return -1
+        return job.challenge
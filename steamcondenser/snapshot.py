@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the new BSD License.
+#
+# Copyright (c) 2013 Sebastian Staudt
+
+
+from __future__ import absolute_import
+
+import heapq
+import struct
+import sys
+import time
+import zlib
+from array import array
+from socket import inet_aton, inet_ntoa
+
+from .errors import PacketFormatError
+from .packets import _UINT32, SteamPlayer
+
+
+class PlayerSnapshot(object):
+    """Class to store the players of many game servers in typed columns
+
+    Instead of one SteamPlayer per player, every player is a row in four
+    growable arrays: the index of its server, the offset of its name in a
+    shared buffer of null-terminated names, its score and its connection
+    time as a 32-bit float. Servers are stored once with the index of their
+    map. Aggregates are computed by iterating over single columns, so
+    sweeps of thousands of servers neither allocate objects per player nor
+    keep them around.
+
+    Snapshots are saved as a small header followed by the zlib compressed
+    raw columns in little-endian byte order.
+
+    Attributes:
+        addresses: The list of 2-tuple (str, int) addresses of the servers
+        durations: The float32 array of the connection times of the players
+            in seconds
+        maps: The list of the string map names
+        name_data: The bytearray of the null-terminated player names
+        names: The array of the offsets of the player names in `name_data`
+        scores: The signed 32-bit array of the scores of the players
+        server_maps: The array of the indexes of the maps of the servers in
+            `maps`
+        servers: The array of the indexes of the servers of the players in
+            `addresses`
+        timestamp: The float UNIX timestamp of this snapshot
+    """
+
+    MAGIC = 'SCPS'
+    VERSION = 1
+
+    _HEADER = struct.Struct('<4sBdIIII')
+    _PLAYER = struct.Struct('<lf')
+    _SERVER = struct.Struct('<4sH')
+
+    def __init__(self, timestamp=None):
+        """Create a new, empty PlayerSnapshot
+
+        Parameters:
+            timestamp: The float UNIX timestamp of the snapshot (optional,
+                defaults to the current time)
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        self.addresses = []
+        self.durations = array('f')
+        self.maps = []
+        self.name_data = bytearray()
+        self.names = array(_UINT32)
+        self.scores = array('i')
+        self.server_maps = array(_UINT32)
+        self.servers = array(_UINT32)
+        self.timestamp = timestamp
+        self._map_indexes = {}
+        self._server_indexes = {}
+
+    def __len__(self):
+        return len(self.servers)
+
+    def add_players(self, address, players, map_name=''):
+        """Add the players of a server
+
+        Parameters:
+            address: The 2-tuple (str, int) address of the server
+            players: An iterable of SteamPlayers
+            map_name: The string name of the map of the server
+        """
+        server = self.add_server(address, map_name)
+        for name, score, connect_time in players:
+            self.servers.append(server)
+            self.names.append(len(self.name_data))
+            self.name_data.extend(name)
+            self.name_data.append(0)
+            self.scores.append(score)
+            self.durations.append(connect_time)
+
+    def add_player_data(self, address, data, offset=0, map_name=''):
+        """Add the players of a server from a raw S2A_PLAYER reply
+
+        The reply is decoded straight into the columns without creating
+        SteamPlayers.
+
+        Parameters:
+            address: The 2-tuple (str, int) address of the server
+            data: The string data of the reply
+            offset: The integer position of the player count in data, i.e.
+                after the packet header
+            map_name: The string name of the map of the server
+
+        Raises:
+            PacketFormatError: The reply is truncated
+        """
+        server = self.add_server(address, map_name)
+        rows = len(self.servers)
+        name_size = len(self.name_data)
+        unpack_from = self._PLAYER.unpack_from
+        index = data.index
+        try:
+            count = ord(data[offset])
+            offset += 2
+            for i in xrange(count):
+                end = index('\0', offset)
+                score, connect_time = unpack_from(data, end + 1)
+                self.servers.append(server)
+                self.names.append(len(self.name_data))
+                self.name_data.extend(data[offset:end + 1])
+                self.scores.append(score)
+                self.durations.append(connect_time)
+                offset = end + 10
+        except (IndexError, ValueError, struct.error):
+            del self.servers[rows:]
+            del self.names[rows:]
+            del self.scores[rows:]
+            del self.durations[rows:]
+            del self.name_data[name_size:]
+            raise PacketFormatError('%s:%d sent a truncated player list' %
+                                    address)
+
+    def add_server(self, address, map_name=''):
+        """Add a server or update its map
+
+        Parameters:
+            address: The 2-tuple (str, int) address of the server
+            map_name: The string name of the map of the server
+
+        Returns:
+            The integer index of the server
+        """
+        map_index = self._map_indexes.get(map_name)
+        if map_index is None:
+            map_index = len(self.maps)
+            self.maps.append(map_name)
+            self._map_indexes[map_name] = map_index
+        server = self._server_indexes.get(address)
+        if server is None:
+            server = len(self.addresses)
+            self.addresses.append(address)
+            self.server_maps.append(map_index)
+            self._server_indexes[address] = server
+        else:
+            self.server_maps[server] = map_index
+        return server
+
+    def longest_connected(self, count=10):
+        """Return the players connected for the longest time
+
+        Parameters:
+            count: The integer maximum number of players to return
+
+        Returns:
+            A list of 2-tuples of the address of the server and the
+            SteamPlayer, the longest connected player first
+        """
+        rows = heapq.nlargest(count, xrange(len(self.durations)),
+                              key=self.durations.__getitem__)
+        return [(self.addresses[self.servers[row]], self.player(row))
+                for row in rows]
+
+    def name(self, row):
+        """Return the string name of the player in the given row"""
+        offset = self.names[row]
+        return str(self.name_data[offset:self.name_data.index('\0', offset)])
+
+    def player(self, row):
+        """Return the player in the given row as a SteamPlayer"""
+        return SteamPlayer(self.name(row), self.scores[row],
+                           self.durations[row])
+
+    def players_per_map(self):
+        """Return the total number of players on every map
+
+        Returns:
+            A dict mapping the string map names to the integer number of
+            players on servers running them
+        """
+        totals = dict.fromkeys(self.maps, 0)
+        maps = self.maps
+        for map_index, count in zip(self.server_maps, self._counts()):
+            totals[maps[map_index]] += count
+        return totals
+
+    def players_per_server(self):
+        """Return the number of players on every server
+
+        Returns:
+            A dict mapping the addresses of the servers to their integer
+            number of players
+        """
+        return dict(zip(self.addresses, self._counts()))
+
+    def save(self, file):
+        """Write this snapshot to a file
+
+        Parameters:
+            file: A file object opened for writing in binary mode
+        """
+        body = bytearray()
+        for ip, port in self.addresses:
+            body.extend(self._SERVER.pack(inet_aton(ip), port))
+        body.extend('\0'.join(self.maps) + '\0')
+        for column in (self.server_maps, self.servers, self.names,
+                       self.scores, self.durations):
+            body.extend(self._little_endian(column).tostring())
+        body.extend(self.name_data)
+        file.write(self._HEADER.pack(self.MAGIC, self.VERSION, self.timestamp,
+                                     len(self.addresses), len(self.maps),
+                                     len(self), len(self.name_data)))
+        file.write(zlib.compress(str(body)))
+
+    @classmethod
+    def load(cls, file):
+        """Read a snapshot written by save()
+
+        Parameters:
+            file: A file object opened for reading in binary mode
+
+        Returns:
+            The PlayerSnapshot read
+
+        Raises:
+            PacketFormatError: The file does not contain a valid snapshot
+        """
+        try:
+            magic, version, timestamp, server_count, map_count, count, \
+                name_size = cls._HEADER.unpack(file.read(cls._HEADER.size))
+        except struct.error:
+            raise PacketFormatError('truncated player snapshot')
+        if magic != cls.MAGIC or version != cls.VERSION:
+            raise PacketFormatError('not a player snapshot')
+        try:
+            data = zlib.decompress(file.read())
+        except zlib.error:
+            raise PacketFormatError('corrupt player snapshot')
+
+        snapshot = cls(timestamp)
+        offset = 0
+        try:
+            for i in xrange(server_count):
+                ip, port = cls._SERVER.unpack_from(data, offset)
+                snapshot.addresses.append((inet_ntoa(ip), port))
+                offset += cls._SERVER.size
+            for i in xrange(map_count):
+                end = data.index('\0', offset)
+                snapshot.maps.append(data[offset:end])
+                offset = end + 1
+            for column, size in ((snapshot.server_maps, server_count),
+                                 (snapshot.servers, count),
+                                 (snapshot.names, count),
+                                 (snapshot.scores, count),
+                                 (snapshot.durations, count)):
+                end = offset + size * column.itemsize
+                if end > len(data):
+                    raise ValueError
+                column.fromstring(data[offset:end])
+                if sys.byteorder != 'little':
+                    column.byteswap()
+                offset = end
+        except (ValueError, struct.error):
+            raise PacketFormatError('truncated player snapshot')
+        snapshot.name_data.extend(data[offset:offset + name_size])
+        if len(snapshot.name_data) != name_size:
+            raise PacketFormatError('truncated player snapshot')
+
+        snapshot._map_indexes = dict((map_name, index) for index, map_name
+                                     in enumerate(snapshot.maps))
+        snapshot._server_indexes = dict(
+            (address, index) for index, address
+            in enumerate(snapshot.addresses))
+        return snapshot
+
+    def _counts(self):
+        """Return a list of the number of players of every server"""
+        counts = [0] * len(self.addresses)
+        for server in self.servers:
+            counts[server] += 1
+        return counts
+
+    @staticmethod
+    def _little_endian(column):
+        """Return a column in little-endian byte order"""
+        if sys.byteorder == 'little':
+            return column
+        column = array(column.typecode, column)
+        column.byteswap()
+        return column
@@ -0,0 +1,483 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the new BSD License.
+#
+# Copyright (c) 2013 Sebastian Staudt
+
+
+from __future__ import absolute_import
+
+import bz2
+import re
+import socket
+import struct
+import threading
+import time
+import zlib
+from Queue import Queue
+from socket import inet_aton
+
+from .packets import RCONPacket
+
+
+def split_packet(data, request_id, split_size, compress=False):
+    """Split a reply into fragments like Source servers do
+
+    Parameters:
+        data: The string data of the complete reply, starting with the header
+            `0xFFFFFFFF`
+        request_id: The integer request ID of the reply
+        split_size: The integer maximum payload size of every fragment
+        compress: Whether the reply is compressed using bzip2
+
+    Returns:
+        A list of string fragments starting with the header `0xFFFFFFFE`
+    """
+    prefix = ''
+    if compress:
+        request_id |= 0x80000000
+        prefix = struct.pack('<LL', len(data), zlib.crc32(data) & 0xFFFFFFFF)
+        data = bz2.compress(data)
+    payloads = [data[i:i + split_size]
+                for i in xrange(0, len(data), split_size)]
+    fragments = []
+    for number, payload in enumerate(payloads):
+        header = struct.pack('<lLBBH', -2, request_id, len(payloads), number,
+                             split_size)
+        if number == 0:
+            header += prefix
+        fragments.append(header + payload)
+    return fragments
+
+
+class FakeUDPServer(object):
+    """Base class for local UDP servers used in tests and benchmarks
+
+    The server runs in a daemon thread and passes every datagram to
+    handle(), which returns a list of datagrams to send back.
+
+    Attributes:
+        address: The 2-tuple (str, int) address the server is bound to
+        requests: The integer number of datagrams received
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.requests = 0
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind((host, port))
+        self._socket.settimeout(0.1)
+        self.address = self._socket.getsockname()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.daemon = True
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def handle(self, data, address):
+        """Return a list of datagrams to reply to a datagram"""
+        raise NotImplementedError
+
+    def start(self):
+        """Start serving in a background thread"""
+        self._thread.start()
+
+    def stop(self):
+        """Stop serving and close the socket"""
+        self._stopped.set()
+        self._thread.join()
+        self._socket.close()
+
+    def _serve(self):
+        while not self._stopped.is_set():
+            try:
+                data, address = self._socket.recvfrom(65535)
+            except socket.timeout:
+                continue
+            self.requests += 1
+            for reply in self.handle(data, address):
+                self._socket.sendto(reply, address)
+
+
+class FakeMasterServer(FakeUDPServer):
+    """Class to simulate a Steam master server
+
+    The server answers A2M_GET_SERVERS_BATCH2 requests with pages of the
+    given server addresses and terminates the list with `0.0.0.0:0`.
+
+    Attributes:
+        drop: The integer number of requests still to be ignored, used to
+            simulate packet loss
+        filters: A list of the (region_code, filter) pairs of all requests
+    """
+
+    def __init__(self, servers, page_size=231, drop=0, **kwargs):
+        """Create a new FakeMasterServer
+
+        Parameters:
+            servers: A list of 2-tuples of the form (str, int) containing the
+                addresses of the game servers to serve, or a dict mapping
+                integer region codes to such lists
+            page_size: The integer maximum number of addresses per page
+            drop: The integer number of initial requests to ignore
+        """
+        super(FakeMasterServer, self).__init__(**kwargs)
+        self.drop = drop
+        self.filters = []
+        self.page_size = page_size
+        if not isinstance(servers, dict):
+            servers = {None: servers}
+        self._regions = {}
+        for region_code, region_servers in servers.iteritems():
+            packed = []
+            index = {}
+            for i, (ip, port) in enumerate(region_servers):
+                packed.append(struct.pack('!4sH', inet_aton(ip), port))
+                index['%s:%d' % (ip, port)] = i + 1
+            self._regions[region_code] = (packed, index)
+
+    def handle(self, data, address):
+        if self.drop > 0:
+            self.drop -= 1
+            return []
+        region_code = ord(data[1])
+        start_ip, filter = data[2:].split('\0')[:2]
+        self.filters.append((region_code, filter))
+        servers, index = self._regions.get(region_code,
+                                           self._regions.get(None, ([], {})))
+        start = index.get(start_ip, 0)
+        page = servers[start:start + self.page_size]
+        if start + self.page_size >= len(servers):
+            page.append('\0' * 6)
+        return ['\xff\xff\xff\xff\x66\x0a' + ''.join(page)]
+
+
+class FakeGameServer(FakeUDPServer):
+    """Class to simulate a Source game server answering A2S queries
+
+    Player and rules queries require a challenge number. Info queries
+    require one as well if `info_challenge` is set, like newer Source
+    servers do.
+
+    Replies larger than `split_size` are split into fragments, which are
+    sent in reverse order to simulate reordering.
+
+    Attributes:
+        challenge_number: The integer challenge number of the server
+        compress: Whether split replies are compressed
+        drop: The integer number of requests still to be ignored, used to
+            simulate packet loss
+        info_challenge: Whether info queries require a challenge number
+        split_size: The integer maximum size of a single reply or None
+    """
+
+    def __init__(self, name='Fake Server', map_name='de_dust2',
+                 game_directory='cstrike', app_id=240, players=(),
+                 max_players=24, secure=True, rules=None,
+                 challenge_number=0x12345678, info_challenge=False, drop=0,
+                 split_size=None, compress=False, tags=None, **kwargs):
+        """Create a new FakeGameServer
+
+        Parameters:
+            players: A sequence of 3-tuples of the form (str, int, float)
+                containing the name, score and connection time of each player
+            rules: A dict of the server's rules (optional)
+            tags: The string keywords of the server (optional)
+        """
+        super(FakeGameServer, self).__init__(**kwargs)
+        self.challenge_number = challenge_number
+        self.compress = compress
+        self.drop = drop
+        self.split_size = split_size
+        self._request_id = 0
+        self.info_challenge = info_challenge
+        self.name = name
+        self.map_name = map_name
+        self.game_directory = game_directory
+        self.app_id = app_id
+        self.players = list(players)
+        self.max_players = max_players
+        self.secure = secure
+        self.rules = rules or {}
+        self.tags = tags
+
+    def handle(self, data, address):
+        if self.drop > 0:
+            self.drop -= 1
+            return []
+        replies = []
+        for reply in self._reply(data):
+            if self.split_size is None or len(reply) <= self.split_size:
+                replies.append(reply)
+            else:
+                self._request_id += 1
+                replies.extend(reversed(split_packet(
+                    reply, self._request_id, self.split_size,
+                    self.compress)))
+        return replies
+
+    def _reply(self, data):
+        header = ord(data[4])
+        if header == 0x54:
+            challenge = data[25:29]
+            if self.info_challenge and not self._valid(challenge):
+                return [self._challenge()]
+            return [self.info_data()]
+        if header in (0x55, 0x56):
+            if not self._valid(data[5:9]):
+                return [self._challenge()]
+            if header == 0x55:
+                return [self.player_data()]
+            return [self.rules_data()]
+        return []
+
+    def info_data(self):
+        """Return the S2A_INFO2 reply of this server"""
+        return ''.join([
+            '\xff\xff\xff\xff\x49\x11',
+            self.name, '\0', self.map_name, '\0', self.game_directory,
+            '\0', 'Counter-Strike: Source\0',
+            struct.pack('<HBBBccBB', self.app_id, len(self.players),
+                        self.max_players, 0, 'd', 'l', 0, int(self.secure)),
+            '1.0.0.70\0',
+            self._extra_data(),
+        ])
+
+    def _extra_data(self):
+        edf = 0x80
+        data = [struct.pack('<H', self.address[1])]
+        if self.tags is not None:
+            edf |= 0x20
+            data.append(self.tags + '\0')
+        return chr(edf) + ''.join(data)
+
+    def player_data(self):
+        """Return the S2A_PLAYER reply of this server"""
+        data = ['\xff\xff\xff\xff\x44', chr(len(self.players))]
+        for index, (name, score, duration) in enumerate(self.players):
+            data.extend([chr(index), name, '\0',
+                         struct.pack('<lf', score, duration)])
+        return ''.join(data)
+
+    def rules_data(self):
+        """Return the S2A_RULES reply of this server"""
+        data = ['\xff\xff\xff\xff\x45', struct.pack('<H', len(self.rules))]
+        for name, value in sorted(self.rules.items()):
+            data.extend([name, '\0', value, '\0'])
+        return ''.join(data)
+
+    def _challenge(self):
+        return '\xff\xff\xff\xff\x41' + struct.pack('<l',
+                                                    self.challenge_number)
+
+    def _valid(self, challenge):
+        return len(challenge) == 4 and \
+            struct.unpack('<l', challenge)[0] == self.challenge_number
+
+
+class FakeGoldSrcServer(FakeUDPServer):
+    """Class to simulate the RCON interface of a GoldSrc server
+
+    Outputs longer than `max_reply` are sent as several datagrams.
+
+    Attributes:
+        challenge: The integer RCON challenge the server expects
+        commands: A dict mapping string commands to their string outputs
+        executed: A list of all string commands executed
+        max_reply: The integer maximum length of the text of one reply
+        password: The string RCON password
+    """
+
+    _RCON = re.compile(r'rcon (\d+) "([^"]*)" ?(.*)$', re.DOTALL)
+
+    def __init__(self, password, commands=None, challenge=1234,
+                 max_reply=1000, **kwargs):
+        super(FakeGoldSrcServer, self).__init__(**kwargs)
+        self.challenge = challenge
+        self.commands = commands or {}
+        self.executed = []
+        self.max_reply = max_reply
+        self.password = password
+
+    def handle(self, data, address):
+        request = data[4:]
+        if request == 'challenge rcon\n':
+            return ['\xff\xff\xff\xffchallenge rcon %d\n\0' %
+                    self.challenge]
+        match = self._RCON.match(request)
+        if match is None:
+            return []
+        challenge, password, command = match.groups()
+        if int(challenge) != self.challenge:
+            return [self._reply('Bad challenge.\n')]
+        if password != self.password:
+            return [self._reply('Bad rcon_password.\n')]
+        self.executed.append(command)
+        if command.startswith('echo '):
+            return [self._reply(command[5:] + '\n')]
+        output = self.commands.get(command, 'Unknown command "%s"\n' %
+                                   command)
+        return [self._reply(output[i:i + self.max_reply])
+                for i in xrange(0, max(len(output), 1), self.max_reply)]
+
+    @staticmethod
+    def _reply(text):
+        return '\xff\xff\xff\xffl%s\0\0' % text
+
+
+class FakeSourceServer(object):
+    """Class to simulate the RCON interface of a Source server
+
+    The server accepts TCP connections in a daemon thread and serves each
+    connection in a thread of its own. Outputs longer than `max_reply` are
+    split into several packets and the terminator packets are mirrored
+    like srcds does.
+
+    Commands are executed as soon as they are received, but their replies
+    are sent one after another, so the reply of a command listed in
+    `delays` also holds back the replies of all commands received later on
+    the same connection.
+
+    Attributes:
+        address: The 2-tuple (str, int) address the server is bound to
+        commands: A dict mapping string commands to their string outputs
+        connections: The integer number of connections accepted
+        delays: A dict mapping string commands to the float number of
+            seconds their replies are delayed
+        executed: A list of all string commands executed
+        max_reply: The integer maximum length of the body of one reply
+        password: The string RCON password
+    """
+
+    def __init__(self, password, commands=None, max_reply=4096,
+                 host='127.0.0.1', port=0, delays=None):
+        self.commands = commands or {}
+        self.connections = 0
+        self.delays = delays or {}
+        self.executed = []
+        self.max_reply = max_reply
+        self.password = password
+        self._clients = []
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((host, port))
+        self._socket.listen(128)
+        self._socket.settimeout(0.1)
+        self.address = self._socket.getsockname()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.daemon = True
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def disconnect(self):
+        """Close all client connections, keeping the server running"""
+        for client in self._clients:
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            client.close()
+        self._clients = []
+
+    def start(self):
+        """Start serving in a background thread"""
+        self._thread.start()
+
+    def stop(self):
+        """Stop serving and close all sockets"""
+        self._stopped.set()
+        self._thread.join()
+        self.disconnect()
+        self._socket.close()
+
+    def _serve(self):
+        while not self._stopped.is_set():
+            try:
+                client = self._socket.accept()[0]
+            except socket.timeout:
+                continue
+            self.connections += 1
+            self._clients.append(client)
+            thread = threading.Thread(target=self._serve_client,
+                                      args=(client,))
+            thread.daemon = True
+            thread.start()
+
+    def _send_replies(self, client, replies):
+        while True:
+            delay, data = replies.get()
+            if data is None:
+                return
+            time.sleep(delay)
+            try:
+                client.sendall(data)
+            except socket.error:
+                return
+
+    def _serve_client(self, client):
+        data = bytearray()
+        authenticated = False
+        replies = Queue()
+        sender = threading.Thread(target=self._send_replies,
+                                  args=(client, replies))
+        sender.daemon = True
+        sender.start()
+        try:
+            while True:
+                try:
+                    received = client.recv(65536)
+                except socket.error:
+                    return
+                if not received:
+                    return
+                data.extend(received)
+                offset = 0
+                while True:
+                    decoded = RCONPacket.decode(data, offset)
+                    if decoded is None:
+                        break
+                    packet, offset = decoded
+                    reply = ''.join(str(reply) for reply in
+                                    self._reply(packet, authenticated))
+                    replies.put((self.delays.get(packet.body, 0), reply))
+                    if packet.type == RCONPacket.SERVERDATA_AUTH:
+                        authenticated = packet.body == self.password
+                del data[:offset]
+        finally:
+            replies.put((0, None))
+
+    def _reply(self, packet, authenticated):
+        if packet.type == RCONPacket.SERVERDATA_AUTH:
+            request_id = packet.request_id
+            if packet.body != self.password:
+                request_id = -1
+            return [RCONPacket(packet.request_id,
+                               RCONPacket.SERVERDATA_RESPONSE_VALUE),
+                    RCONPacket(request_id,
+                               RCONPacket.SERVERDATA_AUTH_RESPONSE)]
+        if not authenticated:
+            return []
+        if packet.type == RCONPacket.SERVERDATA_RESPONSE_VALUE:
+            return [RCONPacket(packet.request_id,
+                               RCONPacket.SERVERDATA_RESPONSE_VALUE),
+                    RCONPacket(packet.request_id,
+                               RCONPacket.SERVERDATA_RESPONSE_VALUE,
+                               '\0\1\0\0')]
+        self.executed.append(packet.body)
+        output = self.commands.get(packet.body, 'Unknown command "%s"\n' %
+                                   packet.body)
+        return [RCONPacket(packet.request_id,
+                           RCONPacket.SERVERDATA_RESPONSE_VALUE,
+                           output[i:i + self.max_reply])
+                for i in xrange(0, max(len(output), 1), self.max_reply)]
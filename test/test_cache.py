@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the new BSD License.
+#
+# Copyright (c) 2013 Sebastian Staudt
+
+
+from mock import patch
+from nose.tools import assert_equal, assert_false, raises
+from steamcondenser.cache import LRUCache
+
+
+class TestLRUCache(object):
+    """Class to test LRUCache"""
+
+    def setup(self):
+        self.cache = LRUCache(3)
+        for key in 'abc':
+            self.cache[key] = key.upper()
+
+    def test_evict_least_recently_used(self):
+        self.cache['a']
+        self.cache['d'] = 'D'
+        assert_equal(['c', 'a', 'd'], self.cache.keys())
+        assert_false('b' in self.cache)
+        assert_equal(3, len(self.cache))
+
+    def test_resize(self):
+        self.cache['a']
+        self.cache.resize(2)
+        assert_equal(['c', 'a'], self.cache.keys())
+        self.cache['d'] = 'D'
+        assert_equal(['a', 'd'], self.cache.keys())
+
+    @raises(ValueError)
+    def test_resize_invalid(self):
+        self.cache.resize(0)
+
+    def test_update(self):
+        self.cache['a'] = 'X'
+        assert_equal(['b', 'c', 'a'], self.cache.keys())
+        assert_equal('X', self.cache.get('a'))
+
+    def test_pop(self):
+        assert_equal('B', self.cache.pop('b'))
+        assert_equal(None, self.cache.pop('b'))
+        assert_equal(['a', 'c'], self.cache.keys())
+
+    def test_setdefault(self):
+        assert_equal('A', self.cache.setdefault('a', 'X'))
+        assert_equal('Y', self.cache.setdefault('y', 'Y'))
+        assert_equal(['c', 'a', 'y'], self.cache.keys())
+
+    @raises(KeyError)
+    def test_missing(self):
+        self.cache['z']
+
+    def test_ttl(self):
+        cache = LRUCache(3, ttl=10)
+        with patch('time.time', return_value=1000):
+            cache['a'] = 'A'
+        with patch('time.time', return_value=1009):
+            assert_equal('A', cache['a'])
+        with patch('time.time', return_value=1010):
+            assert_false('a' in cache)
+            assert_equal(None, cache.get('a'))
+            assert_equal(0, len(cache))
+
+    def test_hit_rate(self):
+        assert_equal(None, self.cache.hit_rate())
+        self.cache.get('a')
+        self.cache.get('z')
+        self.cache.get('b')
+        self.cache.get('y')
+        assert_equal(2, self.cache.hits)
+        assert_equal(2, self.cache.misses)
+        assert_equal(0.5, self.cache.hit_rate())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the new BSD License.
+#
+# Copyright (c) 2013 Sebastian Staudt
+
+
+from nose.tools import assert_equal, assert_false
+from steamcondenser.catalog import ServerCatalog
+from steamcondenser.errors import TimeoutError
+from steamcondenser.packets import SourceServerInfo
+from steamcondenser.scanner import ScanResult
+
+
+def server_info(map_name='de_dust2', players=0, max_players=24, secure=True,
+                tags=None):
+    return SourceServerInfo(17, 'Server', map_name, 'cstrike',
+                            'Counter-Strike: Source', 240, players,
+                            max_players, 0, 'd', 'l', False, secure,
+                            '1.0.0.70', 27015, None, None, None, tags, None)
+
+
+class TestServerCatalog(object):
+    """Class to test ServerCatalog"""
+
+    def setup(self):
+        self.catalog = ServerCatalog()
+        self.catalog.update(('10.0.0.1', 27015), server_info(players=12))
+        self.catalog.update(('10.0.0.2', 27015),
+                            server_info(players=3, max_players=8))
+        self.catalog.update(('10.0.0.3', 27015),
+                            server_info(players=5, secure=False,
+                                        tags='alltalk,hltv'))
+        self.catalog.update(('10.0.0.4', 27015),
+                            server_info('cs_office', players=24,
+                                        tags='alltalk'))
+        self.catalog.update(('10.0.0.5', 27015), server_info())
+
+    def find(self, **criteria):
+        return sorted(ip for ip, port in self.catalog.find(**criteria))
+
+    def test_compound(self):
+        assert_equal(['10.0.0.1'],
+                     self.find(map_name='de_dust2', min_players=1,
+                               secure=True, min_slots=10))
+
+    def test_ranges(self):
+        assert_equal(['10.0.0.1', '10.0.0.4'], self.find(min_players=10))
+        assert_equal(['10.0.0.2', '10.0.0.3', '10.0.0.5'],
+                     self.find(max_players=5))
+        assert_equal(['10.0.0.2'], self.find(max_players=5, secure=True,
+                                             min_players=1))
+        assert_equal(['10.0.0.2'], self.find(min_slots=1, max_players=3,
+                                             min_players=3))
+
+    def test_zero_minimum(self):
+        assert_equal(['10.0.0.1', '10.0.0.2', '10.0.0.3', '10.0.0.4',
+                      '10.0.0.5'], self.find(min_players=0, min_slots=0))
+        assert_equal(['10.0.0.1', '10.0.0.2', '10.0.0.3', '10.0.0.5'],
+                     self.find(min_players=0, not_full=True))
+
+    def test_tags(self):
+        assert_equal(['10.0.0.3', '10.0.0.4'], self.find(tags=['alltalk']))
+        assert_equal(['10.0.0.3'], self.find(tags=['alltalk', 'hltv']))
+        assert_equal([], self.find(tags=['alltalk', 'unknown']))
+
+    def test_not_full(self):
+        assert_equal(['10.0.0.1', '10.0.0.2', '10.0.0.3', '10.0.0.5'],
+                     self.find(not_full=True))
+        self.catalog.update(('10.0.0.2', 27015),
+                            server_info(players=8, max_players=8))
+        self.catalog.update(('10.0.0.4', 27015),
+                            server_info('cs_office', players=23))
+        assert_equal(['10.0.0.1', '10.0.0.3', '10.0.0.4', '10.0.0.5'],
+                     self.find(not_full=True))
+        assert_equal(4, len(self.catalog._lookup('full', False)))
+
+    def test_update(self):
+        self.catalog.update(('10.0.0.4', 27015), server_info(players=20))
+        assert_equal([], self.find(map_name='cs_office'))
+        assert_equal([], self.find(tags=['hltv', 'alltalk'], min_players=1,
+                                   secure=True))
+        assert_equal(['10.0.0.1', '10.0.0.4'],
+                     self.find(map_name='de_dust2', min_players=10))
+        assert_equal(5, len(self.catalog))
+
+    def test_ingest(self):
+        results = [ScanResult(('10.0.0.1', 27015)),
+                   ScanResult(('10.0.0.6', 27015)),
+                   ScanResult(('10.0.0.7', 27015))]
+        results[0].error = TimeoutError()
+        results[1].info = server_info('cs_italy', players=7)
+        self.catalog.ingest(results)
+        assert_false(('10.0.0.1', 27015) in self.catalog)
+        assert_false(('10.0.0.7', 27015) in self.catalog)
+        assert_equal(['10.0.0.6'], self.find(map_name='cs_italy'))
+        assert_equal(['10.0.0.3', '10.0.0.6'], self.find(min_players=5,
+                                                         max_players=7))
@@ -6,11 +6,21 @@
 # Copyright (c) 2013 Sebastian Staudt
 
 
-from mock import Mock
-from nose.tools import assert_equal, raises
-from steamcondenser.community import WebApi, WebApiError
+from mock import Mock, patch
+from nose.tools import assert_equal, assert_false, assert_raises, \
+    assert_true, raises
+from steamcondenser.community import AchievementCohort, AppNews, \
+    AppNewsPoller, GameAchievement, GameAchievementPercentages, GameStats, \
+    OwnedGamesCohort, PlayerCountPoller, SteamCondenserError, SteamGame, \
+    SteamGameCatalog, SteamId, SteamInfScanner, TimeSeries, WebApi, \
+    WebApiError
 
 import __builtin__
+import json
+import os
+import shutil
+import socket
+import tempfile
 import urllib
 import urllib2
 
@@ -59,3 +69,563 @@ class TestWebApi(object):
                                                              'not found',
                                                              None, None))
         WebApi.get('json', 'interface', 'method', 2, test='param')
+
+    def test_get_network_error(self):
+        for error in (urllib2.URLError('timed out'),
+                      socket.timeout('timed out'),
+                      socket.error(104, 'Connection reset by peer')):
+            with patch('urllib2.urlopen', Mock(side_effect=error)):
+                try:
+                    WebApi.get('json', 'interface', 'method')
+                except WebApiError:
+                    pass
+                else:
+                    raise AssertionError('%r was not wrapped' % error)
+
+
+class TestSteamId(object):
+    """Class to test SteamId"""
+
+    def setup(self):
+        games = {'response': {'game_count': 3, 'games': [
+            {'appid': 440, 'name': 'Team Fortress 2',
+             'img_icon_url': 'e3f595a9', 'img_logo_url': '07385eb5',
+             'playtime_2weeks': 42, 'playtime_forever': 1000},
+            {'appid': 10, 'name': 'Counter-Strike',
+             'img_icon_url': '6b0312cd', 'img_logo_url': 'af890f84',
+             'playtime_forever': 15},
+            {'appid': 570, 'name': 'Dota 2', 'img_icon_url': '0bbb630d',
+             'img_logo_url': 'd4f836839'},
+        ]}}
+        self.steam_id = SteamId(76561197960265728)
+        self.patcher = patch.object(WebApi, 'json',
+                                    Mock(return_value=json.dumps(games)))
+        self.patcher.start()
+
+    def teardown(self):
+        self.patcher.stop()
+
+    def test_find_game_by_name(self):
+        assert_equal(440, self.steam_id._find_game('team fortress 2').app_id)
+        assert_equal(10, self.steam_id._find_game('Counter-Strike').app_id)
+
+    def test_playtime(self):
+        assert_equal(42, self.steam_id.recent_playtime(440))
+        assert_equal(0, self.steam_id.recent_playtime('Counter-Strike'))
+        assert_equal(1000, self.steam_id.total_playtime('Team Fortress 2'))
+
+    def test_playtimes(self):
+        assert_equal([(0, 0), (42, 1000), (0, 15)],
+                     self.steam_id.playtimes([570, 440, 10]))
+        WebApi.json.assert_called_once_with(
+            'IPlayerService', 'GetOwnedGames', 1, include_appinfo=1,
+            include_played_free_games=1, steamid=76561197960265728)
+
+    @raises(SteamCondenserError)
+    def test_playtimes_unowned(self):
+        self.steam_id.playtimes([440, 730])
+
+    @raises(SteamCondenserError)
+    def test_find_unowned_game(self):
+        self.steam_id._find_game('Half-Life')
+
+
+class TestOwnedGamesCohort(object):
+    """Class to test OwnedGamesCohort"""
+
+    def setup(self):
+        games = {
+            1: [{'appid': 440, 'playtime_2weeks': 60,
+                 'playtime_forever': 600},
+                {'appid': 570, 'playtime_forever': 120}],
+            2: [{'appid': 440, 'playtime_forever': 30},
+                {'appid': 730, 'playtime_2weeks': 10,
+                 'playtime_forever': 90}],
+            3: [],
+            4: [],
+        }
+        self.private = set([4])
+
+        def get_owned_games(*args, **kwargs):
+            steam_id64 = kwargs['steamid']
+            if steam_id64 in self.private:
+                raise WebApiError('private')
+            return json.dumps({'response': {'games': games[steam_id64]}})
+
+        self.patcher = patch.object(WebApi, 'json',
+                                    Mock(side_effect=get_owned_games))
+        self.patcher.start()
+        self.cohort = OwnedGamesCohort()
+        self.loaded = self.cohort.load([1, 2, 3, 4], threads=2)
+
+    def teardown(self):
+        self.patcher.stop()
+
+    def test_load(self):
+        assert_equal(3, self.loaded)
+        assert_equal(4, len(self.cohort))
+        assert_equal([4], self.cohort.errors.keys())
+        assert_equal(0, self.cohort.load([1, 2]))
+        self.private.clear()
+        assert_equal(1, self.cohort.load([4]))
+        assert_equal({}, self.cohort.errors)
+
+    def test_playtime_per_app(self):
+        assert_equal({440: 630, 570: 120, 730: 90},
+                     self.cohort.playtime_per_app())
+        assert_equal({440: 60, 730: 10},
+                     self.cohort.playtime_per_app(recent=True))
+        assert_equal(10.5, self.cohort.hours_per_app()[440])
+        assert_equal({440: 2, 570: 1, 730: 1}, self.cohort.owners_per_app())
+
+    def test_network_error(self):
+        self.patcher.stop()
+        try:
+            with patch('urllib2.urlopen',
+                       Mock(side_effect=socket.timeout('timed out'))):
+                assert_equal(0, self.cohort.load([5, 6]))
+        finally:
+            self.patcher.start()
+        assert_equal([4, 5, 6], sorted(self.cohort.errors))
+        assert_equal(3, len(self.cohort.steam_id64s))
+
+    def test_top_apps(self):
+        assert_equal([(440, 600), (570, 120)], self.cohort.top_apps(1))
+        assert_equal([(730, 90)], self.cohort.top_apps(2, count=1))
+        assert_equal([], self.cohort.top_apps_per_user()[3])
+
+
+class TestSteamGameCatalog(object):
+    """Class to test SteamGameCatalog"""
+
+    def setup(self):
+        SteamGameCatalog.clear()
+
+    def teardown(self):
+        SteamGameCatalog.clear()
+        SteamGameCatalog.resize(50000)
+
+    def test_shared_instance(self):
+        game = SteamGameCatalog.game(440, {'name': u'Team Fortress 2',
+                                           'img_icon_url': u'e3f595a9'})
+        assert_true(game is SteamGameCatalog.game(
+            440, {'name': u'Team Fortress 2', 'img_icon_url': u'e3f595a9'}))
+        assert_true(game is SteamGameCatalog.game(440))
+        assert_true(isinstance(game.icon_hash, str))
+        assert_equal(None, SteamGameCatalog.game(10))
+
+    def test_fill_missing_hashes(self):
+        with patch.object(WebApi, 'json', Mock(return_value=json.dumps(
+                {'applist': {'apps': [{'appid': 440,
+                                       'name': 'Team Fortress 2'}]}}))):
+            assert_equal(1, SteamGameCatalog.load_app_list())
+        game = SteamGameCatalog.game(440)
+        assert_equal(None, game.icon_hash)
+        SteamGameCatalog.game(440, {'name': u'Team Fortress 2',
+                                    'img_icon_url': u'e3f595a9',
+                                    'img_logo_url': u'07385eb5'})
+        assert_equal('e3f595a9', game.icon_hash)
+
+    def test_eviction(self):
+        SteamGameCatalog.resize(2)
+        for app_id in (10, 20, 30):
+            SteamGameCatalog.game(app_id, {'name': u'Game %d' % app_id})
+        assert_equal(2, SteamGameCatalog.size())
+        assert_equal(None, SteamGameCatalog.game(10))
+
+    def test_resize(self):
+        for app_id in (10, 20, 30):
+            SteamGameCatalog.game(app_id, {'name': u'Game %d' % app_id})
+        SteamGameCatalog.resize(1)
+        assert_equal(1, SteamGameCatalog.size())
+        assert_true(SteamGameCatalog.game(30) is not None)
+        assert_raises(ValueError, SteamGameCatalog.resize, 0)
+
+    def test_load_app_list_count(self):
+        SteamGameCatalog.resize(3)
+        SteamGameCatalog.game(10, {'name': u'Game 10'})
+        apps = [{'appid': app_id, 'name': 'App %d' % app_id}
+                for app_id in range(100, 110)]
+        with patch.object(WebApi, 'json', Mock(return_value=json.dumps(
+                {'applist': {'apps': apps}}))):
+            assert_equal(3, SteamGameCatalog.load_app_list())
+        assert_equal(3, SteamGameCatalog.size())
+
+
+class TestTimeSeries(object):
+    """Class to test TimeSeries"""
+
+    def test_ring_buffer(self):
+        series = TimeSeries(3)
+        assert_equal(None, series.latest())
+        for i in range(5):
+            series.append(float(i), i * 10)
+        assert_equal(3, len(series))
+        assert_equal([(2.0, 20), (3.0, 30), (4.0, 40)], series.samples())
+        assert_equal((4.0, 40), series.latest())
+
+
+class TestPlayerCountPoller(object):
+    """Class to test PlayerCountPoller"""
+
+    def setup(self):
+        def get_player_count(*args, **kwargs):
+            if kwargs['appid'] == 10:
+                raise WebApiError('unavailable')
+            if kwargs['appid'] == 20:
+                return '<html>'
+            if kwargs['appid'] == 30:
+                raise RuntimeError('unexpected')
+            if kwargs['appid'] == 50:
+                self.poller.remove(50)
+            return json.dumps({'response': {'player_count': kwargs['appid'],
+                                            'result': 1}})
+
+        self.patcher = patch.object(WebApi, 'json',
+                                    Mock(side_effect=get_player_count))
+        self.patcher.start()
+        self.poller = PlayerCountPoller(interval=60, threads=2, history=10)
+        self.poller.add(440)
+        self.poller.add(570, interval=30)
+        self.poller.add(10)
+
+    def teardown(self):
+        self.patcher.stop()
+
+    def test_sweep(self):
+        stats = self.poller.sweep(now=1000)
+        assert_equal(3, stats.samples)
+        assert_equal(1, stats.errors)
+        assert_equal(440, self.poller.series(440).latest()[1])
+        assert_equal(0, len(self.poller.series(10)))
+        assert_true(isinstance(self.poller.errors[10], WebApiError))
+
+    def test_invalid_response(self):
+        self.poller.add(20)
+        stats = self.poller.sweep(now=1000)
+        assert_equal(2, stats.errors)
+        assert_true(isinstance(self.poller.errors[20], WebApiError))
+        assert_equal(4, self.poller.sweep(now=1060).samples)
+
+    def test_failed_sweep_keeps_schedule(self):
+        self.poller.add(30)
+        try:
+            self.poller.sweep(now=1000)
+        except RuntimeError:
+            pass
+        scheduled = set(app_id for due, app_id in self.poller._schedule)
+        assert_equal(set([10, 30, 440, 570]), scheduled)
+        assert_equal(1030, self.poller.next_sweep())
+
+    def test_per_app_interval(self):
+        self.poller.sweep(now=1000)
+        assert_equal(1030, self.poller.next_sweep())
+        assert_equal(0, self.poller.sweep(now=1020).samples)
+        assert_equal(1, self.poller.sweep(now=1030).samples)
+        assert_equal(2, len(self.poller.series(570)))
+        assert_equal(3, self.poller.sweep(now=1060).samples)
+
+    def test_remove(self):
+        self.poller.remove(440)
+        assert_equal(2, self.poller.sweep(now=1000).samples)
+        assert_false(440 in self.poller)
+
+    def test_remove_during_sweep(self):
+        for app_id in (10, 440, 570):
+            self.poller.remove(app_id)
+        self.poller.add(50)
+        stats = self.poller.sweep(now=1000)
+        assert_equal((0, None, None, None),
+                     (stats.samples, stats.min_latency, stats.mean_latency,
+                      stats.max_latency))
+        assert_false(50 in self.poller)
+
+
+class TestSteamInfScanner(object):
+    """Class to test SteamInfScanner"""
+
+    def setup(self):
+        self.root = tempfile.mkdtemp()
+        installs = {
+            'css1': 'appID=240\r\nPatchVersion=1.0.0.75\r\n',
+            'css2': 'PatchVersion=1.0.0.75\nappID=240\n',
+            'tf2': 'appID=440\nPatchVersion=1.2.3.4\n',
+            'broken': 'PatchVersion=\n',
+        }
+        for name, steam_inf in installs.items():
+            os.makedirs(os.path.join(self.root, name, 'game'))
+            with open(os.path.join(self.root, name, 'game', 'steam.inf'),
+                      'w') as steam_inf_file:
+                steam_inf_file.write(steam_inf)
+
+        def up_to_date_check(*args, **kwargs):
+            return json.dumps({'response': {
+                'success': True, 'up_to_date': kwargs['appid'] == 240}})
+
+        self.patcher = patch.object(WebApi, 'json',
+                                    Mock(side_effect=up_to_date_check))
+        self.patcher.start()
+
+    def teardown(self):
+        self.patcher.stop()
+        shutil.rmtree(self.root)
+
+    def path(self, name):
+        return os.path.join(self.root, name, 'game', 'steam.inf')
+
+    def test_parse_steam_inf(self):
+        assert_equal((240, 10075),
+                     SteamGame.parse_steam_inf(self.path('css2')))
+
+    @raises(SteamCondenserError)
+    def test_parse_invalid_steam_inf(self):
+        SteamGame.parse_steam_inf(self.path('broken'))
+
+    def test_scan(self):
+        scanner = SteamInfScanner(threads=2)
+        results = scanner.scan(self.root)
+        assert_true(results[self.path('css1')])
+        assert_true(results[self.path('css2')])
+        assert_false(results[self.path('tf2')])
+        assert_true(isinstance(results[self.path('broken')],
+                               SteamCondenserError))
+        assert_equal(2, WebApi.json.call_count)
+        scanner.scan(self.root)
+        assert_equal(2, WebApi.json.call_count)
+
+
+class TestGameAchievementPercentages(object):
+    """Class to test GameAchievementPercentages"""
+
+    def setup(self):
+        self.data = {'achievementpercentages': {'achievements': [
+            {'name': 'TF_PLAY_GAME_EVERYCLASS', 'percent': 52.5},
+            {'name': 'TF_GET_HEALPOINTS', 'percent': '20.25'},
+            {'name': 'TF_BURN_PLAYERSINMINIMUMTIME', 'percent': 20.25},
+            {'name': 'TF_KILL_NEMESIS', 'percent': 3.1},
+        ]}}
+
+        def percentages(*args, **kwargs):
+            if kwargs['gameid'] == 10:
+                raise WebApiError('not found')
+            return json.dumps(self.data)
+
+        GameAchievementPercentages._cache.clear()
+        self.patcher = patch.object(WebApi, 'json',
+                                    Mock(side_effect=percentages))
+        self.patcher.start()
+
+    def teardown(self):
+        self.patcher.stop()
+        GameAchievementPercentages._cache.clear()
+
+    def test_cached(self):
+        percentages = GameAchievementPercentages.for_app(440)
+        assert_equal(20.25, percentages['TF_GET_HEALPOINTS'])
+        assert_true(percentages is GameAchievementPercentages.for_app(440))
+        assert_equal(('TF_PLAY_GAME_EVERYCLASS', 52.5),
+                     GameAchievement.global_percentages(440)[0])
+        assert_equal(1, WebApi.json.call_count)
+
+    def test_rank_and_percentile(self):
+        percentages = GameAchievementPercentages.for_app(440)
+        assert_equal(1, percentages.rank('TF_KILL_NEMESIS'))
+        assert_equal(2, percentages.rank('TF_GET_HEALPOINTS'))
+        assert_equal(4, percentages.rank('TF_PLAY_GAME_EVERYCLASS'))
+        assert_equal(75.0, percentages.percentile('TF_GET_HEALPOINTS'))
+        assert_equal(3, percentages.rarer_than(50))
+
+    def test_refresh(self):
+        results = GameAchievementPercentages.refresh([440, 620, 10],
+                                                     threads=2)
+        assert_equal(4, len(results[620]))
+        assert_true(isinstance(results[10], WebApiError))
+        assert_true(results[440] is GameAchievementPercentages.for_app(440))
+
+
+class TestGameStats(object):
+    """Class to test GameStats"""
+
+    XML = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<playerstats>
+  <privacyState>public</privacyState>
+  <visibilityState>3</visibilityState>
+  <game>
+    <gameFriendlyName>TF2</gameFriendlyName>
+    <gameName>Team Fortress 2</gameName>
+    <gameLink>http://steamcommunity.com/app/440</gameLink>
+    <gameIcon>http://example.com/apps/440/e3f595a9.jpg</gameIcon>
+    <gameLogo>http://example.com/apps/440/07385eb5.jpg</gameLogo>
+  </game>
+  <stats>
+    <hoursPlayed>1.5</hoursPlayed>
+  </stats>
+  <achievements>
+    <achievement closed="1">
+      <iconClosed>http://example.com/closed.jpg</iconClosed>
+      <iconOpen>http://example.com/open.jpg</iconOpen>
+      <name>Head of the Class</name>
+      <apiname>tf_play_game_everyclass</apiname>
+      <description>Play a complete round with every class.</description>
+      <unlockTimestamp>1290000000</unlockTimestamp>
+    </achievement>
+    <achievement closed="0">
+      <iconClosed>http://example.com/closed.jpg</iconClosed>
+      <iconOpen>http://example.com/open.jpg</iconOpen>
+      <name>World Traveler</name>
+      <apiname>tf_play_game_everymap</apiname>
+      <description>Play a complete game on every map.</description>
+    </achievement>
+  </achievements>
+</playerstats>
+"""
+
+    def setup(self):
+        self.patcher = patch('urllib2.urlopen')
+        urlopen = self.patcher.start()
+        urlopen.return_value.read.return_value = self.XML
+        self.stats = GameStats(76561197960265728, 'tf2')
+
+    def teardown(self):
+        self.patcher.stop()
+
+    def test_single_fetch(self):
+        assert_equal(440, self.stats.game.app_id)
+        assert_equal('tf2', self.stats.game.short_name)
+        assert_equal('1.5', self.stats.hours_played)
+        assert_equal(2, len(self.stats.achievements))
+        assert_equal(1, self.stats.achievements_done)
+        assert_equal(0.5, self.stats.achievements_percentage)
+        urllib2.urlopen.assert_called_once_with(
+            'http://steamcommunity.com/profiles/76561197960265728/stats/tf2'
+            '?xml=all')
+
+    def test_achievements(self):
+        achievement = self.stats.achievements[0]
+        assert_equal('tf_play_game_everyclass', achievement.api_name)
+        assert_true(achievement.unlocked)
+        assert_equal(2010, achievement.timestamp.year)
+        assert_equal(None, self.stats.achievements[1].timestamp)
+
+    def test_refresh(self):
+        achievements = self.stats.achievements
+        self.stats.refresh()
+        assert_equal(2, urllib2.urlopen.call_count)
+        assert_false(achievements is self.stats.achievements)
+
+
+class TestAchievementCohort(object):
+    """Class to test AchievementCohort"""
+
+    def setup(self):
+        achievements = {
+            1: [{'apiname': 'A', 'achieved': 1, 'unlocktime': 1000},
+                {'apiname': 'B', 'achieved': 0, 'unlocktime': 0},
+                {'apiname': 'C', 'achieved': 1, 'unlocktime': 3000}],
+            2: [{'apiname': 'A', 'achieved': 1, 'unlocktime': 2000},
+                {'apiname': 'B', 'achieved': 1, 'unlocktime': 2500},
+                {'apiname': 'C', 'achieved': 0, 'unlocktime': 0}],
+        }
+
+        def web_api(interface, method, version, appid, steamid):
+            if steamid == 3:
+                return json.dumps({'playerstats': {
+                    'error': 'Profile is not public', 'success': False}})
+            if method == 'GetUserStatsForGame':
+                return json.dumps({'playerstats': {
+                    'stats': [{'name': 'kills', 'value': steamid * 10}]}})
+            return json.dumps({'playerstats': {
+                'achievements': achievements[steamid], 'success': True}})
+
+        self.patcher = patch.object(WebApi, 'json',
+                                    Mock(side_effect=web_api))
+        self.patcher.start()
+        self.cohort = AchievementCohort()
+        self.loaded = self.cohort.load([(1, 440), (2, 440), (3, 440)],
+                                       threads=2, include_stats=True)
+
+    def teardown(self):
+        self.patcher.stop()
+
+    def test_load(self):
+        assert_equal(2, self.loaded)
+        assert_equal(0b101, self.cohort.unlocked[(1, 440)])
+        assert_equal(0b011, self.cohort.unlocked[(2, 440)])
+        assert_equal({'kills': 20}, self.cohort.stats[(2, 440)])
+        assert_equal([(3, 440)], self.cohort.errors.keys())
+
+    def test_unlock_time(self):
+        assert_equal(3000, self.cohort.unlock_time(1, 440, 'C'))
+        assert_equal(0, self.cohort.unlock_time(1, 440, 'B'))
+
+    def test_completion(self):
+        assert_equal(2 / 3.0, self.cohort.completion(1, 440))
+        assert_equal({'A': 1.0, 'B': 0.5, 'C': 0.5},
+                     self.cohort.completion_rates(440))
+
+
+class TestAppNewsPoller(object):
+    """Class to test AppNewsPoller"""
+
+    def setup(self):
+        self.news = {440: [], 570: []}
+        for app_id in (440, 570):
+            for i in range(5):
+                self.add_news(app_id, '%d-%d' % (app_id, i), 1000 + i * 10)
+
+        def get_news(interface, method, version, appid, count, enddate=None):
+            if appid == 10:
+                return WebApi.get('json', interface, method, version)
+            if appid == 20:
+                return '{"appnews": {}}'
+            items = [item for item in self.news[appid]
+                     if enddate is None or item['date'] < enddate]
+            return json.dumps({'appnews': {'newsitems': items[:count]}})
+
+        self.patcher = patch.object(WebApi, 'json', Mock(side_effect=get_news))
+        self.patcher.start()
+        self.poller = AppNewsPoller(count=2, threads=2)
+        self.poller.add(440)
+        self.poller.add(570)
+
+    def teardown(self):
+        self.patcher.stop()
+
+    def add_news(self, app_id, gid, date):
+        self.news[app_id].insert(0, {
+            'gid': gid, 'title': 'News %s' % gid, 'url': '', 'author': '',
+            'contents': '', 'feedlabel': '', 'feedname': '',
+            'is_external_url': False, 'date': date})
+
+    def test_news_for_app(self):
+        news = AppNews.news_for_app(440, count=3)
+        assert_equal(['440-4', '440-3', '440-2'],
+                     [item.gid for item in news])
+        assert_equal(1040, news[0].timestamp)
+        assert_equal(1970, news[0].date.year)
+
+    def test_poll(self):
+        assert_equal(['440-4', '570-4', '440-3', '570-3'],
+                     [item.gid for item in self.poller.poll()])
+        assert_equal([], self.poller.poll())
+        for i in range(5, 10):
+            self.add_news(440, '440-%d' % i, 1000 + i * 10)
+        self.add_news(570, '440-9', 1090)
+        assert_equal(['440-9', '440-8', '440-7', '440-6', '440-5'],
+                     [item.gid for item in self.poller.poll()])
+        self.add_news(570, '570-b', 1100)
+        self.add_news(570, '570-a', 1100)
+        self.add_news(440, '440-a', 1100)
+        assert_equal(['440-a', '570-a', '570-b'],
+                     [item.gid for item in self.poller.poll()])
+
+    def test_errors(self):
+        self.poller.add(10)
+        self.poller.add(20)
+        with patch('urllib2.urlopen',
+                   Mock(side_effect=urllib2.URLError('timed out'))):
+            news = self.poller.poll()
+        assert_equal(4, len(news))
+        assert_equal([10, 20], sorted(self.poller.errors))
+        for error in self.poller.errors.values():
+            assert_true(isinstance(error, WebApiError))
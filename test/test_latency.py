@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the new BSD License.
+#
+# Copyright (c) 2013 Sebastian Staudt
+
+
+from nose.tools import assert_almost_equal, assert_equal, assert_true
+from steamcondenser.latency import BulkPinger, LatencyHistogram, \
+    LatencyTracker
+from steamcondenser.scanner import INFO, PLAYERS, ServerScanner
+from steamcondenser.testing import FakeGameServer
+
+import socket
+
+
+class TestLatencyHistogram(object):
+    """Class to test LatencyHistogram"""
+
+    def test_percentiles(self):
+        histogram = LatencyHistogram()
+        for millisecond in xrange(1, 101):
+            histogram.record(millisecond / 1000.0)
+        assert_equal(100, histogram.count)
+        assert_almost_equal(0.05, histogram.p50(), delta=0.002)
+        assert_almost_equal(0.095, histogram.p95(), delta=0.003)
+        assert_almost_equal(0.099, histogram.p99(), delta=0.003)
+        assert_almost_equal(0.1, histogram.percentile(100), delta=0.003)
+        assert_equal(0.001, histogram.min)
+        assert_almost_equal(0.0505, histogram.mean)
+
+    def test_empty(self):
+        histogram = LatencyHistogram()
+        assert_equal(None, histogram.p50())
+        assert_equal(None, histogram.mean)
+        assert_equal(None, histogram.loss_rate)
+
+    def test_highest(self):
+        histogram = LatencyHistogram(highest=1.0)
+        histogram.record(30.0)
+        assert_equal(30.0, histogram.max)
+        assert_equal(30.0, histogram.p99())
+
+    def test_jitter_and_losses(self):
+        histogram = LatencyHistogram()
+        histogram.record(0.010)
+        assert_equal(0.0, histogram.jitter)
+        histogram.record(0.026)
+        assert_almost_equal(0.001, histogram.jitter)
+        histogram.record_loss()
+        histogram.record_loss()
+        assert_equal(0.5, histogram.loss_rate)
+
+
+class TestLatencyTracker(object):
+    """Class to test LatencyTracker"""
+
+    def test_rank(self):
+        tracker = LatencyTracker()
+        tracker.record(('127.0.0.1', 1), 0.3)
+        tracker.record(('127.0.0.1', 2), 0.1)
+        tracker.record(('127.0.0.1', 3), 0.2)
+        tracker.record_loss(('127.0.0.1', 4))
+        assert_equal([('127.0.0.1', 2), ('127.0.0.1', 3), ('127.0.0.1', 1)],
+                     tracker.rank())
+        assert_equal([('127.0.0.1', 3), ('127.0.0.1', 1)],
+                     tracker.rank([('127.0.0.1', 1), ('127.0.0.1', 3)]))
+        tracker.remove(('127.0.0.1', 2))
+        assert_equal(3, len(tracker))
+
+
+class TestBulkPinger(object):
+    """Class to test BulkPinger"""
+
+    def setup(self):
+        self.servers = [FakeGameServer(info_challenge=bool(i % 2))
+                        for i in range(5)]
+        for server in self.servers:
+            server.start()
+
+    def teardown(self):
+        for server in self.servers:
+            server.stop()
+
+    def test_ping(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('127.0.0.1', 0))
+        unreachable = sock.getsockname()
+        try:
+            pinger = BulkPinger(count=3, interval=0.01, timeout=0.2)
+            addresses = [server.address for server in self.servers]
+            histograms = pinger.ping(addresses + [unreachable])
+        finally:
+            sock.close()
+        for address in addresses:
+            assert_equal(3, histograms[address].count)
+            assert_equal(0.0, histograms[address].loss_rate)
+            assert_true(histograms[address].p99() < 0.2)
+        for server in self.servers:
+            assert_equal(3, server.requests)
+        lost = histograms[unreachable]
+        assert_equal(0, lost.count)
+        assert_equal(1.0, lost.loss_rate)
+
+    def test_scanner(self):
+        tracker = LatencyTracker()
+        scanner = ServerScanner(timeout=0.5, latencies=tracker)
+        addresses = [server.address for server in self.servers]
+        for result in scanner.scan(addresses, (INFO, PLAYERS)):
+            assert_equal(set([INFO, PLAYERS]), set(result.latencies))
+            assert_true(all(0 <= latency < 0.5
+                            for latency in result.latencies.values()))
+        for address in addresses:
+            assert_equal(2, tracker.histogram(address).count)
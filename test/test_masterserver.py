@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the new BSD License.
+#
+# Copyright (c) 2013 Sebastian Staudt
+
+
+from mock import patch
+from nose.tools import assert_equal, assert_true, raises
+from steamcondenser.errors import SteamCondenserError, TimeoutError
+from steamcondenser.masterserver import MasterServer, \
+    MasterServerHarvester
+from steamcondenser.packets import unpack_server_address
+from steamcondenser.testing import FakeMasterServer
+
+import socket
+
+
+SERVERS = [('10.0.%d.%d' % (i // 256, i % 256), 27015 + i % 3)
+           for i in xrange(1000)]
+
+
+class TestMasterServer(object):
+    """Class to test MasterServer"""
+
+    def test_servers(self):
+        with FakeMasterServer(SERVERS, page_size=100) as fake:
+            master = MasterServer('%s:%d' % fake.address)
+            assert_equal(SERVERS, list(master.servers(
+                MasterServer.REGION_EUROPE, '\\gamedir\\cstrike')))
+            assert_equal(10, fake.requests)
+            assert_equal((0x03, '\\gamedir\\cstrike'), fake.filters[0])
+
+    def test_retry(self):
+        with FakeMasterServer(SERVERS[:10], drop=2) as fake:
+            master = MasterServer('%s:%d' % fake.address, timeout=0.05)
+            assert_equal(SERVERS[:10], list(master.servers()))
+            assert_equal(3, fake.requests)
+
+    def test_rate_limit(self):
+        with FakeMasterServer(SERVERS[:30], page_size=10) as fake:
+            master = MasterServer(fake.address[0], fake.address[1],
+                                  requests_per_second=100)
+            assert_equal(30, len(list(master.servers())))
+
+    @raises(TimeoutError)
+    def test_timeout(self):
+        with FakeMasterServer(SERVERS, drop=10) as fake:
+            master = MasterServer('%s:%d' % fake.address, timeout=0.02,
+                                  retries=2)
+            list(master.servers())
+
+
+class TestMasterServerHarvester(object):
+    """Class to test MasterServerHarvester"""
+
+    def test_harvest(self):
+        regions = {MasterServer.REGION_EUROPE: SERVERS[:600],
+                   MasterServer.REGION_ASIA: SERVERS[400:]}
+        with FakeMasterServer(regions, page_size=100) as fake:
+            harvester = MasterServerHarvester(
+                '%s:%d' % fake.address,
+                regions=(MasterServer.REGION_EUROPE,
+                         MasterServer.REGION_ASIA,
+                         MasterServer.REGION_AFRICA),
+                filters=('\\gamedir\\cstrike', '\\gamedir\\tf'), threads=4)
+            addresses = harvester.harvest('\\dedicated\\1')
+        assert_equal(sorted(SERVERS), sorted(unpack_server_address(address)
+                                             for address in addresses))
+        assert_equal(6, len(harvester.last_stats))
+        assert_equal(1000, sum(stats.new_servers
+                               for stats in harvester.last_stats))
+        counts = dict(((stats.region_code, stats.filter), stats.servers)
+                      for stats in harvester.last_stats)
+        assert_equal(600, counts[(MasterServer.REGION_ASIA,
+                                  '\\dedicated\\1\\gamedir\\tf')])
+        assert_equal(0, counts[(MasterServer.REGION_AFRICA,
+                                '\\dedicated\\1\\gamedir\\cstrike')])
+
+    def test_failed_shard(self):
+        with FakeMasterServer(SERVERS[:10]) as fake:
+            harvester = MasterServerHarvester(
+                fake.address[0], fake.address[1],
+                regions=(MasterServer.REGION_EUROPE,), filters=('', ''),
+                timeout=0.05, retries=0)
+            fake.drop = 1
+            assert_equal(10, len(harvester.harvest()))
+        errors = [stats.error for stats in harvester.last_stats]
+        assert_equal(1, len([e for e in errors
+                             if isinstance(e, TimeoutError)]))
+
+    def test_socket_error(self):
+        harvester = MasterServerHarvester(
+            '127.0.0.1', 27011, regions=(MasterServer.REGION_EUROPE,))
+        error = socket.error(101, 'Network is unreachable')
+        with patch.object(MasterServer, '_request', side_effect=error):
+            assert_equal(set(), harvester.harvest())
+        assert_true(isinstance(harvester.last_stats[0].error,
+                               SteamCondenserError))
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the new BSD License.
+#
+# Copyright (c) 2013 Sebastian Staudt
+
+
+from mock import Mock
+from nose.tools import assert_equal, assert_false, assert_raises
+from steamcondenser.monitor import MAP_CHANGE, PLAYER_JOIN, PLAYER_LEAVE, \
+    SERVER_DOWN, SERVER_UP, ServerMonitor
+from steamcondenser.scanner import ServerScanner
+from steamcondenser.testing import FakeGameServer
+
+import socket
+
+
+class TestServerMonitor(object):
+    """Class to test ServerMonitor"""
+
+    def setup(self):
+        self.server = FakeGameServer(players=[('Foo', 1, 10.0)])
+        self.server.start()
+        self.monitor = ServerMonitor(interval=60, min_interval=10,
+                                     max_interval=600, down_after=2,
+                                     scanner=ServerScanner(timeout=0.05,
+                                                           retries=0))
+        self.monitor.add(self.server.address)
+
+    def teardown(self):
+        self.server.stop()
+
+    def events(self, now):
+        return [(event.type, event.old, event.new)
+                for event in self.monitor.sweep(now)]
+
+    def test_events(self):
+        events = self.monitor.sweep(0)
+        assert_equal([SERVER_UP, PLAYER_JOIN],
+                     [event.type for event in events])
+        assert_equal('Foo', events[1].new)
+        assert_equal(30, self.monitor.interval_of(self.server.address))
+        assert_equal(30, self.monitor.next_sweep())
+        assert_equal([], self.monitor.sweep(29))
+
+        self.server.map_name = 'cs_office'
+        self.server.players = [('Bar', 0, 1.0), ('Bar', 0, 2.0)]
+        assert_equal([(MAP_CHANGE, 'de_dust2', 'cs_office'),
+                      (PLAYER_LEAVE, 'Foo', None),
+                      (PLAYER_JOIN, None, 'Bar'),
+                      (PLAYER_JOIN, None, 'Bar')], self.events(30))
+        assert_equal(15, self.monitor.interval_of(self.server.address))
+
+    def test_adaptive_interval(self):
+        self.server.players = []
+        self.monitor.sweep(0)
+        assert_equal(90, self.monitor.interval_of(self.server.address))
+        assert_equal([], self.events(90))
+        assert_equal(135, self.monitor.interval_of(self.server.address))
+        assert_equal(225, self.monitor.next_sweep())
+
+    def test_down(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('127.0.0.1', 0))
+        try:
+            address = sock.getsockname()
+            self.monitor.remove(self.server.address)
+            self.monitor.add(address)
+            assert_equal([], self.events(0))
+            assert_equal(120, self.monitor.next_sweep())
+            self.monitor._servers[address].up = True
+            assert_equal([(SERVER_DOWN, None, None)], self.events(120))
+            assert_equal(120 + 240, self.monitor.next_sweep())
+        finally:
+            sock.close()
+        assert_false(self.server.address in self.monitor)
+
+    def test_failed_scan(self):
+        scanner = self.monitor.scanner
+        self.monitor.scanner = Mock()
+        self.monitor.scanner.scan.side_effect = socket.error('no sockets')
+        assert_raises(socket.error, self.monitor.sweep, 0)
+        assert_equal(60, self.monitor.next_sweep())
+        self.monitor.scanner = scanner
+        assert_equal([SERVER_UP, PLAYER_JOIN],
+                     [event.type for event in self.monitor.sweep(60)])
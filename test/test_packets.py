@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the new BSD License.
+#
+# Copyright (c) 2013 Sebastian Staudt
+
+
+from mock import patch
+from nose.tools import assert_equal, assert_raises, raises
+from steamcondenser.errors import PacketFormatError
+from steamcondenser.packets import A2MGetServersBatch2Packet, A2SInfoPacket, \
+    A2SPlayerPacket, A2SRulesPacket, A2SServerqueryGetchallengePacket, \
+    M2AServerBatchPacket, PacketBuffer, S2AInfo2Packet, S2APlayerPacket, \
+    S2ARulesPacket, S2CChallengePacket, SplitPacketAssembler, \
+    SteamPacketFactory, decode_server_addresses, format_server_address
+from steamcondenser.testing import FakeGameServer, split_packet
+
+import struct
+import sys
+
+
+class TestRequestPackets(object):
+    """Class to test the encoding of request packets"""
+
+    def test_info(self):
+        assert_equal('\xff\xff\xff\xffTSource Engine Query\0',
+                     str(A2SInfoPacket()))
+
+    def test_challenge(self):
+        assert_equal('\xff\xff\xff\xffU\x78\x56\x34\x12',
+                     str(A2SPlayerPacket(0x12345678)))
+        assert_equal('\xff\xff\xff\xffV\xff\xff\xff\xff',
+                     str(A2SRulesPacket()))
+        assert_equal('\xff\xff\xff\xffW',
+                     str(A2SServerqueryGetchallengePacket()))
+
+    def test_master_server_request(self):
+        packet = A2MGetServersBatch2Packet(0x03, '1.2.3.4:27015',
+                                           '\\gamedir\\cstrike')
+        assert_equal('1\x031.2.3.4:27015\0\\gamedir\\cstrike\0', str(packet))
+
+    def test_pack_into(self):
+        data = bytearray('x' * 30)
+        assert_equal(9, A2SPlayerPacket(1).pack_into(data, 20))
+        assert_equal('\xff\xff\xff\xffU\x01\x00\x00\x00',
+                     str(data[20:29]))
+
+    def test_packet_buffer(self):
+        packet_buffer = PacketBuffer(8)
+        info = packet_buffer.encode(A2SInfoPacket())
+        assert_equal(str(A2SInfoPacket()), str(bytearray(info)))
+        challenge = packet_buffer.encode(A2SServerqueryGetchallengePacket())
+        assert_equal('\xff\xff\xff\xffW', str(bytearray(challenge)))
+
+    def test_packet_buffer_without_memoryview(self):
+        with patch('steamcondenser.packets._memoryview', None):
+            packet_buffer = PacketBuffer(8)
+            assert_equal(str(A2SInfoPacket()),
+                         packet_buffer.encode(A2SInfoPacket()))
+            assert_equal(['1.2.3.4:27015'], M2AServerBatchPacket(
+                '\x0a\x01\x02\x03\x04\x69\x87').servers)
+
+
+class TestM2AServerBatchPacket(object):
+    """Class to test M2AServerBatchPacket"""
+
+    def test_servers(self):
+        packet = M2AServerBatchPacket('\x0a\x01\x02\x03\x04\x69\x87'
+                                      '\x00\x00\x00\x00\x00\x00')
+        assert_equal(['1.2.3.4:27015', '0.0.0.0:0'], packet.servers)
+
+    def test_binary_safe(self):
+        data = bytearray('\x0a\xff\xfe\x00\x80\x00\x50')
+        assert_equal(['255.254.0.128:80'],
+                     M2AServerBatchPacket(data).servers)
+        if sys.version_info >= (2, 7):
+            assert_equal(['255.254.0.128:80'],
+                         M2AServerBatchPacket(memoryview(data)).servers)
+
+    def test_compact_arrays(self):
+        packet = M2AServerBatchPacket('\x0a\x01\x02\x03\x04\x69\x87')
+        assert_equal([0x01020304], list(packet.ips))
+        assert_equal([27015], list(packet.ports))
+        assert_equal('1.2.3.4:27015', packet.address(0))
+
+    def test_decode_server_addresses(self):
+        data = ''.join(struct.pack('!IH', i * 0x01010101, i) for i in
+                       xrange(256))
+        ips, ports = decode_server_addresses(data)
+        assert_equal(256, len(ips))
+        assert_equal(0xFFFFFFFF, ips[255])
+        assert_equal(range(256), list(ports))
+        assert_equal('3.3.3.3:3', format_server_address(ips[3], ports[3]))
+
+    @raises(PacketFormatError)
+    def test_missing_marker(self):
+        M2AServerBatchPacket('\x01\x02\x03\x04\x69\x87')
+
+    @raises(PacketFormatError)
+    def test_truncated(self):
+        M2AServerBatchPacket('\x0a\x01\x02\x03\x04\x69')
+
+
+class TestSteamPacketFactory(object):
+    """Class to test parsing replies of game servers"""
+
+    def setup(self):
+        self.server = FakeGameServer(name='Test', players=[('Foo', 3, 1.5)],
+                                     rules={'sv_cheats': '0'})
+
+    def test_challenge(self):
+        packet = SteamPacketFactory.packet_from_data(
+            self.server._challenge()[4:])
+        assert_equal(S2CChallengePacket, type(packet))
+        assert_equal(0x12345678, packet.challenge_number)
+
+    def test_info(self):
+        packet = SteamPacketFactory.packet_from_data(
+            self.server.info_data()[4:])
+        assert_equal(S2AInfo2Packet, type(packet))
+        assert_equal('Test', packet.info.server_name)
+        assert_equal(240, packet.info.app_id)
+        assert_equal(1, packet.info.number_of_players)
+        assert_equal('1.0.0.70', packet.info.game_version)
+        assert_equal(self.server.address[1], packet.info.server_port)
+        assert_equal(None, packet.info.server_tags)
+
+    def test_info_unsigned_app_id(self):
+        self.server.app_id = 40000
+        packet = SteamPacketFactory.packet_from_data(
+            self.server.info_data()[4:])
+        assert_equal(40000, packet.info.app_id)
+
+    def test_bytearray(self):
+        packet = SteamPacketFactory.packet_from_data(
+            bytearray(self.server.info_data()[4:]))
+        assert_equal('Test', packet.info.server_name)
+        assert_equal(240, packet.info.app_id)
+        packet = SteamPacketFactory.packet_from_data(
+            bytearray(self.server.player_data()[4:]))
+        assert_equal([('Foo', 3, 1.5)], packet.players)
+
+    def test_info_extra_data(self):
+        data = '\x49' + self.server.info_data()[5:-3] + struct.pack(
+            '<BHQH8sx7sxQ', 0xF1, 27015, 90071992547409921, 27020, 'SourceTV',
+            'alltalk', 240)
+        info = SteamPacketFactory.packet_from_data(data).info
+        assert_equal(27015, info.server_port)
+        assert_equal(90071992547409921, info.server_id)
+        assert_equal((27020, 'SourceTV'), (info.tv_port, info.tv_name))
+        assert_equal('alltalk', info.server_tags)
+        assert_equal(240, info.game_id)
+
+    def test_players(self):
+        packet = SteamPacketFactory.packet_from_data(
+            self.server.player_data()[4:])
+        assert_equal(S2APlayerPacket, type(packet))
+        assert_equal([('Foo', 3, 1.5)], packet.players)
+
+    def test_rules(self):
+        packet = SteamPacketFactory.packet_from_data(
+            self.server.rules_data()[4:])
+        assert_equal(S2ARulesPacket, type(packet))
+        assert_equal({'sv_cheats': '0'}, packet.rules)
+
+    @raises(PacketFormatError)
+    def test_truncated(self):
+        SteamPacketFactory.packet_from_data(self.server.info_data()[4:20])
+
+    @raises(PacketFormatError)
+    def test_unknown(self):
+        SteamPacketFactory.packet_from_data('\x00foo')
+
+
+class TestSplitPacketAssembler(object):
+    """Class to test reassembling split replies"""
+
+    def setup(self):
+        self.assembler = SplitPacketAssembler()
+        self.data = '\xff\xff\xff\xffE' + ''.join(
+            '%d\0%d\0' % (i, i) for i in range(500))
+
+    def test_out_of_order(self):
+        fragments = split_packet(self.data, 1, 1248)
+        assert_equal(4, len(fragments))
+        assert_equal(None, self.assembler.add(fragments[3], 'a'))
+        assert_equal(None, self.assembler.add(fragments[2], 'a'))
+        assert_equal(None, self.assembler.add(fragments[0], 'a'))
+        assert_equal(None, self.assembler.add(fragments[0], 'a'))
+        assert_equal(None, self.assembler.add(fragments[1], 'b'))
+        assert_equal(self.data, self.assembler.add(fragments[1], 'a'))
+        assert_equal(1, len(self.assembler))
+
+    def test_compressed(self):
+        fragments = split_packet(self.data * 10, 2, 400, compress=True)
+        for fragment in reversed(fragments[1:]):
+            self.assembler.add(fragment)
+        assert_equal(self.data * 10, self.assembler.add(fragments[0]))
+
+    @raises(PacketFormatError)
+    def test_crc_mismatch(self):
+        fragments = split_packet(self.data, 3, 1248, compress=True)
+        fragments[0] = fragments[0][:16] + '\0\0\0\0' + fragments[0][20:]
+        for fragment in fragments:
+            self.assembler.add(fragment)
+
+    def test_compressed_size_limit(self):
+        data = '\xff\xff\xff\xffE' + '\0' * 200000
+        fragments = split_packet(data, 3, 1248, compress=True)
+        fragments[0] = fragments[0][:12] + struct.pack('<L', 1000) + \
+            fragments[0][16:]
+        assert_raises(PacketFormatError, self.assembler.add, fragments[0])
+        assembler = SplitPacketAssembler(max_bytes=100000)
+        fragments = split_packet(data, 4, 1248, compress=True)
+        assert_raises(PacketFormatError, assembler.add, fragments[0])
+
+    def test_expire(self):
+        fragments = split_packet(self.data, 4, 1248)
+        with patch('time.time', return_value=1000):
+            self.assembler.add(fragments[0])
+        with patch('time.time', return_value=1005):
+            assert_equal(None, self.assembler.add(fragments[1]))
+        assert_equal(1, self.assembler.expired)
+        assert_equal(1, len(self.assembler))
+
+    def test_max_sets(self):
+        assembler = SplitPacketAssembler(max_sets=2)
+        for request_id in range(3):
+            assembler.add(split_packet(self.data, request_id, 1248)[0])
+        assert_equal(2, len(assembler))
+        assert_equal(1, assembler.expired)
+
+    def test_oversized_header(self):
+        fragment = struct.pack('<lLBBH', -2, 5, 255, 0, 65535) + 'x'
+        assert_raises(PacketFormatError, self.assembler.add, fragment)
+        assert_equal(0, len(self.assembler))
+
+    def test_max_bytes(self):
+        assembler = SplitPacketAssembler(max_bytes=3000)
+        for request_id in range(3):
+            assembler.add(split_packet(self.data, request_id, 1248)[0])
+        assert_equal(2, len(assembler))
+        assert_equal(1, assembler.expired)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the new BSD License.
+#
+# Copyright (c) 2013 Sebastian Staudt
+
+
+from nose.tools import assert_equal, assert_false, assert_raises, raises
+from steamcondenser.errors import TimeoutError
+from steamcondenser.packets import A2SInfoPacket, A2SPlayerPacket, \
+    A2SRulesPacket, S2AInfo2Packet
+from steamcondenser.proxy import A2SProxy, A2SProxyClient
+from steamcondenser.testing import FakeGameServer
+
+import os
+import shutil
+import socket
+import tempfile
+import threading
+
+
+class TestA2SProxy(object):
+    """Class to test A2SProxy"""
+
+    def setup(self):
+        rules = dict(('rule%d' % i, 'value%d' % i) for i in range(200))
+        self.server = FakeGameServer(name='Proxied', rules=rules,
+                                     players=[('Foo', 1, 2.0)],
+                                     split_size=600)
+        self.server.start()
+        self.directory = tempfile.mkdtemp()
+        self.proxy = A2SProxy(('127.0.0.1', 0),
+                              os.path.join(self.directory, 'proxy.sock'),
+                              timeout=0.2)
+
+    def teardown(self):
+        self.proxy.close()
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def serve(self):
+        thread = threading.Thread(target=self.proxy.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def test_cache(self):
+        thread = self.serve()
+        client = A2SProxyClient(self.proxy.address)
+        try:
+            for i in range(3):
+                packet = client.query(self.server.address, A2SInfoPacket())
+                assert_equal(S2AInfo2Packet, type(packet))
+                assert_equal('Proxied', packet.info.server_name)
+            assert_equal(200, len(client.query(self.server.address,
+                                               A2SRulesPacket()).rules))
+        finally:
+            client.close()
+            self.proxy.stop()
+            thread.join()
+        assert_equal(3, self.server.requests)
+        counters = self.proxy.counters()
+        assert_equal(4, counters['requests'])
+        assert_equal(0.5, counters['hit_rate'])
+        assert_equal(2, counters['upstream_queries'])
+
+    def test_unix_socket(self):
+        thread = self.serve()
+        client = A2SProxyClient(os.path.join(self.directory, 'proxy.sock'))
+        try:
+            packet = client.query(self.server.address, A2SPlayerPacket())
+            assert_equal([('Foo', 1, 2.0)], packet.players)
+        finally:
+            client.close()
+            self.proxy.stop()
+            thread.join()
+
+    def test_coalescing(self):
+        clients = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                   for i in range(3)]
+        try:
+            for client in clients:
+                client.settimeout(1)
+                client.sendto('%s:%d\0%s' % (self.server.address +
+                                             (A2SInfoPacket(),)),
+                              self.proxy.address)
+            while self.proxy.counters()['upstream_queries'] == 0:
+                self.proxy.serve_once(1)
+            for client in clients:
+                assert_equal(self.server.info_data(), client.recv(65535))
+        finally:
+            for client in clients:
+                client.close()
+        assert_equal(1, self.server.requests)
+        assert_equal(2, self.proxy.coalesced)
+
+    def test_host_names(self):
+        thread = self.serve()
+        client = A2SProxyClient(self.proxy.address, timeout=0.5)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.settimeout(0.3)
+        try:
+            packet = client.query(('localhost', self.server.address[1]),
+                                  A2SInfoPacket())
+            assert_equal('Proxied', packet.info.server_name)
+            sock.sendto('localhost:%d\0%s' % (self.server.address[1],
+                                               A2SInfoPacket()),
+                        self.proxy.address)
+            assert_raises(socket.timeout, sock.recv, 65535)
+        finally:
+            sock.close()
+            client.close()
+            self.proxy.stop()
+            thread.join()
+        assert_equal(1, self.server.requests)
+
+    def test_stop_before_serving(self):
+        self.proxy.stop()
+        thread = self.serve()
+        thread.join(1)
+        assert_false(thread.is_alive())
+
+    @raises(TimeoutError)
+    def test_unreachable(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('127.0.0.1', 0))
+        thread = self.serve()
+        client = A2SProxyClient(self.proxy.address, timeout=0.5)
+        try:
+            client.query(sock.getsockname(), A2SInfoPacket())
+        finally:
+            client.close()
+            self.proxy.stop()
+            thread.join()
+            sock.close()
+            assert_equal(1, self.proxy.upstream_errors)
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the new BSD License.
+#
+# Copyright (c) 2013 Sebastian Staudt
+
+
+from nose.tools import assert_equal, assert_raises, assert_true, raises
+from steamcondenser.errors import CancelledError, RCONAbortedError, \
+    RCONNoAuthError, SteamCondenserError, TimeoutError
+from steamcondenser.rcon import GoldSrcRCON, RCONFleet, \
+    SourceRCONConnection, SourceRCONPool
+from steamcondenser.testing import FakeGoldSrcServer, FakeSourceServer
+
+import socket
+import threading
+import time
+
+
+STATUS = ''.join('#%d "Player %d" %d STEAM_0:1:%d 0 00:%02d 30 0\n' %
+                 (i, i, i, i * 1000, i) for i in xrange(1, 33))
+
+
+class TestGoldSrcRCON(object):
+    """Class to test GoldSrcRCON"""
+
+    def setup(self):
+        self.server = FakeGoldSrcServer('secret', {'status': STATUS,
+                                                   'sv_cheats 0': ''},
+                                        max_reply=500)
+        self.server.start()
+        self.rcon = GoldSrcRCON('%s:%d' % self.server.address,
+                                password='secret', timeout=0.5)
+
+    def teardown(self):
+        self.rcon.close()
+        self.server.stop()
+
+    def test_execute(self):
+        assert_equal(STATUS, self.rcon.execute('status'))
+        assert_equal('1234', self.rcon.challenge)
+        assert_equal('', self.rcon.execute('sv_cheats 0'))
+        assert_equal(5, self.server.requests)
+
+    def test_execute_many(self):
+        assert_equal([STATUS, '', 'Unknown command "foo"\n'],
+                     self.rcon.execute_many(['status', 'sv_cheats 0',
+                                             'foo']))
+        assert_equal(7, self.server.requests)
+
+    def test_rejected_challenge(self):
+        self.rcon.execute('sv_cheats 0')
+        self.server.challenge = 5678
+        assert_equal(['', STATUS],
+                     self.rcon.execute_many(['sv_cheats 0', 'status']))
+        assert_equal('5678', self.rcon.challenge)
+        assert_equal(['sv_cheats 0', 'sv_cheats 0', 'status'],
+                     [command for command in self.server.executed
+                      if not command.startswith('echo')])
+
+    @raises(RCONNoAuthError)
+    def test_bad_password(self):
+        self.rcon.password = 'wrong'
+        self.rcon.execute('status')
+
+    @raises(TimeoutError)
+    def test_timeout(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('127.0.0.1', 0))
+        try:
+            rcon = GoldSrcRCON(*sock.getsockname(), timeout=0.05)
+            rcon.execute('status')
+        finally:
+            sock.close()
+
+
+class TestSourceRCON(object):
+    """Class to test SourceRCONConnection and SourceRCONPool"""
+
+    def setup(self):
+        self.server = FakeSourceServer('secret', {'status': STATUS * 5,
+                                                  'sv_cheats 0': ''},
+                                       max_reply=1000)
+        self.server.start()
+        self.pool = SourceRCONPool(timeout=1.0)
+
+    def teardown(self):
+        self.pool.close()
+        self.server.stop()
+
+    def test_execute(self):
+        connection = SourceRCONConnection(self.server.address, 'secret')
+        try:
+            assert_equal(STATUS * 5, connection.execute('status'))
+            assert_equal('', connection.execute('sv_cheats 0'))
+        finally:
+            connection.close()
+
+    def test_multiplexing(self):
+        connection = self.pool.connection(self.server.address, 'secret')
+        first = connection.submit('status')
+        second = connection.submit('foo')
+        assert_equal('Unknown command "foo"\n', connection.result(second))
+        assert_equal(STATUS * 5, connection.result(first))
+        assert_equal(['', STATUS * 5], connection.execute_many(
+            ['sv_cheats 0', 'status']))
+
+    def test_threads(self):
+        results = []
+
+        def run():
+            for i in range(5):
+                results.append(self.pool.execute(self.server.address,
+                                                 'secret', 'status'))
+
+        threads = [threading.Thread(target=run) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert_equal([STATUS * 5] * 40, results)
+        assert_equal(1, self.server.connections)
+
+    def test_reconnect(self):
+        self.pool.execute(self.server.address, 'secret', 'sv_cheats 0')
+        self.server.disconnect()
+        assert_equal(STATUS * 5, self.pool.execute(self.server.address,
+                                                   'secret', 'status'))
+        assert_equal(2, self.server.connections)
+        self.server.disconnect()
+        connection = self.pool.connection(self.server.address, 'secret')
+        assert_raises(SteamCondenserError, connection.execute, 'status')
+        assert_equal(STATUS * 5, self.pool.execute(self.server.address,
+                                                   'secret', 'status'))
+        assert_equal(3, self.server.connections)
+
+    def test_timeout_aborts_other_commands(self):
+        server = FakeSourceServer('secret', delays={'slow': 1.0})
+        server.start()
+        pool = SourceRCONPool(timeout=0.3)
+        errors = {}
+
+        def run(command):
+            try:
+                pool.execute(server.address, 'secret', command)
+            except SteamCondenserError, e:
+                errors[command] = e
+
+        try:
+            pool.connection(server.address, 'secret')
+            slow = threading.Thread(target=run, args=('slow',))
+            slow.start()
+            time.sleep(0.05)
+            kick = threading.Thread(target=run, args=('kick bob',))
+            kick.start()
+            slow.join()
+            kick.join()
+            time.sleep(1.0)
+            assert_true(isinstance(errors['slow'], TimeoutError))
+            assert_true(isinstance(errors['kick bob'], RCONAbortedError))
+            assert_equal(['slow', 'kick bob'], server.executed)
+        finally:
+            pool.close()
+            server.stop()
+
+    @raises(RCONNoAuthError)
+    def test_bad_password(self):
+        self.pool.connection(self.server.address, 'wrong')
+
+
+class TestRCONFleet(object):
+    """Class to test RCONFleet"""
+
+    def setup(self):
+        self.servers = [FakeSourceServer('secret', {'status': STATUS})
+                        for i in range(5)]
+        for server in self.servers:
+            server.start()
+        self.fleet = RCONFleet(SourceRCONPool(timeout=5), threads=3)
+
+    def teardown(self):
+        self.fleet.pool.close()
+        for server in self.servers:
+            server.stop()
+
+    def test_execute(self):
+        passwords = dict((server.address, 'secret')
+                         for server in self.servers)
+        passwords[self.servers[0].address] = 'wrong'
+        results = list(self.fleet.execute('status', passwords))
+        assert_equal(5, len(results))
+        errors = [result for result in results if result.error is not None]
+        assert_equal([self.servers[0].address],
+                     [result.address for result in errors])
+        assert_true(isinstance(errors[0].error, RCONNoAuthError))
+        for result in results:
+            if result.error is None:
+                assert_equal(STATUS, result.output)
+            assert_true(result.duration >= 0)
+
+    def test_deadline(self):
+        silent = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        silent.bind(('127.0.0.1', 0))
+        silent.listen(1)
+        address = silent.getsockname()
+        try:
+            passwords = {self.servers[0].address: 'secret',
+                         address: 'secret'}
+            started = time.time()
+            results = dict((result.address, result) for result in
+                           self.fleet.execute('status', passwords, 0.3))
+            assert_true(time.time() - started < 2)
+        finally:
+            silent.close()
+        assert_equal(STATUS, results[self.servers[0].address].output)
+        assert_true(isinstance(results[address].error, TimeoutError))
+
+    def test_deadline_cancels_queued_servers(self):
+        silent = []
+        for i in range(3):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.bind(('127.0.0.1', 0))
+            sock.listen(1)
+            silent.append(sock)
+        fleet = RCONFleet(self.fleet.pool, threads=1)
+        passwords = dict((sock.getsockname(), 'secret') for sock in silent)
+        passwords[self.servers[0].address] = 'secret'
+        try:
+            results = list(fleet.execute('status', passwords, 0.3))
+            time.sleep(0.2)
+        finally:
+            for sock in silent:
+                sock.close()
+        assert_equal(4, len(results))
+        timeouts = [result for result in results
+                    if type(result.error) is TimeoutError]
+        cancelled = [result for result in results
+                     if isinstance(result.error, CancelledError)]
+        assert_equal(1, len(timeouts))
+        assert_true(len(cancelled) >= 2)
+        if self.servers[0].address in [result.address
+                                       for result in cancelled]:
+            assert_equal([], self.servers[0].executed)
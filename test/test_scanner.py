@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the new BSD License.
+#
+# Copyright (c) 2013 Sebastian Staudt
+
+
+from nose.tools import assert_equal, assert_true
+from steamcondenser.errors import TimeoutError
+from steamcondenser.scanner import INFO, PLAYERS, RULES, ServerScanner
+from steamcondenser.testing import FakeGameServer
+
+import socket
+
+
+class TestServerScanner(object):
+    """Class to test ServerScanner"""
+
+    def setup(self):
+        self.servers = [
+            FakeGameServer(name='Server %d' % i, map_name='de_dust2',
+                           players=[('Player', i, 60.0)],
+                           rules={'mp_friendlyfire': str(i % 2)},
+                           info_challenge=bool(i % 2))
+            for i in range(10)]
+        for server in self.servers:
+            server.start()
+
+    def teardown(self):
+        for server in self.servers:
+            server.stop()
+
+    def test_scan(self):
+        scanner = ServerScanner(concurrency=4, timeout=0.5, sockets=2)
+        results = list(scanner.scan([server.address for server in
+                                     self.servers],
+                                    (INFO, PLAYERS, RULES)))
+        assert_equal(10, len(results))
+        for result in results:
+            assert_equal(None, result.error)
+            i = int(result.info.server_name.split()[1])
+            assert_equal('de_dust2', result.info.map_name)
+            assert_equal([('Player', i, 60.0)], result.players)
+            assert_equal({'mp_friendlyfire': str(i % 2)}, result.rules)
+
+    def test_overlapping_scans(self):
+        scanner = ServerScanner(timeout=0.5, sockets=2)
+        addresses = [server.address for server in self.servers]
+        first = scanner.scan(addresses[:5] * 2)
+        second = scanner.scan(addresses[5:], (INFO, PLAYERS))
+        results = [next(first), next(second)]
+        results.extend(first)
+        results.extend(second)
+        assert_equal(10, len(results))
+        assert_equal(sorted(addresses),
+                     sorted(result.address for result in results))
+        for result in results:
+            assert_equal(None, result.error)
+            i = int(result.info.server_name.split()[1])
+            assert_equal(i >= 5, result.players is not None)
+
+    def test_retry(self):
+        self.servers[0].drop = 1
+        scanner = ServerScanner(timeout=0.05, retries=1)
+        result = list(scanner.scan([self.servers[0].address]))[0]
+        assert_equal(None, result.error)
+        assert_equal('Server 0', result.info.server_name)
+        assert_equal(2, self.servers[0].requests)
+
+    def test_timeout(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('127.0.0.1', 0))
+        try:
+            scanner = ServerScanner(timeout=0.02, retries=2, backoff=2)
+            result = list(scanner.scan([sock.getsockname()],
+                                       (PLAYERS,)))[0]
+            assert_true(isinstance(result.error, TimeoutError))
+            assert_equal(None, result.players)
+        finally:
+            sock.close()
+
+    def test_challenge_cache(self):
+        scanner = ServerScanner(timeout=0.5)
+        addresses = [server.address for server in self.servers[:2]]
+        list(scanner.scan(addresses, (PLAYERS,)))
+        assert_equal(4, sum(server.requests for server in self.servers))
+        results = list(scanner.scan(addresses, (PLAYERS, RULES)))
+        assert_equal([None, None], [result.error for result in results])
+        assert_equal(8, sum(server.requests for server in self.servers))
+        assert_equal(0.5, scanner.challenges.hit_rate())
+
+    def test_rejected_challenge(self):
+        server = self.servers[0]
+        scanner = ServerScanner(timeout=0.5)
+        list(scanner.scan([server.address], (PLAYERS,)))
+        server.challenge_number = 42
+        result = list(scanner.scan([server.address], (PLAYERS,)))[0]
+        assert_equal(None, result.error)
+        assert_equal([('Player', 0, 60.0)], result.players)
+        assert_equal(4, server.requests)
+        assert_equal(42, scanner.challenges[server.address])
+
+    def test_split_replies(self):
+        rules = dict(('rule%d' % i, 'value%d' % i) for i in range(200))
+        servers = [FakeGameServer(rules=rules, split_size=600),
+                   FakeGameServer(rules=rules, split_size=600, compress=True)]
+        for server in servers:
+            server.start()
+        try:
+            scanner = ServerScanner(timeout=0.5)
+            results = list(scanner.scan([server.address
+                                         for server in servers], (RULES,)))
+        finally:
+            for server in servers:
+                server.stop()
+        assert_equal([None, None], [result.error for result in results])
+        assert_equal([rules, rules], [result.rules for result in results])
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# This code is free software; you can redistribute it and/or modify it under
+# the terms of the new BSD License.
+#
+# Copyright (c) 2013 Sebastian Staudt
+
+
+from nose.tools import assert_almost_equal, assert_equal, assert_raises
+from steamcondenser.errors import PacketFormatError
+from steamcondenser.packets import SteamPlayer
+from steamcondenser.scanner import INFO, PLAYERS, ServerScanner
+from steamcondenser.snapshot import PlayerSnapshot
+from steamcondenser.testing import FakeGameServer
+
+import struct
+from StringIO import StringIO
+
+
+def player_data(players):
+    data = struct.pack('<B', len(players))
+    for i, (name, score, connect_time) in enumerate(players):
+        data += struct.pack('<B', i) + name + '\0' + \
+            struct.pack('<lf', score, connect_time)
+    return data
+
+
+class TestPlayerSnapshot(object):
+    """Class to test PlayerSnapshot"""
+
+    def setup(self):
+        self.snapshot = PlayerSnapshot(timestamp=1234.5)
+        self.snapshot.add_players(('10.0.0.1', 27015),
+                                  [SteamPlayer('Alice', 10, 120.0),
+                                   SteamPlayer('Bob', -2, 30.5)],
+                                  'de_dust2')
+        self.snapshot.add_player_data(('10.0.0.2', 27016),
+                                      player_data([('Carol', 5, 600.25)]),
+                                      0, 'de_dust2')
+        self.snapshot.add_player_data(('10.0.0.3', 27015),
+                                      player_data([('Dave', 0, 1.0)]),
+                                      0, 'cs_office')
+
+    def test_columns(self):
+        assert_equal(4, len(self.snapshot))
+        assert_equal([0, 0, 1, 2], list(self.snapshot.servers))
+        assert_equal([10, -2, 5, 0], list(self.snapshot.scores))
+        assert_equal('f', self.snapshot.durations.typecode)
+        assert_equal(['Alice', 'Bob', 'Carol', 'Dave'],
+                     [self.snapshot.name(i) for i in range(4)])
+        assert_equal(SteamPlayer('Carol', 5, 600.25),
+                     self.snapshot.player(2))
+
+    def test_aggregates(self):
+        assert_equal({'de_dust2': 3, 'cs_office': 1},
+                     self.snapshot.players_per_map())
+        assert_equal(2, self.snapshot.players_per_server()[
+            ('10.0.0.1', 27015)])
+        longest = self.snapshot.longest_connected(2)
+        assert_equal([('10.0.0.2', 27016), ('10.0.0.1', 27015)],
+                     [address for address, player in longest])
+        assert_equal(['Carol', 'Alice'],
+                     [player.name for address, player in longest])
+
+    def test_truncated_data(self):
+        data = player_data([('Eve', 1, 2.0), ('Mallory', 3, 4.0)])[:-3]
+        assert_raises(PacketFormatError, self.snapshot.add_player_data,
+                      ('10.0.0.4', 27015), data)
+        assert_equal(4, len(self.snapshot))
+        assert_equal(len(self.snapshot.servers), len(self.snapshot.names))
+        assert_equal('Dave', self.snapshot.name(3))
+
+    def test_save_and_load(self):
+        output = StringIO()
+        self.snapshot.save(output)
+        snapshot = PlayerSnapshot.load(StringIO(output.getvalue()))
+        assert_equal(1234.5, snapshot.timestamp)
+        assert_equal(self.snapshot.addresses, snapshot.addresses)
+        assert_equal(self.snapshot.players_per_map(),
+                     snapshot.players_per_map())
+        assert_equal([self.snapshot.player(i) for i in range(4)],
+                     [snapshot.player(i) for i in range(4)])
+        snapshot.add_players(('10.0.0.1', 27015), [('Eve', 1, 2.0)],
+                             'de_dust2')
+        assert_equal(4, snapshot.players_per_map()['de_dust2'])
+
+    def test_load_invalid(self):
+        assert_raises(PacketFormatError, PlayerSnapshot.load,
+                      StringIO('garbage'))
+        output = StringIO()
+        self.snapshot.save(output)
+        assert_raises(PacketFormatError, PlayerSnapshot.load,
+                      StringIO(output.getvalue()[:-4]))
+
+
+class TestScannerSnapshot(object):
+    """Class to test collecting players of a scan into a PlayerSnapshot"""
+
+    def setup(self):
+        self.servers = [
+            FakeGameServer(map_name=('de_dust2', 'cs_office')[i % 2],
+                           players=[('Player %d' % j, j, 10.0 * i)
+                                    for j in range(i)],
+                           split_size=(None, 100)[i % 2])
+            for i in range(6)]
+        for server in self.servers:
+            server.start()
+
+    def teardown(self):
+        for server in self.servers:
+            server.stop()
+
+    def test_scan(self):
+        snapshot = PlayerSnapshot()
+        scanner = ServerScanner(timeout=0.5)
+        results = list(scanner.scan([server.address for server in
+                                     self.servers], (INFO, PLAYERS),
+                                    snapshot))
+        for result in results:
+            assert_equal(None, result.error)
+            assert_equal(None, result.players)
+        assert_equal(15, len(snapshot))
+        assert_equal({'de_dust2': 6, 'cs_office': 9},
+                     snapshot.players_per_map())
+        address, player = snapshot.longest_connected(1)[0]
+        assert_equal(self.servers[5].address, address)
+        assert_almost_equal(50.0, player.connect_time)